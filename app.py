@@ -107,11 +107,20 @@ def api_valuation():
             "fitment": data.get('fitment', '简装'),
             "built_time": f"{data.get('year', 2015)}-01-01",
             "green_rate": processed_data.get("enhanced_data", {}).get("property_info", {}).get("green_rate", 0.3),
-            "transaction_type": 1
+            "transaction_type": 1,
+            # 照片特征向量，可比案例在照片特征库中有照片时计入视觉相似度
+            "visual_features": processed_data.get("original_data", {}).get("visual_features", {}).get("visual_features")
         }
         
+        # 精筛可比案例，房型未提供时使用描述中提取的房型
+        house_type = data.get('house_type') or processed_data.get("original_data", {}).get(
+            "structured_info", {}).get("house_type")
+        comparable_cases = valuation_system.find_comparable_cases(data.get('city'), target_property, house_type,
+                                                                  data.get('structure') or "平层",
+                                                                  data.get('address') or "")
+        
         # 估算房产价值
-        estimation_result = valuation_system.estimate_property_value(target_property)
+        estimation_result = valuation_system.estimate_property_value(target_property, comparable_cases)
         
         # 生成报告
         report_path = valuation_system.generate_report(property_data, estimation_result)
@@ -140,38 +149,35 @@ def get_report(filename):
     reports_dir = os.path.join("static", "reports")
     return send_from_directory(reports_dir, filename)
 
+def _list_reports():
+    """按查询参数（limit, cursor, address, date_from, date_to）从报告目录索引取一页报告"""
+    return valuation_system.report_catalog.list(
+        limit=request.args.get('limit', 20, type=int),
+        cursor=request.args.get('cursor') or None,
+        address=request.args.get('address') or None,
+        date_from=request.args.get('date_from') or None,
+        date_to=request.args.get('date_to') or None
+    )
+
 @app.route('/reports')
 def reports():
     """报告列表页面"""
-    reports_dir = os.path.join("static", "reports")
-    os.makedirs(reports_dir, exist_ok=True)
-    
-    reports_list = []
-    for filename in os.listdir(reports_dir):
-        if filename.endswith('.json'):
-            file_path = os.path.join(reports_dir, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    report_data = json.load(f)
-                
-                # 提取报告信息
-                address = report_data.get('property_data', {}).get('address', '未知地址')
-                estimated_price = report_data.get('estimation_result', {}).get('estimated_price', 0)
-                generated_at = report_data.get('generated_at', '')
-                
-                reports_list.append({
-                    'filename': filename,
-                    'address': address,
-                    'estimated_price': estimated_price,
-                    'generated_at': generated_at
-                })
-            except Exception as e:
-                print(f"读取报告失败 {filename}: {str(e)}")
-    
-    # 按生成时间排序
-    reports_list.sort(key=lambda x: x['generated_at'], reverse=True)
+    try:
+        reports_list, next_cursor = _list_reports()
+    except ValueError as e:
+        return render_template('error.html', error=str(e))
     
-    return render_template('reports.html', reports=reports_list)
+    return render_template('reports.html', reports=reports_list, next_cursor=next_cursor,
+                           filters={k: request.args[k] for k in ('address', 'date_from', 'date_to') if request.args.get(k)})
+
+@app.route('/api/reports')
+def list_reports():
+    """报告列表API，按生成时间倒序分页"""
+    try:
+        reports_list, next_cursor = _list_reports()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'reports': reports_list, 'next_cursor': next_cursor})
 
 @app.route('/report/<filename>')
 def view_report(filename):
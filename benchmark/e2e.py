@@ -0,0 +1,243 @@
+"""
+端到端估值基准：外部服务全部替换为本地替身（见 benchmark/fakes.py），在进程内驱动 web.py 与 app.py 的完整流程，
+统计各路由的 p50/p95/p99 延迟与吞吐，并与 e2e_baseline.json 比较
+
+每个虚拟用户依次执行：上传产证和实地照片 -> /upload/ocr -> /save_ocr_data -> /app/get_ocr_result
+-> /app/chat（提取信息、确认、估价、生成报告）-> /get_report -> app.py 的 /api/valuation -> /clean_records
+
+替身按 service_latency.json 中的延迟样本休眠，可用线上日志中的实测值替换（如 OCR_Table.last_stats 的 recognize_ms）。
+运行需要项目的本地依赖（pandas、sklearn、sqlalchemy、reportlab、requests 等）和 config 模块，不需要网络与凭据。
+
+用法:
+    python benchmark/e2e.py                           # 4个用户各5轮，按记录的延迟休眠
+    python benchmark/e2e.py --latency-scale 0         # 去掉外部延迟，只测项目自身开销
+    python benchmark/e2e.py --latency-scale 0 --update-baseline   # 以本次结果重写基线（已提交的基线按此条件测量）
+    python benchmark/e2e.py --llm-standin             # 大模型改为经HTTP调用进程内的 llm/standin_server.py
+    python benchmark/e2e.py --llm-url http://host:8790/v1   # 大模型调用已启动的替身服务
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from harness import summarize, load_baseline, save_baseline, compare_to_baseline, print_summary
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "e2e_baseline.json")
+FAILED_REPLY = "响应错误，请重试"
+
+
+def make_image(seed, size=(1200, 900)):
+    """生成内容互不相同的PNG，避免命中上传去重与OCR缓存"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    small = Image.new("L", (48, 36))
+    small.putdata([rng.randrange(256) for _ in range(48 * 36)])
+    buffer = io.BytesIO()
+    small.resize(size, Image.NEAREST).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Recorder:
+    """线程安全地收集每个路由的延迟样本"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def call(self, name, client, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = client.post(path, **kwargs)
+            payload = response.get_json(silent=True) or {}
+            ok = (response.status_code < 400 and "error" not in payload and payload.get("success") is not False
+                  and payload.get("response") != FAILED_REPLY)
+        except Exception:
+            response, payload, ok = None, {}, False
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples.setdefault(name, [])
+            self.errors.setdefault(name, 0)
+            if ok:
+                self.samples[name].append(elapsed)
+            else:
+                self.errors[name] += 1
+        return payload
+
+
+def run_user(web, valuation_app, recorder, user, iterations):
+    """
+    一个虚拟用户：独立的会话与记录，按顺序走完整个估值流程
+    """
+    from flask import session
+
+    uid = f"bench{user}"
+    web_client = web.app.test_client()
+    app_client = valuation_app.app.test_client()
+    with web_client.session_transaction() as s:
+        s['uid'] = uid
+        s['username'] = uid
+    with web.app.test_request_context():
+        session['uid'] = uid
+        web.get_or_create_user_session()
+
+    house = fakes.TARGET_HOUSE
+    messages = list(fakes.CHAT_MESSAGES)
+    for iteration in range(iterations):
+        seed = user * 100003 + iteration * 2
+        uploads = {}
+        for image_type, offset in (("property_cert", 0), ("property_photo", 1)):
+            payload = recorder.call("/upload", web_client, "/upload", content_type="multipart/form-data", data={
+                "file": (io.BytesIO(make_image(seed + offset)), f"{image_type}.png"),
+                "image_type": image_type
+            })
+            uploads[image_type] = payload.get("filename")
+
+        ocr = recorder.call("/upload/ocr", web_client, "/upload/ocr", json={"ocr_img": uploads["property_cert"]})
+        saved = recorder.call("/save_ocr_data", web_client, "/save_ocr_data", json={"ocr_data": ocr.get("data", {})})
+        recorder.call("/app/get_ocr_result", web_client, "/app/get_ocr_result",
+                      json={"filename": saved.get("file_info", {}).get("name", "")})
+        for message, kind in zip(messages, ("info", "yep", "price", "report")):
+            recorder.call(f"/app/chat[{kind}]", web_client, "/app/chat", json={"message": message})
+        recorder.call("/get_report", web_client, "/get_report")
+
+        upload_folder = web.app.config['UPLOAD_FOLDER']
+        recorder.call("/api/valuation", app_client, "/api/valuation", json={
+            "address": house["house_location"], "city": house["city"], "area": house["house_area"],
+            "floor": house["house_floor"], "fitment": house["house_decorating"], "year": house["house_year"],
+            "house_type": house["house_type"],
+            "cert_image": os.path.join(upload_folder, uploads["property_cert"] or ""),
+            "property_photo": os.path.join(upload_folder, uploads["property_photo"] or ""),
+            "description": messages[0]
+        })
+        recorder.call("/clean_records", web_client, "/clean_records")
+
+
+def run(web, valuation_app, users, iterations):
+    """
+    并发运行多个虚拟用户
+
+    Returns:
+        tuple: (Recorder, 墙钟耗时秒)
+    """
+    recorder = Recorder()
+    threads = [threading.Thread(target=run_user, args=(web, valuation_app, recorder, user, iterations))
+               for user in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - start
+
+
+def start_llm_standin(latency_scale, seed):
+    """
+    在进程内启动大模型替身服务，延迟按 dashscope 的延迟样本拟合对数正态分布
+
+    Returns:
+        str: 服务地址
+    """
+    import statistics
+    from llm.standin_server import serve
+
+    logs = [math.log(sample) for sample in fakes.load_latency_profile()["dashscope"] if sample > 0]
+    server = serve(port=0, latency_ms=math.exp(statistics.median(logs)) * latency_scale,
+                   latency_sigma=statistics.pstdev(logs), seed=seed)
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def prepare(workdir, latency_scale, seed, llm_url=None):
+    """
+    安装替身后导入应用，并把相对路径的数据目录放进临时工作目录
+
+    Args:
+        llm_url: 大模型替身服务的地址，为None时使用进程内的 dashscope 替身
+
+    Returns:
+        tuple: (web 模块, app 模块)
+    """
+    fakes.install(scale=latency_scale, seed=seed)
+    if llm_url:
+        os.environ["SNAPROP_LLM_PROVIDER"] = "local"
+        os.environ["SNAPROP_LLM_BASE_URL"] = llm_url
+    os.chdir(workdir)
+    from config.path_config import UPLOAD_FOLDER, OCR_PATH, REPORT_PATH, MAP_PATH
+    for folder in (UPLOAD_FOLDER, OCR_PATH, REPORT_PATH, MAP_PATH):
+        os.makedirs(folder, exist_ok=True)
+
+    import web
+    import app as valuation_app
+    return web, valuation_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端估值基准（外部服务使用本地替身）")
+    parser.add_argument("--users", type=int, default=4, help="并发虚拟用户数")
+    parser.add_argument("--iterations", type=int, default=5, help="每个用户执行的完整流程次数")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="外部服务延迟缩放倍数，0表示不休眠")
+    parser.add_argument("--seed", type=int, default=0, help="延迟采样的随机种子")
+    parser.add_argument("--no-warmup", action="store_true", help="不做预热（预热会先单用户跑一轮且不计入结果）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果重写基线")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="判定退化的容差倍数")
+    parser.add_argument("--verbose", action="store_true", help="保留应用自身的打印输出")
+    parser.add_argument("--llm-url", help="经HTTP调用该地址的大模型替身服务（OpenAI兼容接口）")
+    parser.add_argument("--llm-standin", action="store_true", help="在进程内启动大模型替身服务并经HTTP调用")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    workdir = tempfile.mkdtemp(prefix="snaprop_e2e_")
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        llm_url = args.llm_url or (start_llm_standin(args.latency_scale, args.seed) if args.llm_standin else None)
+        web, valuation_app = prepare(workdir, args.latency_scale, args.seed, llm_url)
+        if not args.no_warmup:
+            run(web, valuation_app, 1, 1)
+        recorder, elapsed = run(web, valuation_app, args.users, args.iterations)
+
+    results = {name: summarize(recorder.samples[name], elapsed, recorder.errors[name]) for name in recorder.samples}
+    total = sum(len(samples) for samples in recorder.samples.values())
+    print(f"工作目录: {workdir}")
+    print(f"{args.users} 个用户 x {args.iterations} 轮，延迟缩放 {args.latency_scale}，"
+          f"耗时 {elapsed:.1f}s，共 {total} 次成功请求（{total / elapsed:.1f}/s）")
+    print_summary(results)
+
+    meta = {"users": args.users, "iterations": args.iterations, "latency_scale": args.latency_scale}
+    if llm_url:
+        meta["llm"] = "standin"
+    if args.update_baseline:
+        save_baseline(args.baseline, results, meta=meta)
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"没有基线 {args.baseline}，使用 --update-baseline 生成")
+        return 1
+    if baseline.get("_meta") and baseline["_meta"] != meta:
+        print(f"注意：基线的测量条件为 {baseline['_meta']}，与本次不同")
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"退化: {regression}")
+    failed = [name for name, stats in results.items() if stats["errors"]]
+    for name in failed:
+        print(f"失败: {name} 有 {results[name]['errors']} 次请求失败")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+端到端基准使用的外部服务替身：通义千问（dashscope）、百度地图、阿里云表格OCR、MySQL
+
+各替身按 service_latency.json 中记录的延迟样本随机休眠后返回固定格式的数据，
+只替换与外部服务通信的那一层，项目自身的解析、筛选、估价和报告逻辑照常执行。
+"""
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+LATENCY_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_latency.json")
+
+TARGET_HOUSE = {
+    "house_location": "仁恒森兰雅苑",
+    "city": "上海",
+    "house_area": 136.79,
+    "house_type": "2室1厅1厨2卫",
+    "house_year": 2013,
+    "house_structure": "平层",
+    "house_floor": "低楼层",
+    "house_decorating": "精装",
+    "green_rate": 0.35
+}
+
+# 基准对话：用户消息 -> 分类结果（MessageType 的值）
+CHAT_MESSAGES = {
+    "我家在上海仁恒森兰雅苑，2013年建成，136.79平，2室1厅1厨2卫，平层，低楼层，精装，绿化率35%": 1,
+    "信息没问题": 4,
+    "帮我估一下单价": 2,
+    "生成评估报告": 3
+}
+
+CERT_TABLE = [
+    ["权利人", "张三", None],
+    ["坐落", "上海市浦东新区仁恒森兰雅苑", None],
+    ["用途", "住宅", "建筑面积"],
+    ["竣工日期", "2013年", "136.79"],
+    ["房型", "2室1厅1厨2卫", None]
+]
+
+
+class Latency:
+    """按记录的延迟样本随机休眠"""
+
+    def __init__(self, samples_ms, scale=1.0, seed=0):
+        self.samples_ms = samples_ms or [0.0]
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self._rng.choice(self.samples_ms) * self.scale / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeDashscope:
+    """dashscope 替身：按系统提示词判断调用的是哪个功能，返回对应格式的回复"""
+
+    def __init__(self, latency):
+        from llm.prompt import Prompt
+
+        self.latency = latency
+        self._prefixes = [
+            (Prompt.PROMPT_CLASSIFY_MESSAGE, self._classify),
+            (Prompt.PROMPT_RESPOND_INFO.split("{")[0], self._house_info),
+            (Prompt.PROMPT_RESPOND_TABLE.split("{")[0], self._house_info),
+            (Prompt.PROMPT_RESPOND_VALUE.split("{")[0], lambda _: "请问小区的绿化率大概是多少？"),
+            (Prompt.PROMPT_RESPOND_NULL, lambda _: "请告诉我您的目标住宅信息。"),
+            (Prompt.PROMPT_NEAR_LOC, lambda _: "['仁恒森兰雅苑', '森兰名轩', '森兰美庐']"),
+            (Prompt.PROMPT_NEAR_LOC_SHORT.split("{")[0],
+             lambda _: "区域范围内有森兰名轩、森兰美庐等住宅区，各类医院、学校等配套完善。"),
+        ]
+        self.Generation = types.SimpleNamespace(call=self.call)
+
+    def call(self, model=None, api_key=None, messages=None, result_format=None, **kwargs):
+        self.latency.wait()
+        system, user = messages[0]['content'], messages[-1]['content']
+        for prefix, respond in self._prefixes:
+            if system.startswith(prefix):
+                text = respond(user)
+                break
+        else:
+            text = self._enhance(user)
+        return types.SimpleNamespace(status_code=200, output=types.SimpleNamespace(text=text))
+
+    @staticmethod
+    def _classify(message):
+        return str(CHAT_MESSAGES.get(message, 0))
+
+    @staticmethod
+    def _house_info(_):
+        return str([[key, value] for key, value in TARGET_HOUSE.items()])
+
+    @staticmethod
+    def _enhance(_):
+        return json.dumps({
+            "property_info": {"location": TARGET_HOUSE["house_location"], "area": TARGET_HOUSE["house_area"],
+                              "type": TARGET_HOUSE["house_type"], "year": TARGET_HOUSE["house_year"],
+                              "green_rate": TARGET_HOUSE["green_rate"]},
+            "value_factors": [{"factor": "交通", "impact": "地铁站步行可达", "weight": 0.3}],
+            "estimated_price_range": {"low": 60000, "high": 70000, "confidence": 0.8}
+        }, ensure_ascii=False)
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content=b"", status_code=200):
+        self._payload = payload
+        self.content = content
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeBaiduRequests:
+    """百度地图接口替身，按URL路径返回地点检索、地理编码和静态地图"""
+
+    def __init__(self, latency):
+        from PIL import Image
+
+        self.latency = latency
+        buffer = io.BytesIO()
+        Image.new("RGB", (512, 400), (236, 232, 224)).save(buffer, format="PNG")
+        self._map_png = buffer.getvalue()
+
+    def get(self, url, *args, **kwargs):
+        self.latency.wait()
+        location = {"lng": 121.6072, "lat": 31.3421}
+        if "/staticimage/" in url:
+            return FakeResponse(content=self._map_png)
+        if "/reverse_geocoding/" in url:
+            return FakeResponse({"status": 0, "result": {"formatted_address": "上海市浦东新区", "location": location}})
+        if "/geocoding/" in url:
+            return FakeResponse({"status": 0, "result": {"location": location}})
+        if "/place/" in url:
+            query = re.search(r"query=([^&]+)", url)
+            name = query.group(1) if query else "地点"
+            return FakeResponse({"status": 0, "results": [
+                {"name": f"{name}{i}", "address": f"浦东新区测试路{i}号", "location": location,
+                 "detail_info": {"distance": 300 * (i + 1)}}
+                for i in range(10)
+            ]})
+        return FakeResponse({"status": 1, "message": "unknown api"}, status_code=404)
+
+
+def _ocr_response(rows):
+    cells = []
+    for r, row in enumerate(rows):
+        c = 0
+        while c < len(row):
+            end = c
+            # 右侧为空的单元格视为与左侧合并
+            while end + 1 < len(row) and row[end + 1] is None:
+                end += 1
+            cells.append({"CellContent": row[c] or "", "RowStart": r, "RowEnd": r, "ColumnStart": c, "ColumnEnd": end})
+            c = end + 1
+    table = {"RowCount": len(rows), "ColumnCount": max(len(row) for row in rows), "CellDetails": cells}
+    return {"headers": {}, "statusCode": 200,
+            "body": {"Data": {"SubImages": [{"TableInfo": {"TableDetails": [table], "TableExcel": ""}}]}}}
+
+
+def _ocr_sdk_modules(latency):
+    """阿里云OCR SDK 替身模块：请求对象照常构造，识别调用返回固定的产证表格"""
+    response = _ocr_response(CERT_TABLE)
+
+    class Client:
+        def __init__(self, config=None):
+            self.config = config
+
+        def recognize_all_text_with_options(self, request, runtime=None):
+            request.body.read()
+            latency.wait()
+            return response
+
+    class UtilClient:
+        @staticmethod
+        def to_jsonstring(value):
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+        @staticmethod
+        def assert_as_string(value):
+            return value
+
+    def model(**fields):
+        return types.SimpleNamespace(**fields)
+
+    modules = {
+        "alibabacloud_ocr_api20210707": types.ModuleType("alibabacloud_ocr_api20210707"),
+        "alibabacloud_ocr_api20210707.client": types.ModuleType("alibabacloud_ocr_api20210707.client"),
+        "alibabacloud_ocr_api20210707.models": types.ModuleType("alibabacloud_ocr_api20210707.models"),
+        "alibabacloud_tea_openapi": types.ModuleType("alibabacloud_tea_openapi"),
+        "alibabacloud_tea_openapi.models": types.ModuleType("alibabacloud_tea_openapi.models"),
+        "alibabacloud_tea_util": types.ModuleType("alibabacloud_tea_util"),
+        "alibabacloud_tea_util.models": types.ModuleType("alibabacloud_tea_util.models"),
+        "alibabacloud_tea_util.client": types.ModuleType("alibabacloud_tea_util.client"),
+    }
+    modules["alibabacloud_ocr_api20210707.client"].Client = Client
+    modules["alibabacloud_ocr_api20210707.models"].RecognizeAllTextRequest = model
+    modules["alibabacloud_ocr_api20210707.models"].RecognizeAllTextRequestTableConfig = model
+    modules["alibabacloud_ocr_api20210707"].models = modules["alibabacloud_ocr_api20210707.models"]
+    modules["alibabacloud_tea_openapi.models"].Config = model
+    modules["alibabacloud_tea_openapi"].models = modules["alibabacloud_tea_openapi.models"]
+    modules["alibabacloud_tea_util.models"].RuntimeOptions = model
+    modules["alibabacloud_tea_util.client"].Client = UtilClient
+    modules["alibabacloud_tea_util"].models = modules["alibabacloud_tea_util.models"]
+    return modules
+
+
+def comparable_rows(count=200, seed=0):
+    """
+    生成与 shanghai 表结构相同的可比案例，全部满足粗筛条件（同小区、平层、近两年成交）
+    """
+    rng = random.Random(seed)
+    today = datetime.now()
+    rows = []
+    for i in range(count):
+        area = round(rng.uniform(80, 180), 2)
+        u_price = rng.randint(58000, 72000)
+        floor = rng.choice(["低楼层", "中楼层", "高楼层"])
+        rows.append({
+            "id": i + 1,
+            "house_type": f"{rng.randint(1, 4)}室{rng.randint(1, 2)}厅1厨{rng.randint(1, 2)}卫",
+            "house_floor": f"{floor}(共{rng.choice([11, 18, 24])}层)",
+            "house_direction": rng.choice(["南", "南北", "东南"]),
+            "house_area": area,
+            "house_structure": "平层",
+            "transaction_type": "挂牌",
+            "transaction_time": (today - timedelta(days=rng.randint(1, 700))).strftime("%Y-%m-%d"),
+            "house_decoration": rng.choice(["精装", "简装", "毛坯"]),
+            "is_elevator": "有",
+            "house_year": str(rng.randint(2009, 2017)),
+            "green_rate": f"{rng.randint(30, 40)}%",
+            "house_loc": "仁恒森兰雅苑",
+            "house_position": "浦东 森兰",
+            "u_price": u_price,
+            "t_price": round(u_price * area / 10000, 1),
+            "detail_url": f"https://example.com/house/{i + 1}"
+        })
+    return rows
+
+
+class FakeCursor:
+    """DB-API 游标替身，供 pandas.read_sql 与 mysql.connector 使用"""
+
+    def __init__(self, database):
+        self._database = database
+        self.description = None
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self._database.latency.wait()
+        self.description, self._rows = self._database.query(query)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+class FakeMySQL:
+    """MySQL 替身：案例表返回生成的可比案例，city 表返回城市介绍"""
+
+    def __init__(self, latency, rows=None):
+        self.latency = latency
+        self.rows = rows if rows is not None else comparable_rows()
+        self._columns = list(self.rows[0].keys()) if self.rows else []
+
+    def query(self, sql):
+        if re.search(r"\bFROM\s+city\b", sql, re.IGNORECASE):
+            column = re.search(r"SELECT\s+(\w+)", sql, re.IGNORECASE).group(1)
+            return [(column,) + (None,) * 6], [("上海是中国的经济、金融、贸易和航运中心。",)]
+        description = [(name,) + (None,) * 6 for name in self._columns]
+        return description, [tuple(row[name] for name in self._columns) for row in self.rows]
+
+    # DB-API 连接接口
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def load_latency_profile(path=LATENCY_PROFILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def install(scale=1.0, seed=0, profile=None):
+    """
+    用替身替换全部外部服务，需在导入 web / app 之前调用
+
+    Args:
+        scale: 延迟缩放倍数，0表示不休眠，只测项目自身开销
+        seed: 随机种子
+        profile: 各服务的延迟样本，默认读取 service_latency.json
+
+    Returns:
+        dict: 各替身对象
+    """
+    profile = profile or load_latency_profile()
+    latency = {name: Latency(samples, scale, seed + i) for i, (name, samples) in enumerate(sorted(profile.items()))}
+
+    dashscope = types.ModuleType("dashscope")
+    fake_llm = FakeDashscope(latency["dashscope"])
+    dashscope.Generation = fake_llm.Generation
+    sys.modules["dashscope"] = dashscope
+
+    database = FakeMySQL(latency["mysql"])
+    mysql = types.ModuleType("mysql")
+    connector = types.ModuleType("mysql.connector")
+    connector.connect = lambda **kwargs: database
+    connector.Error = Exception
+    mysql.connector = connector
+    sys.modules["mysql"] = mysql
+    sys.modules["mysql.connector"] = connector
+    # careful_selection 通过 sqlalchemy 建立连接后交给 pandas.read_sql，替身连接按 DB-API 方式被读取
+    import sqlalchemy
+    sqlalchemy.create_engine = lambda *args, **kwargs: database
+
+    sys.modules.update(_ocr_sdk_modules(latency["ocr"]))
+
+    baidu = FakeBaiduRequests(latency["baidu"])
+    import record.save_map
+    import llm.multimodal_encoder
+    record.save_map.requests = baidu
+    llm.multimodal_encoder.requests = baidu
+
+    return {"dashscope": fake_llm, "mysql": database, "baidu": baidu, "latency": latency}
@@ -0,0 +1,119 @@
+"""
+基准测试公用工具：分位数统计、基线读写与回归比较
+"""
+import json
+import math
+import os
+
+PEAK_SLACK_MB = 1.0  # 内存峰值的绝对容差，避免小规模用例因几十KB的波动被判为退化
+LATENCY_SLACK_MS = 5.0  # 延迟分位数的绝对容差，避免几毫秒的路由因调度抖动被判为退化
+
+
+def percentile(samples, q):
+    """
+    线性插值分位数
+
+    Args:
+        samples: 样本列表
+        q: 分位（0-100）
+
+    Returns:
+        float: 分位数，无样本时为NaN
+    """
+    if not samples:
+        return math.nan
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(samples_ms, elapsed_s, errors=0):
+    """
+    汇总一组延迟样本
+
+    Args:
+        samples_ms: 成功请求的延迟（毫秒）
+        elapsed_s: 本组请求所在的墙钟时间（秒），用于计算吞吐
+        errors: 失败请求数
+
+    Returns:
+        dict: count, errors, p50, p95, p99, mean（毫秒）, throughput（次/秒）
+    """
+    count = len(samples_ms)
+    return {
+        "count": count,
+        "errors": errors,
+        "p50": percentile(samples_ms, 50),
+        "p95": percentile(samples_ms, 95),
+        "p99": percentile(samples_ms, 99),
+        "mean": sum(samples_ms) / count if count else math.nan,
+        "throughput": count / elapsed_s if elapsed_s > 0 else math.nan
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, keys=("p50", "p95", "p99", "throughput"), meta=None):
+    """
+    以本次结果重写基线，只保留比较用的指标
+
+    Args:
+        path: 基线文件路径
+        results: {名称: summarize 的结果}
+        keys: 保留的指标
+        meta: 测量条件（并发数、延迟缩放等），记录在 "_meta" 下
+    """
+    baseline = load_baseline(path)
+    if meta is not None:
+        baseline["_meta"] = meta
+    for name, stats in results.items():
+        if stats["count"]:
+            baseline[name] = {key: round(stats[key], 3) for key in keys}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+
+
+def compare_to_baseline(results, baseline, tolerance=1.25):
+    """
+    与基线比较，延迟分位数、内存峰值高于基线或吞吐低于基线超过容差即视为退化
+
+    Args:
+        results: {名称: summarize 的结果}
+        baseline: {名称: {指标: 值}}
+        tolerance: 容差倍数
+
+    Returns:
+        list: 退化描述
+    """
+    regressions = []
+    for name, stats in results.items():
+        expected = baseline.get(name)
+        if not expected or not stats["count"]:
+            continue
+        for key in ("p50", "p95", "p99"):
+            if key in expected and stats[key] > max(expected[key] * tolerance, expected[key] + LATENCY_SLACK_MS):
+                regressions.append(f"{name} {key}: {stats[key]:.1f}ms > 基线 {expected[key]:.1f}ms x {tolerance}")
+        if ("peak_mb" in expected and "peak_mb" in stats
+                and stats["peak_mb"] > max(expected["peak_mb"] * tolerance, expected["peak_mb"] + PEAK_SLACK_MB)):
+            regressions.append(f"{name} peak_mb: {stats['peak_mb']:.2f}MB > 基线 "
+                               f"{expected['peak_mb']:.2f}MB x {tolerance}")
+        if "throughput" in expected and stats["throughput"] * tolerance < expected["throughput"]:
+            regressions.append(f"{name} throughput: {stats['throughput']:.2f}/s < 基线 "
+                               f"{expected['throughput']:.2f}/s / {tolerance}")
+    return regressions
+
+
+def print_summary(results, name_width=28):
+    """按固定列宽打印汇总表"""
+    print(f"{'name':<{name_width}} {'count':>7} {'errors':>7} {'p50(ms)':>10} {'p95(ms)':>10} "
+          f"{'p99(ms)':>10} {'ops/s':>9}")
+    for name, stats in results.items():
+        print(f"{name:<{name_width}} {stats['count']:>7} {stats['errors']:>7} {stats['p50']:>10.1f} "
+              f"{stats['p95']:>10.1f} {stats['p99']:>10.1f} {stats['throughput']:>9.2f}")
@@ -0,0 +1,257 @@
+"""
+估价数值内核的微基准：在可配置规模（10 到 10^6 条可比案例）的合成数据上测量
+careful_selection.selction 的打分、RealEstateValuation.adjust / evaluate、IMCA.estimate、RuleSet.apply
+与 DifferentiableRuleLearningFramework.train 的每秒调用次数、每秒处理条数和内存峰值（tracemalloc），
+并与 kernels_baseline.json 比较，用于衡量这些内核的每次优化并发现退化
+
+selction 的数据库替换为 benchmark/fakes.py 中的 MySQL 替身（不休眠），计时包含 pandas.read_sql 读取结果集；
+adjust 重复使用已解析的比较房产数组，evaluate 每次重新解析传入的案例；RuleSet.apply 按单条数据调用，一次操作为对全部 n 条数据各调用一次。
+
+用法:
+    python benchmark/kernels.py                              # 默认规模 10、1000、100000
+    python benchmark/kernels.py --sizes 1000000 --kernels adjust imca
+    python benchmark/kernels.py --update-baseline            # 以本次结果重写基线
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from harness import load_baseline, save_baseline, compare_to_baseline
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernels_baseline.json")
+SIZES = [10, 1000, 100000]
+BASELINE_KEYS = ("p50", "throughput", "peak_mb")
+
+
+def valuation_cases(count, seed=0):
+    """
+    生成 RealEstateValuation / IMCA 使用的可比案例与目标房产
+
+    Returns:
+        tuple: (目标房产, 可比案例列表)
+    """
+    rng = random.Random(seed)
+    today = datetime.now()
+    target = {
+        "transaction_type": 1,
+        "transaction_time": today.strftime("%Y-%m-%d"),
+        "green_rate": 0.35,
+        "built_time": "2012-01-01",
+        "floor": 8,
+        "size": 120.0,
+        "fitment": 1
+    }
+    cases = [{
+        "price": rng.randint(58000, 72000),
+        "transaction_type": rng.randint(0, 1),
+        "transaction_time": (today - timedelta(days=rng.randint(1, 1500))).strftime("%Y-%m-%d"),
+        "green_rate": round(rng.uniform(0.2, 0.5), 2),
+        "built_time": f"{rng.randint(2000, 2020)}-01-01",
+        "floor": rng.randint(1, 30),
+        "size": round(rng.uniform(40, 200), 2),
+        "fitment": rng.randint(0, 1)
+    } for _ in range(count)]
+    return target, cases
+
+
+def rule_samples(count, seed=0):
+    """
+    生成示例规则集（create_example_rules）所需特征的样本与标签
+
+    Returns:
+        tuple: (样本列表, 标签列表)
+    """
+    rng = random.Random(seed)
+    samples = [{
+        "house_area": rng.uniform(30, 200),
+        "house_floor": rng.choice(["低楼层", "中楼层", "高楼层"]),
+        "house_decorating": rng.choice(["毛坯", "简装", "精装"]),
+        "house_age": rng.uniform(0, 40),
+        "green_rate": rng.uniform(0.1, 0.5),
+        "transportation_score": rng.random(),
+        "education_score": rng.random()
+    } for _ in range(count)]
+    labels = [rng.random() for _ in range(count)]
+    return samples, labels
+
+
+def setup_selction(count, database):
+    from price.careful_selection import careful_selection
+
+    database.rows = fakes.comparable_rows(count)
+    database._columns = list(database.rows[0].keys())
+    house = fakes.TARGET_HOUSE
+    selection = careful_selection("root", "", "127.0.0.1", "3306", "sitp", "shanghai",
+                                  house["house_floor"], house["house_area"], house["house_type"],
+                                  house["house_decorating"], int(house["house_year"]), house["house_structure"],
+                                  house["house_location"])
+    return selection.selction
+
+
+def setup_adjust(count, database):
+    from price.RealEstateValuation import RealEstateValuation
+
+    target, cases = valuation_cases(count)
+    valuation = RealEstateValuation()
+    valuation.add_target_case(target)
+    for case in cases:
+        valuation.add_comparable_case(case)
+    return valuation.adjust
+
+
+def setup_evaluate(count, database):
+    from price.RealEstateValuation import RealEstateValuation
+
+    target, cases = valuation_cases(count)
+    valuation = RealEstateValuation()
+    return lambda: valuation.evaluate(cases, target)
+
+
+def setup_imca(count, database):
+    from price.imca import IMCA
+
+    target, cases = valuation_cases(count)
+    imca = IMCA()
+    return lambda: imca.estimate(target, cases)
+
+
+def setup_rule_apply(count, database):
+    from rules.differentiable_rule import create_example_rules
+
+    rule_set = create_example_rules()
+    samples, _ = rule_samples(count)
+
+    def apply_all():
+        for sample in samples:
+            rule_set.apply(sample)
+    return apply_all
+
+
+def setup_train(count, database, epochs=1):
+    from rules.differentiable_rule import DifferentiableRuleLearningFramework, create_example_rules
+
+    framework = DifferentiableRuleLearningFramework()
+    framework.add_rule_set(create_example_rules())
+    for sample, label in zip(*rule_samples(count)):
+        framework.add_training_data(sample, label)
+    return lambda: framework.train(epochs=epochs, batch_size=32, seed=0)
+
+
+KERNELS = {
+    "selction": setup_selction,
+    "adjust": setup_adjust,
+    "evaluate": setup_evaluate,
+    "imca": setup_imca,
+    "rule_apply": setup_rule_apply,
+    "train": setup_train,
+}
+
+
+def measure(fn, min_time=0.5, max_repeat=50, min_repeat=5):
+    """
+    预热一次后重复调用，至少 min_repeat 次且累计耗时达到 min_time（单次很慢时也不会只有一个样本），
+    再单独调用一次测量内存峰值
+
+    Returns:
+        tuple: (各次耗时ms列表, 内存峰值MB)
+    """
+    fn()
+    samples = []
+    total = 0.0
+    while len(samples) < min_repeat or (total < min_time and len(samples) < max_repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed * 1000)
+        total += elapsed
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return samples, peak / 1024 / 1024
+
+
+def run_kernel(name, size, database, min_time, epochs):
+    """
+    准备数据后测量一个内核
+
+    Returns:
+        dict: count, p50, mean（毫秒）, throughput（次/秒）, items_per_s, peak_mb
+    """
+    setup = KERNELS[name]
+    fn = setup(size, database, epochs) if name == "train" else setup(size, database)
+    samples, peak_mb = measure(fn, min_time)
+    p50 = statistics.median(samples)
+    return {
+        "count": len(samples),
+        "p50": p50,
+        "mean": statistics.fmean(samples),
+        "throughput": 1000 / p50 if p50 > 0 else float("nan"),
+        "items_per_s": size * 1000 / p50 if p50 > 0 else float("nan"),
+        "peak_mb": peak_mb
+    }
+
+
+def print_results(results, name_width=24):
+    print(f"{'name':<{name_width}} {'runs':>5} {'p50(ms)':>11} {'ops/s':>10} {'items/s':>12} {'peak(MB)':>9}")
+    for name, stats in results.items():
+        print(f"{name:<{name_width}} {stats['count']:>5} {stats['p50']:>11.2f} {stats['throughput']:>10.2f} "
+              f"{stats['items_per_s']:>12.0f} {stats['peak_mb']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="估价数值内核微基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="可比案例/样本条数")
+    parser.add_argument("--kernels", nargs="+", choices=list(KERNELS), default=list(KERNELS), help="要测量的内核")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每项至少累计运行的秒数")
+    parser.add_argument("--epochs", type=int, default=1, help="train 每次调用的训练轮数")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果重写基线")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="判定退化的容差倍数")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    database = fakes.install(scale=0)["mysql"]
+    results = {}
+    for name in args.kernels:
+        for size in args.sizes:
+            # 内核自身的打印（SQL、训练损失等）不计入输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = run_kernel(name, size, database, args.min_time, args.epochs)
+            results[f"{name}[{size}]"] = stats
+            print(f"{name}[{size}]: {stats['p50']:.2f}ms, 峰值 {stats['peak_mb']:.2f}MB", file=sys.stderr)
+    print_results(results)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results, keys=BASELINE_KEYS, meta={"epochs": args.epochs})
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print("没有基线，使用 --update-baseline 生成")
+        return 0
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"退化: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
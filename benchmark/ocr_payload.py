@@ -0,0 +1,91 @@
+"""
+OCR上传体积与识别耗时基准：比较预处理前后的上传字节数，可选地实际调用云端OCR比较识别耗时
+
+用法:
+    python benchmark/ocr_payload.py static/uploads/*.png
+    python benchmark/ocr_payload.py --recognize static/uploads/20250310101243_cropped_image.png
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from report.ocr import OCR_Table, preprocess_image
+
+
+def measure_payload(paths):
+    """
+    统计每张图片预处理前后的体积和预处理耗时
+
+    Args:
+        paths: 图片路径列表
+
+    Returns:
+        list: (路径, 原始字节, 预处理后字节, 预处理耗时ms)
+    """
+    rows = []
+    for path in paths:
+        start = time.perf_counter()
+        processed = preprocess_image(path)
+        elapsed = (time.perf_counter() - start) * 1000
+        rows.append((path, os.path.getsize(path), len(processed), elapsed))
+    return rows
+
+
+def measure_recognition(path, repeat=3):
+    """
+    分别以原图和预处理后的图片调用云端OCR，取识别耗时中位数
+
+    Args:
+        path: 图片路径
+        repeat: 每种方式的调用次数
+
+    Returns:
+        dict: {"raw": ms, "preprocessed": ms}
+    """
+    result = {}
+    for name, preprocess in (("raw", False), ("preprocessed", True)):
+        ocr_table = OCR_Table(preprocess=preprocess)
+        samples = []
+        for _ in range(repeat):
+            ocr_table.trans_to_str(path)
+            samples.append(ocr_table.last_stats["recognize_ms"])
+        result[name] = statistics.median(samples)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR上传预处理基准")
+    parser.add_argument("images", nargs="*", help="图片路径，默认使用 static/uploads 下的全部图片")
+    parser.add_argument("--recognize", action="store_true", help="实际调用云端OCR比较识别耗时（需要有效AK）")
+    parser.add_argument("--repeat", type=int, default=3, help="云端识别的调用次数")
+    args = parser.parse_args()
+
+    paths = args.images or sorted(glob.glob(os.path.join(ROOT, "static", "uploads", "*.png")))
+    if not paths:
+        print("没有可测量的图片")
+        return 1
+
+    rows = measure_payload(paths)
+    print(f"{'image':<48} {'raw(KB)':>10} {'upload(KB)':>11} {'ratio':>7} {'prep(ms)':>9}")
+    for path, raw, processed, elapsed in rows:
+        print(f"{os.path.basename(path)[:48]:<48} {raw / 1024:>10.1f} {processed / 1024:>11.1f} "
+              f"{processed / raw:>7.1%} {elapsed:>9.1f}")
+    total_raw = sum(row[1] for row in rows)
+    total_processed = sum(row[2] for row in rows)
+    print(f"合计: {total_raw / 1024:.1f}KB -> {total_processed / 1024:.1f}KB ({total_processed / total_raw:.1%})")
+
+    if args.recognize:
+        for path in paths:
+            timing = measure_recognition(path, args.repeat)
+            print(f"{os.path.basename(path)}: 原图识别 {timing['raw']:.0f}ms, 预处理后识别 {timing['preprocessed']:.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+OCR表格导出Excel的写入耗时基准：比较原先 pandas + 逐单元格设置样式 的写法与 report.ocr_export.write_table_xlsx
+
+用法:
+    python benchmark/ocr_xlsx.py
+    python benchmark/ocr_xlsx.py --sheets 5 --rows 5000 --cols 30
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from report.ocr_export import write_table_xlsx
+
+SIZES = [(1, 20, 6), (3, 500, 12), (5, 2000, 20)]  # (工作表数, 行数, 列数)
+
+
+def make_table(sheets, rows, cols, seed=0):
+    """
+    构造与OCR识别结果格式相同的表格，约5%的单元格为空、每行一处横向合并
+    """
+    rng = random.Random(seed)
+    table = {}
+    for s in range(sheets):
+        data = [[None if rng.random() < 0.05 else f"第{r}行\n内容{c}" if rng.random() < 0.1 else f"R{r}C{c}"
+                 for c in range(cols)] for r in range(rows)]
+        merges = []
+        for r in range(rows):
+            start = rng.randrange(cols - 1)
+            merges.append({'start_row': r, 'end_row': r, 'start_col': start, 'end_col': start + 1})
+            data[r][start + 1] = None
+        table[f"Sheet{s + 1}"] = {"columns": list(range(cols)), "data": data, "merges": merges}
+    return table
+
+
+def legacy_write(table, file_path):
+    """原 web.save_ocr_data 中的写法"""
+    import pandas as pd
+    from openpyxl.styles import Alignment
+
+    with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+        for sheet_name, sheet_data in table.items():
+            df = pd.DataFrame(sheet_data['data'], columns=sheet_data.get('columns', []))
+            df.to_excel(writer, sheet_name=sheet_name[:31], index=False, header=False)
+            worksheet = writer.sheets[sheet_name[:31]]
+            alignment = Alignment(wrapText=True, horizontal='center', vertical='center')
+            for row in worksheet.iter_rows(min_row=1):
+                for cell in row:
+                    cell.alignment = alignment
+            for merge in sheet_data.get('merges', []):
+                worksheet.merge_cells(start_row=merge['start_row'] + 1, end_row=merge['end_row'] + 1,
+                                      start_column=merge['start_col'] + 1, end_column=merge['end_col'] + 1)
+                worksheet.cell(row=merge['start_row'] + 1, column=merge['start_col'] + 1).alignment = alignment
+            for row in worksheet.iter_rows():
+                max_lines = 1
+                for cell in row:
+                    if cell.value:
+                        max_lines = max(max_lines, str(cell.value).count('\n') + 1)
+                worksheet.row_dimensions[row[0].row].height = 15 * max_lines
+
+
+def measure(write, table, repeat):
+    """
+    多次写入取中位数
+
+    Returns:
+        tuple: (耗时ms, 文件字节数)
+    """
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "ocr_data.xlsx")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            write(table, path)
+            samples.append((time.perf_counter() - start) * 1000)
+        size = os.path.getsize(path)
+    return statistics.median(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR表格导出Excel写入基准")
+    parser.add_argument("--sheets", type=int, help="工作表数，与 --rows --cols 一起指定单个规模")
+    parser.add_argument("--rows", type=int, help="每个工作表的行数")
+    parser.add_argument("--cols", type=int, help="每个工作表的列数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种写法的写入次数")
+    parser.add_argument("--skip-legacy", action="store_true", help="不测量原写法（未安装pandas时使用）")
+    args = parser.parse_args()
+
+    sizes = [(args.sheets, args.rows, args.cols)] if args.sheets and args.rows and args.cols else SIZES
+    print(f"{'sheets x rows x cols':<22} {'legacy(ms)':>11} {'current(ms)':>12} {'speedup':>8} {'size(KB)':>9}")
+    for sheets, rows, cols in sizes:
+        table = make_table(sheets, rows, cols)
+        current, size = measure(write_table_xlsx, table, args.repeat)
+        legacy = None if args.skip_legacy else measure(legacy_write, table, args.repeat)[0]
+        legacy_text = f"{legacy:>11.1f}" if legacy is not None else f"{'-':>11}"
+        speedup = f"{legacy / current:>7.2f}x" if legacy is not None else f"{'-':>8}"
+        print(f"{f'{sheets} x {rows} x {cols}':<22} {legacy_text} {current:>12.1f} {speedup} {size / 1024:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
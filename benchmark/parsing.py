@@ -0,0 +1,100 @@
+"""
+文本字段解析的基准：在合成房源（benchmark/fakes.py 的 comparable_rows）上比较 price.parsing 各解析函数
+有缓存与无缓存（直接调用被缓存的原函数）时解析整列的耗时，以及两种情况下 careful_selection.selction 逐行打分的耗时
+
+用法:
+    python benchmark/parsing.py                   # 默认 1000、100000 条
+    python benchmark/parsing.py --sizes 1000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes
+from kernels import measure, setup_selction
+
+SIZES = [1000, 100000]
+
+# 解析函数 -> 读取的字段
+FIELDS = {
+    "house_type_counts": "house_type",
+    "floor_level": "house_floor",
+    "floor_number": "house_floor",
+    "decoration_level": "house_decoration",
+    "fitment": "house_decoration",
+    "green_rate": "green_rate",
+    "house_year": "house_year",
+    "date_ordinal": "transaction_time",
+}
+
+
+def parse_columns(rows, cached=True):
+    """
+    解析全部字段，cached=False 时绕过缓存
+    """
+    from price import parsing
+
+    for name, field in FIELDS.items():
+        parser = getattr(parsing, name)
+        if not cached:
+            parser = parser.__wrapped__
+        for row in rows:
+            parser(row[field])
+
+
+@contextlib.contextmanager
+def uncached_parsers():
+    """临时把 price.parsing 的解析函数替换为无缓存的原函数"""
+    from price import parsing
+
+    originals = {name: getattr(parsing, name) for name in FIELDS}
+    try:
+        for name, parser in originals.items():
+            setattr(parsing, name, parser.__wrapped__)
+        yield
+    finally:
+        for name, parser in originals.items():
+            setattr(parsing, name, parser)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本字段解析基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="房源条数")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每项至少累计运行的秒数")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    database = fakes.install(scale=0)["mysql"]
+    from price import parsing
+
+    print(f"{'name':<20} {'uncached(ms)':>13} {'cached(ms)':>11} {'speedup':>8}")
+    for size in args.sizes:
+        rows = fakes.comparable_rows(size)
+        uncached, _ = measure(lambda: parse_columns(rows, cached=False), args.min_time)
+        cached, _ = measure(lambda: parse_columns(rows), args.min_time)
+        uncached_ms, cached_ms = min(uncached), min(cached)
+        print(f"{f'parse[{size}]':<20} {uncached_ms:>13.2f} {cached_ms:>11.2f} {uncached_ms / cached_ms:>7.1f}x")
+
+        # selction 逐行调用 careful_selection 的差异函数
+        with contextlib.redirect_stdout(io.StringIO()):
+            selction = setup_selction(size, database)
+            with uncached_parsers():
+                uncached, _ = measure(selction, args.min_time)
+            cached, _ = measure(selction, args.min_time)
+        uncached_ms, cached_ms = min(uncached), min(cached)
+        print(f"{f'selction[{size}]':<20} {uncached_ms:>13.2f} {cached_ms:>11.2f} {uncached_ms / cached_ms:>7.1f}x")
+
+    for name, stats in parsing.cache_info().items():
+        print(f"{name}: 命中 {stats['hits']}，未命中 {stats['misses']}，缓存 {stats['size']} 条")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
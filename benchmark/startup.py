@@ -0,0 +1,135 @@
+"""
+启动耗时基准：在全新子进程中测量各模块的冷导入时间，并按预算检查是否退化
+
+用法:
+    python benchmark/startup.py                  # 测量并与 startup_budget.json 比较，超出预算返回非零
+    python benchmark/startup.py --profile web    # 打印该模块导入链中自身耗时最高的依赖（-X importtime）
+    python benchmark/startup.py --update-budget  # 以本机测量值（留出余量）重写预算
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+
+MODULES = [
+    "report.ocr",
+    "report.report_gen",
+    "price.careful_selection",
+    "estimator",
+    "web",
+    "app",
+]
+
+_TIMER = (
+    "import sys, time; sys.path.insert(0, {root!r}); "
+    "start = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def measure_import(module, repeat=5):
+    """
+    在全新子进程中导入模块，取多次测量的中位数
+
+    Args:
+        module: 模块名
+        repeat: 测量次数
+
+    Returns:
+        float: 冷导入耗时（毫秒）
+    """
+    samples = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", _TIMER.format(root=ROOT, module=module)],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "导入失败")
+        samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def profile_import(module, top=15):
+    """
+    用 -X importtime 分析模块导入链，返回自身耗时最高的依赖
+
+    Args:
+        module: 模块名
+        top: 返回条数
+
+    Returns:
+        list: (自身耗时us, 累计耗时us, 依赖模块名) 列表
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def load_budget():
+    if not os.path.exists(BUDGET_PATH):
+        return {}
+    with open(BUDGET_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模块冷导入耗时基准")
+    parser.add_argument("modules", nargs="*", help="要测量的模块，默认测量全部")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块的测量次数")
+    parser.add_argument("--profile", metavar="MODULE", help="打印模块导入链中最慢的依赖")
+    parser.add_argument("--update-budget", action="store_true", help="用测量值重写预算文件")
+    parser.add_argument("--headroom", type=float, default=1.5, help="重写预算时的余量倍数")
+    args = parser.parse_args()
+
+    if args.profile:
+        print(f"{'self(ms)':>10} {'cumulative(ms)':>15}  module")
+        for self_us, cumulative_us, name in profile_import(args.profile):
+            print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>15.1f}  {name}")
+        return 0
+
+    budget = load_budget()
+    results = {}
+    failed = False
+    print(f"{'module':<28} {'import(ms)':>12} {'budget(ms)':>12}")
+    for module in args.modules or MODULES:
+        try:
+            elapsed = measure_import(module, args.repeat)
+        except RuntimeError as e:
+            print(f"{module:<28} {'ERROR':>12}  {e}")
+            failed = True
+            continue
+        results[module] = elapsed
+        limit = budget.get(module)
+        status = ""
+        if limit is not None and elapsed > limit:
+            status = "  超出预算"
+            failed = True
+        print(f"{module:<28} {elapsed:>12.1f} {limit if limit is not None else '-':>12}{status}")
+
+    if args.update_budget:
+        budget.update({module: round(elapsed * args.headroom) for module, elapsed in results.items()})
+        with open(BUDGET_PATH, 'w', encoding='utf-8') as f:
+            json.dump(budget, f, ensure_ascii=False, indent=2)
+        print(f"预算已更新: {BUDGET_PATH}")
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+本模块包含 小区统计 类
+
+每个小区的挂牌单价中位数与分位数、平均建成年份、绿化率、案例数和更新时间物化在SQLite中，打开时整体载入内存，
+查询为一次字典查找；其他进程（案例入库、本模块的 __main__）提交改动后，下次查询时按 PRAGMA data_version 发现并重新载入。
+案例入库时只重算本次涉及的小区，全量重建见本模块的 __main__。
+"""
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+from price import parsing
+
+STATS_PATH = os.path.join("static", "estate_stats.sqlite3")
+PERCENTILES = (10, 25, 75, 90)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estate_stats (
+    case_table TEXT NOT NULL,
+    house_loc TEXT NOT NULL,
+    listing_count INTEGER NOT NULL DEFAULT 0,
+    median_u_price REAL,
+    p10_u_price REAL,
+    p25_u_price REAL,
+    p75_u_price REAL,
+    p90_u_price REAL,
+    mean_year INTEGER,
+    green_rate REAL,
+    updated_at TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (case_table, house_loc)
+);
+"""
+_COLUMNS = ("listing_count", "median_u_price", "p10_u_price", "p25_u_price", "p75_u_price", "p90_u_price",
+            "mean_year", "green_rate", "updated_at")
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def summarize_estate(rows: list) -> dict:
+    """
+    计算一个小区的统计
+    :param rows: 该小区的案例，每个包含 u_price, house_year, green_rate
+    :return: 与 estate_stats 表的列对应的字典，没有有效值的项为None
+    """
+    prices = np.array([_to_float(row.get('u_price')) for row in rows])
+    prices = prices[~np.isnan(prices)]
+    years = [year for year in (parsing.house_year(str(row.get('house_year'))) for row in rows) if year]
+    green_rates = [rate for rate in (parsing.green_rate(str(row.get('green_rate') or '')) for row in rows) if rate]
+
+    stats = {"listing_count": len(rows)}
+    if len(prices):
+        stats["median_u_price"] = float(np.median(prices))
+        for q, value in zip(PERCENTILES, np.percentile(prices, PERCENTILES)):
+            stats[f"p{q}_u_price"] = float(value)
+    else:
+        stats.update({"median_u_price": None, **{f"p{q}_u_price": None for q in PERCENTILES}})
+    stats["mean_year"] = int(np.mean(years)) if years else None  # 与精筛填补"未知"的取整方式一致
+    stats["green_rate"] = float(np.median(green_rates)) if green_rates else None
+    stats["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return stats
+
+
+class EstateStats:
+    """
+    小区统计 类
+    """
+    def __init__(self, db_path: str = STATS_PATH):
+        """
+        打开统计表并载入内存
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+        self._version = None
+        self._stats = {}
+        self._tables = defaultdict(set)  # 小区名 -> 有该小区案例的表
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """
+        其他连接提交过改动时（data_version 变化）重新载入统计；本连接自己的提交不改变 data_version，由 refresh 同步内存
+        """
+        with self._lock:
+            version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return
+            rows = self._connection.execute("SELECT * FROM estate_stats").fetchall()
+            stats = {(row["case_table"], row["house_loc"]): {column: row[column] for column in _COLUMNS}
+                     for row in rows}
+            tables = defaultdict(set)
+            for table, estate in stats:
+                tables[estate].add(table)
+            self._stats, self._tables, self._version = stats, tables, version
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, table: str, house_loc: str):
+        """
+        查询小区统计
+
+        Args:
+            table: 案例表名（见 MySQLManager.city_tables）
+            house_loc: 小区名
+
+        Returns:
+            dict: 统计，没有该小区时为None
+        """
+        self._reload_if_changed()
+        return self._stats.get((table, house_loc))
+
+    def tables_for(self, house_loc: str) -> set:
+        """
+        有该小区案例的表
+
+        Args:
+            house_loc: 小区名
+
+        Returns:
+            set: 案例表名
+        """
+        self._reload_if_changed()
+        return set(self._tables.get(house_loc, ()))
+
+    def refresh(self, table: str, rows: list, estates=None):
+        """
+        按案例重算小区统计
+
+        Args:
+            table: 案例表名
+            rows: 案例，每个包含 house_loc, u_price, house_year, green_rate
+            estates: 本次重算的小区，默认为 rows 中出现的小区；其中没有案例的小区从统计中删除
+
+        Returns:
+            int: 更新的小区数
+        """
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row['house_loc']].append(row)
+        estates = set(grouped) if estates is None else set(estates)
+        updated = {estate: summarize_estate(grouped[estate]) for estate in estates if grouped.get(estate)}
+        removed = [estate for estate in estates if estate not in updated]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO estate_stats (case_table, house_loc, {', '.join(_COLUMNS)}) "
+                f"VALUES (?, ?, {', '.join('?' for _ in _COLUMNS)})",
+                [(table, estate, *(stats[column] for column in _COLUMNS)) for estate, stats in updated.items()]
+            )
+            self._connection.executemany("DELETE FROM estate_stats WHERE case_table = ? AND house_loc = ?",
+                                         [(table, estate) for estate in removed])
+            for estate, stats in updated.items():
+                self._stats[(table, estate)] = stats
+                self._tables[estate].add(table)
+            for estate in removed:
+                self._stats.pop((table, estate), None)
+                self._tables[estate].discard(table)
+        return len(updated)
+
+    def refresh_from_mysql(self, manager, table: str, estates=None):
+        """
+        从案例表读取指定小区（默认全部）的案例并重算统计
+
+        Args:
+            manager: MySQLManager
+            table: 案例表名
+            estates: 小区名列表
+
+        Returns:
+            int: 更新的小区数
+        """
+        query = f"SELECT house_loc, u_price, house_year, green_rate FROM {table}"
+        params = ()
+        if estates is not None:
+            estates = [estate for estate in estates if estate]
+            if not estates:
+                return 0
+            query += f" WHERE house_loc IN ({', '.join('%s' for _ in estates)})"
+            params = tuple(estates)
+        manager._cursor.execute(query, params)
+        columns = [column[0] for column in manager._cursor.description]
+        rows = [dict(zip(columns, values)) for values in manager._cursor.fetchall()]
+        return self.refresh(table, rows, estates)
+
+
+def get_estate_stats() -> EstateStats:
+    """
+    进程内共用的小区统计，首次调用时打开
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = EstateStats()
+    return _default
+
+
+if __name__ == '__main__':
+    from database.mysql_manager import MySQLManager
+
+    mysql_manager = MySQLManager()
+    for city, case_table in MySQLManager.city_tables.items():
+        print(f"{city}: 已更新 {get_estate_stats().refresh_from_mysql(mysql_manager, case_table)} 个小区")
+    mysql_manager.close()
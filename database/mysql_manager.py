@@ -2,9 +2,13 @@
 本模块包含 MySQL管理 类
 """
 import mysql.connector
-import pandas as pd
 import datetime
 from config.mysql_config import mysql_host, mysql_db, mysql_port, mysql_username, mysql_password
+from price import parsing
+from telemetry.tracing import span, traced
+from telemetry.logs import get_logger
+
+logger = get_logger("database")
 
 
 class MySQLManager():
@@ -21,13 +25,14 @@ class MySQLManager():
         self._username = mysql_username
         self._password = mysql_password
         self._db = mysql_db
-        self._connection = mysql.connector.connect(
-            host=self._host,
-            port=self._port,
-            user=self._username,
-            password=self._password,
-            database=self._db
-        )
+        with span("db.connect", db_system="mysql"):
+            self._connection = mysql.connector.connect(
+                host=self._host,
+                port=self._port,
+                user=self._username,
+                password=self._password,
+                database=self._db
+            )
         self._cursor = self._connection.cursor()
 
     def close(self):
@@ -51,7 +56,10 @@ class MySQLManager():
         table_name = self.city_tables[city]
         return table_name
 
+    @traced("db.insert")
     def insert(self, city, filepath):
+        import pandas as pd
+
         table_name = self.get_table(city)
         df = pd.read_excel(filepath)
         insert_query = f"""
@@ -61,9 +69,10 @@ class MySQLManager():
         df['transaction_time'] = pd.to_datetime(df['transaction_time']).dt.strftime('%Y-%m-%d')
         for _, row in df.iterrows():
             try:
-                house_year = row['house_year']
-                if pd.isna(house_year) or str(house_year).strip() in ['未知', '']:
-                    house_year = None
+                house_year = parsing.house_year(str(row['house_year']))
+                if parsing.house_type_counts(str(row['house_type'])) is None:
+                    logger.warning("房型无法解析", extra={"fields": {"table": table_name,
+                                                                   "house_type": row['house_type']}})
 
                 self._cursor.execute(insert_query, (
                     row['house_type'], row['house_floor'], row['house_direction'], row['house_area'],
@@ -72,10 +81,16 @@ class MySQLManager():
                     row['u_price'], row['t_price'], row['detail_url']))
                 self._connection.commit()  # 提交事务
             except mysql.connector.Error as err:
-                print(f"Error: {err}")
+                logger.error(f"插入失败: {err}", extra={"fields": {"table": table_name}})
                 self._connection.rollback()  # 回滚事务
-        print("数据插入完成！")
+        logger.info("数据插入完成", extra={"fields": {"table": table_name, "rows": len(df)}})
+        # 只重算本次涉及的小区
+        from database.estate_stats import get_estate_stats
+
+        estates = get_estate_stats().refresh_from_mysql(self, table_name, df['house_loc'].dropna().unique().tolist())
+        logger.info("小区统计已更新", extra={"fields": {"table": table_name, "estates": estates}})
 
+    @traced("db.query")
     def get_city_info(self, city):
         try:
             introduction_query="SELECT city_introduction FROM city WHERE city_name=%s"
@@ -86,7 +101,7 @@ class MySQLManager():
             detail = self._cursor.fetchone()
             return introduction[0], detail[0]
         except mysql.connector.Error as err:
-            print(f"Error: {err}")
+            logger.error(f"查询城市信息失败: {err}", extra={"fields": {"city": city}})
 
     @property
     def host(self):
@@ -0,0 +1,340 @@
+"""
+本模块包含 照片特征库 类
+
+挂牌案例照片的特征向量（见 llm/image_features.py）以float16逐行追加在一个二进制文件中，
+查询时通过内存映射只读取用到的行，不把全部向量载入内存；照片的归属（案例表与案例id）、内容哈希与行号，
+以及近似最近邻索引都保存在SQLite中。索引为随机超平面LSH：多张哈希表各取若干位的符号作为桶号，
+查询时取同桶（不足时再取只差一位的桶）的照片，读出其向量按余弦相似度精确排序。
+
+挂牌照片按 static/listing_photos/<案例表>/<案例id>/ 存放，批量导入见本模块的 __main__。
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+STORE_DIR = os.path.join("static", "photo_store")
+LISTING_PHOTO_DIR = os.path.join("static", "listing_photos")
+VECTOR_FILE = "vectors.f16"
+META_FILE = "photos.sqlite3"
+LSH_TABLES = 8
+LSH_BITS = 12
+LSH_SEED = 20240601
+MIN_CANDIDATES = 50  # 同桶的候选少于该数时再取只差一位的桶
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS photos (
+    row_no INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL DEFAULT '',
+    added_at TEXT NOT NULL DEFAULT '',
+    UNIQUE (owner, digest)
+);
+CREATE INDEX IF NOT EXISTS photos_owner ON photos (owner);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    table_no INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    row_no INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lsh_lookup ON lsh_buckets (table_no, bucket);
+"""
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def listing_owner(table: str, case_id) -> str:
+    """挂牌案例照片的归属名"""
+    return f"{table}:{case_id}"
+
+
+def case_owner(case: dict):
+    """
+    可比案例照片的归属名：案例中有 photo_owner 时直接使用，否则由 case_table 与 id（精筛结果的列）组成
+    :return: 归属名，无法确定时为None
+    """
+    if case.get('photo_owner'):
+        return case['photo_owner']
+    if case.get('case_table') and case.get('id') is not None:
+        return listing_owner(case['case_table'], case['id'])
+    return None
+
+
+class PhotoStore:
+    """
+    照片特征库 类
+    """
+    def __init__(self, directory: str = STORE_DIR, dim: int = None, feature_version: int = None):
+        """
+        打开特征库
+
+        Args:
+            directory: 存放向量文件与SQLite的目录
+            dim: 向量维度，默认为 llm.image_features.FEATURE_DIM；与已有库不一致时抛出 ValueError
+            feature_version: 特征算法版本，默认为 llm.image_features.FEATURE_VERSION；与已有库不一致时抛出 ValueError
+        """
+        if dim is None:
+            from llm.image_features import FEATURE_DIM
+            dim = FEATURE_DIM
+        if feature_version is None:
+            from llm.image_features import FEATURE_VERSION
+            feature_version = FEATURE_VERSION
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self._vector_path = os.path.join(directory, VECTOR_FILE)
+        self._lock = threading.Lock()
+        # 事务由 add 显式开始（BEGIN IMMEDIATE），多个进程同时追加时在SQLite的写锁上排队
+        self._connection = sqlite3.connect(os.path.join(directory, META_FILE), timeout=30,
+                                           isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._connection.executescript(_SCHEMA)
+            # 已有的库保留原值；早期的库没有记录特征版本，当时的版本即当前的 FEATURE_VERSION
+            self._connection.executemany("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                                         [("dim", str(dim)), ("lsh_seed", str(LSH_SEED)),
+                                          ("feature_version", str(feature_version))])
+            stored = dict(self._connection.execute("SELECT key, value FROM settings").fetchall())
+        if int(stored["dim"]) != dim:
+            raise ValueError(f"特征库的向量维度为 {stored['dim']}，与当前特征维度 {dim} 不一致，请重建特征库")
+        if int(stored["feature_version"]) != feature_version:
+            raise ValueError(f"特征库的特征版本为 {stored['feature_version']}，与当前特征版本 {feature_version} 不一致，"
+                             f"请重建特征库")
+        # 超平面由种子决定，不需要另存
+        self._planes = np.random.default_rng(int(stored["lsh_seed"])).standard_normal(
+            (LSH_TABLES, LSH_BITS, dim)).astype(np.float32)
+        self._weights = (1 << np.arange(LSH_BITS)).astype(np.int64)
+        self._vectors = None  # 内存映射，行数变化时重新打开
+        self._mapped_rows = 0
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._connection.close()
+
+    def __len__(self):
+        return self._row_count()
+
+    def _row_count(self) -> int:
+        """向量文件中完整写入的行数"""
+        if not os.path.exists(self._vector_path):
+            return 0
+        return os.path.getsize(self._vector_path) // (self.dim * 2)
+
+    def _append_vectors(self, vectors: np.ndarray) -> int:
+        """
+        在向量文件末尾写入向量，调用方须持有SQLite写事务
+        上次写到一半中断时，从下一个整行的位置开始写，已登记的行不受影响
+        :return: 第一行的行号
+        """
+        row_bytes = self.dim * 2
+        size = os.path.getsize(self._vector_path) if os.path.exists(self._vector_path) else 0
+        first_row = -(-size // row_bytes)
+        with open(self._vector_path, 'r+b' if size else 'wb') as f:
+            f.seek(first_row * row_bytes)
+            f.write(vectors.astype(np.float16).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return first_row
+
+    def _mapped(self) -> np.ndarray:
+        rows = self._row_count()
+        if self._vectors is None or self._mapped_rows != rows:
+            self._vectors = np.memmap(self._vector_path, dtype=np.float16, mode='r',
+                                      shape=(rows, self.dim)) if rows else np.empty((0, self.dim), np.float16)
+            self._mapped_rows = rows
+        return self._vectors
+
+    def _buckets(self, vectors: np.ndarray) -> np.ndarray:
+        """(N, dim) -> (N, LSH_TABLES) 的桶号"""
+        bits = np.einsum("tbd,nd->ntb", self._planes, vectors.astype(np.float32)) > 0
+        return bits.astype(np.int64) @ self._weights
+
+    def add(self, kind: str, owner: str, photos: list) -> int:
+        """
+        追加照片特征，同一归属下内容相同的照片只保存一次
+
+        Args:
+            kind: 照片类别，挂牌照片为 listing
+            owner: 归属名（listing_owner）
+            photos: [{"digest", "vector", "path"(可选)}]
+
+        Returns:
+            int: 新增的照片数
+        """
+        photos = [photo for photo in photos if photo]
+        if not photos:
+            return 0
+        vectors = np.stack([np.asarray(photo["vector"], dtype=np.float32) for photo in photos])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度为 {vectors.shape[1]}，特征库为 {self.dim}")
+        added_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            # 查重、分配行号、追加向量与写入元数据在同一个写事务内完成，其他线程与进程（web、批量导入）
+            # 在事务结束前不能追加，不会拿到相同的行号；向量先于元数据落盘，登记的行号总在向量文件范围内
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                existing = {digest for (digest,) in self._connection.execute(
+                    "SELECT digest FROM photos WHERE owner = ?", (owner,))}
+                new = []
+                for index, photo in enumerate(photos):
+                    if photo["digest"] not in existing:
+                        existing.add(photo["digest"])
+                        new.append(index)
+                if not new:
+                    self._connection.execute("ROLLBACK")
+                    return 0
+                first_row = self._append_vectors(vectors[new])
+                rows = range(first_row, first_row + len(new))
+                buckets = self._buckets(vectors[new])
+                self._connection.executemany(
+                    "INSERT INTO photos (row_no, kind, owner, digest, path, added_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(row, kind, owner, photos[index]["digest"], photos[index].get("path", ""), added_at)
+                     for row, index in zip(rows, new)])
+                self._connection.executemany(
+                    "INSERT INTO lsh_buckets (table_no, bucket, row_no) VALUES (?, ?, ?)",
+                    [(table_no, int(bucket), row) for row, row_buckets in zip(rows, buckets)
+                     for table_no, bucket in enumerate(row_buckets)])
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return len(new)
+
+    def vectors_for(self, owner: str) -> np.ndarray:
+        """
+        某归属的全部照片向量（只读取这些行）
+        :return: (k, dim) float32，没有照片时 k 为0
+        """
+        with self._lock:
+            rows = [row for (row,) in self._connection.execute(
+                "SELECT row_no FROM photos WHERE owner = ? ORDER BY row_no", (owner,))]
+            if not rows:
+                return np.empty((0, self.dim), np.float32)
+            return np.asarray(self._mapped()[rows], dtype=np.float32)
+
+    def best_similarity(self, owner: str, vector) -> float | None:
+        """
+        向量与某归属各照片余弦相似度的最大值
+        :return: 相似度，该归属没有照片时为None
+        """
+        vectors = self.vectors_for(owner)
+        if not len(vectors):
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1)
+        return float(np.max(vectors @ query / np.where(norms > 0, norms, 1)))
+
+    def search(self, vector, k: int = 10, kind: str = None) -> list:
+        """
+        近似最近邻查询
+
+        Args:
+            vector: 查询向量
+            k: 返回的照片数
+            kind: 只查该类别的照片，默认不限
+
+        Returns:
+            list: [{"owner", "digest", "path", "kind", "similarity"}]，按相似度从高到低
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        buckets = self._buckets(query[None])[0]
+        with self._lock:
+            candidates = self._candidates([[int(bucket)] for bucket in buckets])
+            if len(candidates) < MIN_CANDIDATES:
+                # 只差一位的桶，与同桶一起一次查询
+                candidates = self._candidates([[int(bucket)] + [int(bucket) ^ (1 << bit) for bit in range(LSH_BITS)]
+                                               for bucket in buckets])
+            if kind is not None and candidates:
+                candidates = self._filter_kind(candidates, kind)
+            if not candidates:
+                return []
+            rows = sorted(candidates)
+            vectors = np.asarray(self._mapped()[rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1)
+        similarities = vectors @ query / np.where(norms > 0, norms, 1)
+        order = np.argsort(-similarities)[:k]
+        top = {rows[i]: float(similarities[i]) for i in order}
+        with self._lock:
+            placeholders = ", ".join("?" for _ in top)
+            meta = {row: (photo_kind, owner, digest, path) for row, photo_kind, owner, digest, path in self._connection.execute(
+                f"SELECT row_no, kind, owner, digest, path FROM photos WHERE row_no IN ({placeholders})", list(top))}
+        return [{"owner": meta[row][1], "digest": meta[row][2], "path": meta[row][3], "kind": meta[row][0],
+                 "similarity": similarity} for row, similarity in top.items() if row in meta]
+
+    def _candidates(self, probes: list) -> set:
+        """
+        各哈希表中指定桶内的照片行号，所有桶合为一次查询（各表的条件分别走 lsh_lookup 索引）
+        :param probes: 第 i 项为第 i 张哈希表要查的桶号列表
+        """
+        conditions, params = [], []
+        for table_no, table_buckets in enumerate(probes):
+            conditions.append(f"(table_no = ? AND bucket IN ({', '.join('?' for _ in table_buckets)}))")
+            params += [table_no] + table_buckets
+        return {row for (row,) in self._connection.execute(
+            f"SELECT DISTINCT row_no FROM lsh_buckets WHERE {' OR '.join(conditions)}", params)}
+
+    def _filter_kind(self, rows: set, kind: str) -> set:
+        rows = list(rows)
+        placeholders = ", ".join("?" for _ in rows)
+        return {row for (row,) in self._connection.execute(
+            f"SELECT row_no FROM photos WHERE kind = ? AND row_no IN ({placeholders})", [kind] + rows)}
+
+
+def add_photos(store: PhotoStore, encoder, kind: str, owner: str, image_paths: list) -> int:
+    """
+    提取照片特征并加入特征库
+
+    Args:
+        store: PhotoStore
+        encoder: VisualEncoder
+        kind: 照片类别，挂牌照片为 listing
+        owner: 归属名
+        image_paths: 照片路径
+
+    Returns:
+        int: 新增的照片数
+    """
+    photos = []
+    for path, photo in zip(image_paths, encoder.extract_batch_features(image_paths)):
+        if photo:
+            photos.append({"digest": photo["digest"], "vector": photo["visual_features"], "path": path})
+    return store.add(kind, owner, photos)
+
+
+def get_photo_store() -> PhotoStore:
+    """
+    进程内共用的照片特征库，首次调用时打开
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = PhotoStore()
+    return _default
+
+
+if __name__ == '__main__':
+    from llm.multimodal_encoder import VisualEncoder
+
+    # static/listing_photos/<案例表>/<案例id>/*.jpg
+    visual_encoder = VisualEncoder()
+    total = 0
+    if os.path.isdir(LISTING_PHOTO_DIR):
+        for case_table in sorted(os.listdir(LISTING_PHOTO_DIR)):
+            table_dir = os.path.join(LISTING_PHOTO_DIR, case_table)
+            if not os.path.isdir(table_dir):
+                continue
+            for case_id in sorted(os.listdir(table_dir)):
+                case_dir = os.path.join(table_dir, case_id)
+                if os.path.isdir(case_dir):
+                    paths = [os.path.join(case_dir, name) for name in sorted(os.listdir(case_dir))]
+                    total += add_photos(get_photo_store(), visual_encoder, "listing",
+                                        listing_owner(case_table, case_id), paths)
+    print(f"新增 {total} 张照片，特征库共 {len(get_photo_store())} 张")
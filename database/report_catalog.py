@@ -0,0 +1,190 @@
+"""
+本模块包含 报告目录 类
+
+估值报告以JSON文件保存在报告目录下，列表页需要的摘要（地址、城市、估值、生成时间）另存在SQLite索引中，
+列表按 (生成时间, id) 键集分页，每页的查询代价与报告总数无关。
+索引不放在报告目录（static 下可直接下载）中，默认保存在 instance 目录。
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+REPORTS_DIR = os.path.join("static", "reports")
+CATALOG_PATH = os.path.join("instance", "report_catalog.sqlite3")
+LEGACY_CATALOG_FILE = "catalog.sqlite3"  # 早期放在报告目录中的索引文件
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    address TEXT NOT NULL DEFAULT '',
+    city TEXT NOT NULL DEFAULT '',
+    estimated_price REAL NOT NULL DEFAULT 0,
+    generated_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_reports_generated ON reports (generated_at, id);
+CREATE INDEX IF NOT EXISTS idx_reports_address ON reports (address, generated_at, id);
+"""
+
+
+class ReportCatalog:
+    """
+    报告目录 类
+    """
+    def __init__(self, reports_dir: str = REPORTS_DIR, db_path: str = None):
+        """
+        打开报告目录索引；索引文件不存在时扫描报告目录建立索引（仅一次）
+
+        Args:
+            reports_dir: 报告目录
+            db_path: 索引文件路径，默认为 CATALOG_PATH
+        """
+        self.reports_dir = reports_dir
+        os.makedirs(reports_dir, exist_ok=True)
+        db_path = db_path or CATALOG_PATH
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        legacy_path = os.path.join(reports_dir, LEGACY_CATALOG_FILE)
+        if os.path.abspath(legacy_path) != os.path.abspath(db_path) and os.path.exists(legacy_path):
+            # 报告目录中的旧索引可以通过报告下载接口取得，删除后由新索引重新扫描建立
+            os.remove(legacy_path)
+        is_new = not os.path.exists(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+        if is_new:
+            self.rebuild()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def add(self, filename: str, report_data: dict):
+        """
+        登记（或更新）一份报告
+
+        Args:
+            filename: 报告文件名
+            report_data: 报告内容，包含 property_data, estimation_result, generated_at
+        """
+        self._add_many([(filename, report_data)])
+
+    def rebuild(self):
+        """
+        扫描报告目录，把已有的报告全部登记到索引
+
+        Returns:
+            int: 登记的报告数
+        """
+        entries = []
+        for filename in os.listdir(self.reports_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.reports_dir, filename), 'r', encoding='utf-8') as f:
+                    entries.append((filename, json.load(f)))
+            except Exception as e:
+                print(f"读取报告失败 {filename}: {str(e)}")
+        self._add_many(entries)
+        print(f"报告目录索引已建立: {len(entries)} 份报告")
+        return len(entries)
+
+    def list(self, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, address: str = None,
+             date_from: str = None, date_to: str = None):
+        """
+        按生成时间倒序列出报告
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标，为None时从最新的报告开始
+            address: 地址前缀
+            date_from: 起始日期（含），格式 YYYY-MM-DD
+            date_to: 截止日期（含），格式 YYYY-MM-DD
+
+        Returns:
+            tuple: (报告摘要列表, 下一页游标)，没有下一页时游标为None
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if address:
+            # 前缀匹配改写为范围查询，可以使用地址索引
+            conditions.append("address >= ? AND address < ?")
+            params += [address, address + "\U0010ffff"]
+        if date_from:
+            conditions.append("generated_at >= ?")
+            params.append(self._parse_date(date_from).strftime("%Y%m%d") + "000000")
+        if date_to:
+            conditions.append("generated_at <= ?")
+            params.append(self._parse_date(date_to).strftime("%Y%m%d") + "235959")
+        if cursor:
+            generated_at, report_id = self._decode_cursor(cursor)
+            conditions.append("(generated_at, id) < (?, ?)")
+            params += [generated_at, report_id]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = (f"SELECT id, filename, address, city, estimated_price, generated_at FROM reports {where} "
+                 f"ORDER BY generated_at DESC, id DESC LIMIT ?")
+        with self._lock:
+            rows = self._connection.execute(query, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1]["generated_at"], rows[-1]["id"])
+        reports = [{
+            'filename': row["filename"],
+            'address': row["address"],
+            'city': row["city"],
+            'estimated_price': row["estimated_price"],
+            'generated_at': row["generated_at"]
+        } for row in rows]
+        return reports, next_cursor
+
+    def _add_many(self, entries):
+        rows = []
+        for filename, report_data in entries:
+            property_data = report_data.get('property_data') or {}
+            estimation_result = report_data.get('estimation_result') or {}
+            rows.append((
+                filename,
+                property_data.get('address') or '未知地址',
+                property_data.get('city') or '',
+                float(estimation_result.get('estimated_price') or 0),
+                str(report_data.get('generated_at') or '')
+            ))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO reports (filename, address, city, estimated_price, generated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET address = excluded.address, city = excluded.city, "
+                "estimated_price = excluded.estimated_price, generated_at = excluded.generated_at",
+                rows
+            )
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime:
+        try:
+            return datetime.strptime(value, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的日期: {value}，格式应为 YYYY-MM-DD")
+
+    @staticmethod
+    def _encode_cursor(generated_at, report_id) -> str:
+        raw = json.dumps([generated_at, report_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            generated_at, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return str(generated_at), int(report_id)
+        except Exception:
+            raise ValueError(f"无效的分页游标: {cursor}")
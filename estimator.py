@@ -1,16 +1,17 @@
 """
 本模块包含 房产估价 类
 """
-import json
-import pandas as pd
 from record.record import Record
 from llm.llm_manager import QianwenManager
+from llm.output_parser import parse_pairs, OutputParseError
 from llm.message import MessageType
 # from report.report_trans import PDFReport
-from report.report_gen import property_report
 from datetime import datetime
 from config.path_config import REPORT_PATH
-from price.back_main import back_main
+from telemetry.tracing import traced, set_attribute
+from telemetry.logs import get_logger
+
+logger = get_logger("estimator")
 
 
 class Estimator:
@@ -93,6 +94,7 @@ class Estimator:
 
         self._result.append("已清理先前的房屋信息记录")
 
+    @traced("estimator.interact")
     def interact_estimator(self):
         """
         一次交互
@@ -104,26 +106,19 @@ class Estimator:
         if st is False:
             self._result.append("响应错误，请重试")
 
-    def interact_table(self, table_path):
+    @traced("estimator.interact_table")
+    def interact_table(self):
         """
-        表格一次交互
+        表格一次交互，直接使用记录中用户确认后的OCR表格
         :return: 返回状态
         """
         self._result.clear()
-        # 读取所有工作表
-        sheets = pd.read_excel(table_path, sheet_name=None)
-        user_input = ""
-        # 显示每个工作表的数据
-        for sheet_name, df in sheets.items():
-            # print(f'Sheet: {sheet_name}')
-            info = df.to_csv()
-            # print(info)
-            user_input += info
-            # print(df.head())
+        user_input = self._record.get_ocr_text()
         st = self.handel_table(user_input)
         if st is False:
             self._result.append("响应错误，请重试")
 
+    @traced("estimator.handel_table")
     def handel_table(self, user_input):
         """
         处理表格
@@ -131,15 +126,16 @@ class Estimator:
         """
         llm_result = self._lm.respond_table(user_input, self._record.expected_keys)
         try:
-            val_list = json.loads(json.dumps(eval(llm_result)))
-        except:
-            print(f"预期为二维列表，实际为{llm_result}")
+            val_list = parse_pairs(llm_result, self._record.expected_keys)
+        except OutputParseError:
+            logger.warning("大模型输出无法解析为二维列表", extra={"fields": {"llm_result": llm_result}})
             return False
 
         error, inputs = self._record.add_data(val_list)
         if not inputs:
             self._result.append("噢哦，提取不到信息~")
             return True
+        inputs += self._autofill()
         self._missing = self._record.get_null()
         if not self._missing:
             self._result.append(
@@ -156,6 +152,19 @@ class Estimator:
                                                                                                      null=missing_response))
         return True
 
+    def _autofill(self) -> str:
+        """（类内调用）
+        用本地数据补充缺失字段，减少追问用户的轮次
+        :return: 补充的信息，没有补充时为空
+        """
+        filled = self._record.autofill()
+        if not filled:
+            return ""
+        logger.info("已用本地数据补充信息", extra={"fields": {"filled": filled}})
+        set_attribute("autofilled", ",".join(filled))
+        return f"（以下信息根据本地数据补充，如有出入请告诉我）\n{self._record.get_record(filled)}"
+
+    @traced("estimator.handel_message")
     def _handel_message(self):
         """（类内调用）
         处理 用户消息
@@ -165,8 +174,10 @@ class Estimator:
         try:
             message_type = MessageType(int(llm_class_result))
         except ValueError:
-            print(f"预期为数字，实际为{llm_class_result}")
+            set_attribute("message_type", "invalid")
+            logger.warning("大模型分类结果不是数字", extra={"fields": {"llm_result": llm_class_result}})
             return False
+        set_attribute("message_type", message_type.name)
 
         match message_type:
             case MessageType.null:
@@ -188,9 +199,10 @@ class Estimator:
                 return self._handel_ask_info()
 
             case _:
-                print(f"意外的消息类型{message_type}")
+                logger.warning("意外的消息类型", extra={"fields": {"message_type": str(message_type)}})
                 return False
 
+    @traced("estimator.handel_null")
     def _handel_null(self):
         """（类内调用）
         处理 无效信息
@@ -201,6 +213,7 @@ class Estimator:
         self._result.append(llm_result)
         return True
 
+    @traced("estimator.handel_info")
     def _handel_info(self):
         """（类内调用）
         处理 提取信息
@@ -208,15 +221,16 @@ class Estimator:
         """
         llm_result = self._lm.respond_info(self._message, self._record.expected_keys)
         try:
-            val_list = json.loads(json.dumps(eval(llm_result)))
-        except:
-            print(f"预期为二维列表，实际为{llm_result}")
+            val_list = parse_pairs(llm_result, self._record.expected_keys)
+        except OutputParseError:
+            logger.warning("大模型输出无法解析为二维列表", extra={"fields": {"llm_result": llm_result}})
             return False
 
         error, inputs = self._record.add_data(val_list)
         if not inputs:
             self._result.append("噢哦，提取不到信息~")
             return True
+        inputs += self._autofill()
         self._missing = self._record.get_null()
         if not self._missing:
             self._result.append(
@@ -233,18 +247,20 @@ class Estimator:
                                                                                                  null=missing_response))
         return True
 
+    @traced("estimator.handel_price")
     def _handel_price(self):
         """（类内调用）
         处理 房屋估价
         :return: 返回状态
         """
         if (not self._missing) & self._isYep is True:
+            from price.back_main import back_main
+
             df, price = back_main(self._record.city, self._record.house_floor, self._record.house_area,
                                   self._record.house_type,
                                   self._record.house_decorating, self._record.house_year, self._record.house_structure,
                                   self._record.house_location)
-            print(df)
-            print(price)
+            logger.info("估价完成", extra={"fields": {"cases": len(df), "price": price}})
             self._record.add_price(price)
             select_result = ""
             index = 0
@@ -266,6 +282,7 @@ class Estimator:
             return True
         return False
 
+    @traced("estimator.handel_report")
     def _handel_report(self):
         """（类内调用）
         处理 评估报告
@@ -284,13 +301,16 @@ class Estimator:
             return True
 
         if (not self._missing) & self._isYep is True:
+            from price.back_main import back_main
+            from report.report_gen import property_report
+
             if self._record.price == 0.0:
                 df, price = back_main(self._record.city, self._record.house_floor, self._record.house_area,
                                       self._record.house_type,
                                       self._record.house_decorating, self._record.house_year,
                                       self._record.house_structure,
                                       self._record.house_location)
-                print(price)
+                logger.info("估价完成", extra={"fields": {"cases": len(df), "price": price}})
                 self._record.add_price(price)
             filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_report.pdf"
             file_path = f"{REPORT_PATH}/{filename}"
@@ -305,6 +325,7 @@ class Estimator:
             return True
         return False
 
+    @traced("estimator.handel_yep")
     def _handel_yep(self):
         """（类内调用）
         处理 确认信息
@@ -320,6 +341,7 @@ class Estimator:
             self._isYep = False
             return False
 
+    @traced("estimator.handel_ask_info")
     def _handel_ask_info(self):
         """（类内调用）
         处理 询问信息
@@ -0,0 +1,286 @@
+"""
+本模块包含房屋照片的特征提取
+
+不依赖深度学习框架，只用 numpy 在CPU上计算：HSV颜色直方图、4x4网格的平均颜色、2x2网格的梯度方向直方图、
+4x4网格的边缘密度与旋转不变均匀LBP纹理直方图，各部分分别归一化后拼接为一个L2归一化的向量，可直接用余弦相似度比较。
+多张照片时先由线程池并行读取、解码并缩放到统一尺寸，再堆叠成一个数组批量计算；
+特征按图片内容的哈希缓存，同一张照片（如重复上传、报告与估值都用到的照片）只计算一次。
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from telemetry.tracing import span
+
+FEATURE_VERSION = 1  # 特征算法变化时递增，旧的缓存随之失效
+IMAGE_SIZE = 128  # 解码后缩放到的边长（像素）
+BATCH_SIZE = 8  # 再大对numpy的计算没有收益，只增加内存占用
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+CACHE_SIZE = 4096  # 缓存的照片数
+
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 12, 3, 3
+LAYOUT_GRID = 4
+ORIENTATION_BINS = 8
+ORIENTATION_GRID = 2
+EDGE_GRID = 4
+EDGE_THRESHOLD = 0.1  # 梯度幅值超过该值（灰度0~1）视为边缘
+LBP_BINS = 10  # 8邻域旋转不变均匀模式：0~8个1共9种，非均匀模式1种
+
+FEATURE_DIM = (HUE_BINS * SATURATION_BINS * VALUE_BINS + LAYOUT_GRID * LAYOUT_GRID * 3
+               + ORIENTATION_GRID * ORIENTATION_GRID * ORIENTATION_BINS + EDGE_GRID * EDGE_GRID + LBP_BINS)
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    照片特征缓存 类：按 (内容哈希, 特征版本) 保存，超出容量时淘汰最久未用的
+    """
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str):
+        key = (digest, FEATURE_VERSION)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, digest: str, entry: dict):
+        key = (digest, FEATURE_VERSION)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    进程内共用的照片特征缓存
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+def _get_decode_pool() -> ThreadPoolExecutor:
+    global _decode_pool
+    if _decode_pool is None:
+        with _decode_pool_lock:
+            if _decode_pool is None:
+                _decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="image-decode")
+    return _decode_pool
+
+
+def image_digest(data: bytes) -> str:
+    """图片内容的哈希"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def decode_image(data: bytes, size: int = IMAGE_SIZE) -> np.ndarray:
+    """
+    解码并缩放为 size x size 的RGB数组（uint8）；JPEG按目标尺寸缩小解码，减少解码耗时
+    """
+    from io import BytesIO
+
+    with Image.open(BytesIO(data)) as image:
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB").resize((size, size), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8)
+
+
+def _read(path: str):
+    """
+    读取照片
+    :return: (内容哈希, 字节)，读取失败时为 (None, None)
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        print(f"读取照片失败 {path}: {str(e)}")
+        return None, None
+    return image_digest(data), data
+
+
+def _decode(data: bytes):
+    try:
+        return decode_image(data)
+    except Exception as e:
+        print(f"解码照片失败: {str(e)}")
+        return None
+
+
+def _normalize(block: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return block / np.where(norms > 0, norms, 1)
+
+
+def _grid_mean(values: np.ndarray, grid: int) -> np.ndarray:
+    """(N, S, S[, C]) 按 grid x grid 网格求均值，返回 (N, grid*grid[*C])"""
+    n, height, width = values.shape[:3]
+    cell_h, cell_w = height // grid, width // grid
+    values = values[:, :cell_h * grid, :cell_w * grid]
+    shape = (n, grid, cell_h, grid, cell_w) + values.shape[3:]
+    return values.reshape(shape).mean(axis=(2, 4)).reshape(n, -1)
+
+
+def _histograms(indices: np.ndarray, bins: int, weights: np.ndarray = None) -> np.ndarray:
+    """每张图各自的直方图：indices 为 (N, ...) 的桶编号，返回 (N, bins)"""
+    n = indices.shape[0]
+    flat = (indices.reshape(n, -1) + np.arange(n)[:, None] * bins).ravel()
+    counts = np.bincount(flat, weights=None if weights is None else weights.ravel(), minlength=n * bins)
+    return counts.reshape(n, bins)
+
+
+def _to_hsv(rgb: np.ndarray):
+    """rgb 为0~1的 (N, S, S, 3)，返回色相（0~1）、饱和度、明度"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    delta = maxc - minc
+    saturation = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1), 0)
+    safe = np.where(delta > 0, delta, 1)
+    hue = np.where(maxc == r, (g - b) / safe % 6, np.where(maxc == g, (b - r) / safe + 2, (r - g) / safe + 4))
+    hue = np.where(delta > 0, hue / 6, 0)
+    return hue, saturation, maxc
+
+
+def _lbp_codes(gray: np.ndarray) -> np.ndarray:
+    """8邻域旋转不变均匀LBP：均匀模式（0/1跳变不超过2次）取1的个数0~8，其余为9"""
+    center = gray[:, 1:-1, 1:-1]
+    height, width = center.shape[1:]
+    offsets = ((0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0))  # 顺时针
+    bits = np.stack([gray[:, dy:dy + height, dx:dx + width] >= center for dy, dx in offsets], axis=-1)
+    transitions = (bits != np.roll(bits, 1, axis=-1)).sum(axis=-1)
+    return np.where(transitions <= 2, bits.sum(axis=-1), LBP_BINS - 1)
+
+
+def compute_features(batch: np.ndarray):
+    """
+    批量计算照片特征
+
+    Args:
+        batch: (N, S, S, 3) 的 uint8 RGB 数组
+
+    Returns:
+        tuple: ((N, FEATURE_DIM) 的 float32 特征, 每张照片的统计 [{"brightness", "colourfulness",
+               "green_ratio", "sky_ratio", "sharpness"}])
+    """
+    rgb = batch.astype(np.float32) / 255
+    n = rgb.shape[0]
+    hue, saturation, value = _to_hsv(rgb)
+
+    hsv_bins = (np.minimum((hue * HUE_BINS).astype(int), HUE_BINS - 1) * SATURATION_BINS * VALUE_BINS
+                + np.minimum((saturation * SATURATION_BINS).astype(int), SATURATION_BINS - 1) * VALUE_BINS
+                + np.minimum((value * VALUE_BINS).astype(int), VALUE_BINS - 1))
+    colour = _histograms(hsv_bins, HUE_BINS * SATURATION_BINS * VALUE_BINS)
+    layout = _grid_mean(rgb, LAYOUT_GRID)
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = gray[:, 1:-1, 2:] - gray[:, 1:-1, :-2]
+    gy = gray[:, 2:, 1:-1] - gray[:, :-2, 1:-1]
+    magnitude = np.hypot(gx, gy)
+    orientation = np.minimum((np.arctan2(gy, gx) % np.pi / np.pi * ORIENTATION_BINS).astype(int),
+                             ORIENTATION_BINS - 1)
+    size = magnitude.shape[1]
+    cell = size // ORIENTATION_GRID
+    rows = np.minimum(np.arange(size) // cell, ORIENTATION_GRID - 1)
+    cells = rows[:, None] * ORIENTATION_GRID + rows[None, :]
+    gradient = _histograms(cells[None] * ORIENTATION_BINS + orientation, ORIENTATION_GRID ** 2 * ORIENTATION_BINS,
+                           weights=magnitude)
+    edges = _grid_mean((magnitude > EDGE_THRESHOLD).astype(np.float32), EDGE_GRID)
+    texture = _histograms(_lbp_codes(gray), LBP_BINS)
+
+    features = np.concatenate([_normalize(block.astype(np.float32))
+                               for block in (colour, layout, gradient, edges, texture)], axis=1)
+    features = _normalize(features).astype(np.float32)
+
+    coloured = (saturation > 0.2) & (value > 0.2)
+    green = coloured & (hue >= 1 / 6) & (hue < 1 / 2)
+    upper = slice(0, rgb.shape[1] // 2)
+    sky = ((hue[:, upper] >= 1 / 2) & (hue[:, upper] < 0.72) & (value[:, upper] > 0.4)) | (
+        (saturation[:, upper] < 0.1) & (value[:, upper] > 0.85))
+    stats = [{
+        "brightness": round(float(value[i].mean()), 3),
+        "colourfulness": round(float(saturation[i].mean()), 3),
+        "green_ratio": round(float(green[i].mean()), 3),
+        "sky_ratio": round(float(sky[i].mean()), 3),
+        "sharpness": round(float(magnitude[i].mean()), 4)
+    } for i in range(n)]
+    return features, stats
+
+
+class ImageFeatureExtractor:
+    """
+    照片特征提取 类：线程池读取与解码，按批计算，按内容哈希缓存
+    """
+    def __init__(self, cache: EmbeddingCache = None, batch_size: int = BATCH_SIZE):
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.batch_size = batch_size
+
+    def extract(self, image_paths: list) -> list:
+        """
+        提取多张照片的特征
+
+        Args:
+            image_paths: 照片路径
+
+        Returns:
+            list: 与 image_paths 对应，每项为 {"digest", "vector": (FEATURE_DIM,) float32, 统计...}，
+                  读取或解码失败的为None
+        """
+        with span("visual.extract_features", photos=len(image_paths)) as current:
+            pool = _get_decode_pool()
+            read = list(pool.map(_read, image_paths))
+            results = [None] * len(image_paths)
+            pending = {}  # 内容哈希 -> (字节, 对应的序号)，同一批中重复的照片只算一次
+            for i, (digest, data) in enumerate(read):
+                if digest is None:
+                    continue
+                entry = self.cache.get(digest)
+                if entry is not None:
+                    results[i] = entry
+                else:
+                    pending.setdefault(digest, (data, []))[1].append(i)
+            current.set_attribute("cache_hits", sum(result is not None for result in results))
+
+            # 全部解码任务一次提交，按序取回：计算前一批时线程池继续解码后面的照片
+            digests = list(pending)
+            decoded = pool.map(_decode, [pending[digest][0] for digest in digests])
+            for start in range(0, len(digests), self.batch_size):
+                chunk = digests[start:start + self.batch_size]
+                arrays = [next(decoded) for _ in chunk]
+                valid = [(digest, array) for digest, array in zip(chunk, arrays) if array is not None]
+                if not valid:
+                    continue
+                vectors, stats = compute_features(np.stack([array for _, array in valid]))
+                for (digest, _), vector, stat in zip(valid, vectors, stats):
+                    entry = {"digest": digest, "vector": vector, **stat}
+                    self.cache.put(digest, entry)
+                    for i in pending[digest][1]:
+                        results[i] = entry
+        return results
@@ -1,17 +1,96 @@
 """
 本模块包含LLM增强信息获取模块，用于处理和增强房产数据
 """
-import json
-import numpy as np
+from functools import cache
+
 from llm.llm_manager import QianwenManager
+from llm.output_parser import OutputParseError, parse_literal
+from llm.prompt_budget import PromptBudget, compact_json, estimate_tokens, top_pois
+from telemetry.logs import get_logger
+from telemetry.tracing import set_attribute
+
+logger = get_logger("llm")
+
+MAX_PROMPT_TOKENS = 2000  # 系统消息与输入数据合计的token预算
+POI_TOP_K = (10, 5, 2, 0)  # 每类设施保留的个数，超出预算时依次减少
+NUMBER_DIGITS = 6  # 浮点数保留的小数位数，经纬度6位约0.1米
+INPUT_ORDER = ("视觉特征", "文本特征", "地理位置", "设施评分")
+
+CONTEXT = "你是一个专业的房产估价师，需要分析用户消息中的房产数据并增强信息。"
+
+TASK = """
+请基于输入数据，执行以下信息增强任务：
+1. 补全缺失的房产关键参数
+2. 验证信息一致性并解决冲突
+3. 分析影响房产价值的核心因素
+4. 关联当前市场趋势数据
+"""
+
+REASONING = """
+请逐步思考：
+步骤1: 分析现有数据的完整性，识别信息缺口
+步骤2: 基于已知信息推断缺失参数
+步骤3: 交叉验证各数据源信息一致性
+步骤4: 提取价值影响因素并量化其影响
+"""
+
+OUTPUT_FORMAT = """
+请以JSON格式输出增强后的信息，包含以下部分：
+{
+  "property_info": {
+    "location": "房产位置",
+    "area": 面积数值,
+    "type": "房型",
+    "year": 建成年份,
+    "floor": "楼层",
+    "decoration": "装修情况",
+    "structure": "结构类型"
+  },
+  "consistency_check": {
+    "conflicts": ["冲突1", "冲突2"],
+    "resolutions": ["解决方案1", "解决方案2"]
+  },
+  "value_factors": [
+    {"factor": "因素1", "impact": "影响描述", "weight": 权重},
+    {"factor": "因素2", "impact": "影响描述", "weight": 权重}
+  ],
+  "market_trends": {
+    "current_price_level": "当前价格水平",
+    "price_trend": "价格趋势",
+    "liquidity": "市场流动性",
+    "policy_impact": "政策影响"
+  },
+  "estimated_price_range": {
+    "low": 最低估价,
+    "high": 最高估价,
+    "confidence": 置信度
+  }
+}
+"""
+
+
+@cache
+def system_prompt() -> str:
+    """
+    固定的系统消息：角色、任务、推理步骤与输出格式，去掉缩进与空行后只拼接一次
+    """
+    text = "\n".join((CONTEXT, TASK, REASONING, OUTPUT_FORMAT))
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
 
 class LLMEnhancer:
     """
     LLM增强信息获取模块，使用大语言模型增强房产数据
     """
-    def __init__(self):
-        """初始化LLM增强器"""
+    def __init__(self, max_prompt_tokens: int = MAX_PROMPT_TOKENS):
+        """
+        初始化LLM增强器
+        
+        Args:
+            max_prompt_tokens: 系统消息与输入数据合计的token预算
+        """
         self.llm_manager = QianwenManager()
+        self.max_prompt_tokens = max_prompt_tokens
     
     def preprocess_data(self, visual_data, text_data, geo_data, poi_data):
         """
@@ -84,35 +163,28 @@ class LLMEnhancer:
         Returns:
             dict: 增强后的数据
         """
-        # 构建提示词
-        prompt = self._build_chain_of_thought_prompt(preprocessed_data)
+        # 固定的任务说明作为系统消息，每次调用完全相同；房产数据压缩到预算内后作为用户消息
+        request = self._build_chain_of_thought_prompt(preprocessed_data)
         
         # 调用LLM
         llm_response = self.llm_manager.interact_qwen(
-            prompt=prompt,
-            request=""  # 空请求，因为所有信息都在prompt中
+            prompt=system_prompt(),
+            request=request,
+            task="enhance"
         )
         
         # 解析LLM响应
         try:
-            # 尝试提取JSON部分
-            json_start = llm_response.find('{')
-            json_end = llm_response.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = llm_response[json_start:json_end]
-                enhanced_data = json.loads(json_str)
-                return enhanced_data
-            else:
-                print("LLM响应中未找到JSON数据")
-                return {"error": "无法解析LLM响应", "raw_response": llm_response}
-        except Exception as e:
+            return parse_literal(llm_response, expected=dict)
+        except OutputParseError as e:
             print(f"解析LLM响应出错: {str(e)}")
-            return {"error": str(e), "raw_response": llm_response}
+            return {"error": "无法解析LLM响应", "raw_response": llm_response}
     
     def _build_chain_of_thought_prompt(self, data):
         """
-        构建Chain-of-Thought提示词
+        构建Chain-of-Thought提示词的输入数据部分
+        
+        各特征以紧凑JSON表示，设施按距离只保留最近的几个；超出预算时依次压缩设施、视觉特征、文本特征
         
         Args:
             data: 预处理后的数据
@@ -120,67 +192,20 @@ class LLMEnhancer:
         Returns:
             str: 提示词
         """
-        context = "你是一个专业的房产估价师，需要分析以下房产数据并增强信息。"
-        
-        input_data = f"""
-[输入数据]
-视觉特征: {json.dumps(data['v_vis_norm'], ensure_ascii=False, indent=2)}
-文本特征: {json.dumps(data['v_text_norm'], ensure_ascii=False, indent=2)}
-地理位置: {json.dumps(data['l_geo_std'], ensure_ascii=False, indent=2)}
-设施评分: {json.dumps(data['s_poi_struct'], ensure_ascii=False, indent=2)}
-"""
-        
-        task = """
-请基于以上数据，执行以下信息增强任务：
-1. 补全缺失的房产关键参数
-2. 验证信息一致性并解决冲突
-3. 分析影响房产价值的核心因素
-4. 关联当前市场趋势数据
-"""
-        
-        reasoning = """
-请逐步思考：
-步骤1: 分析现有数据的完整性，识别信息缺口
-步骤2: 基于已知信息推断缺失参数
-步骤3: 交叉验证各数据源信息一致性
-步骤4: 提取价值影响因素并量化其影响
-"""
-        
-        output_format = """
-请以JSON格式输出增强后的信息，包含以下部分：
-{
-  "property_info": {
-    "location": "房产位置",
-    "area": 面积数值,
-    "type": "房型",
-    "year": 建成年份,
-    "floor": "楼层",
-    "decoration": "装修情况",
-    "structure": "结构类型"
-  },
-  "consistency_check": {
-    "conflicts": ["冲突1", "冲突2"],
-    "resolutions": ["解决方案1", "解决方案2"]
-  },
-  "value_factors": [
-    {"factor": "因素1", "impact": "影响描述", "weight": 权重},
-    {"factor": "因素2", "impact": "影响描述", "weight": 权重}
-  ],
-  "market_trends": {
-    "current_price_level": "当前价格水平",
-    "price_trend": "价格趋势",
-    "liquidity": "市场流动性",
-    "policy_impact": "政策影响"
-  },
-  "estimated_price_range": {
-    "low": 最低估价,
-    "high": 最高估价,
-    "confidence": 置信度
-  }
-}
-"""
-        
-        return f"{context}\n{input_data}\n{task}\n{reasoning}\n{output_format}"
+        header = "[输入数据]\n" + "".join(f"{name}: \n" for name in INPUT_ORDER)
+        budget = PromptBudget(self.max_prompt_tokens - estimate_tokens(system_prompt()) - estimate_tokens(header))
+        budget.add("地理位置", compact_json(data['l_geo_std'], NUMBER_DIGITS), priority=3)
+        budget.add("文本特征", compact_json(data['v_text_norm'], NUMBER_DIGITS), priority=2)
+        budget.add("视觉特征", compact_json(data['v_vis_norm'], NUMBER_DIGITS), priority=1)
+        budget.add("设施评分", [compact_json(top_pois(data['s_poi_struct'], k), NUMBER_DIGITS)
+                            for k in POI_TOP_K], priority=0)
+        sections = {section["name"]: section["text"] for section in budget.fit()}
+        usage = budget.usage()
+        set_attribute("prompt_sections", usage["sections"])
+        if usage["compacted"]:
+            logger.info("房产数据超出提示词预算，已压缩", extra={"fields": usage})
+        
+        return "[输入数据]\n" + "\n".join(f"{name}: {sections[name]}" for name in INPUT_ORDER)
     
     def process_and_enhance(self, multimodal_data):
         """
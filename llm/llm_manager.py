@@ -1,9 +1,17 @@
 """
 本模块包含 通义千问管理 类
+
+环境变量 SNAPROP_LLM_PROVIDER 选择调用的服务：dashscope（默认）为通义千问，
+local 为 OpenAI 兼容接口的本地服务（如 llm/standin_server.py 的替身），地址由 SNAPROP_LLM_BASE_URL 指定。
+各任务使用的模型与对冲请求见 llm/router.py。
 """
-import dashscope
 from llm.prompt import Prompt
-from config.qianwen_config import model_name, model_api_key
+from llm.prompt_budget import estimate_tokens
+from llm.router import LLMRouter, get_router
+from telemetry.tracing import LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS, current_span, span, traced
+from telemetry.logs import get_logger
+
+logger = get_logger("llm")
 
 
 class QianwenManager():
@@ -11,45 +19,66 @@ class QianwenManager():
     通义千问管理 类
     """
 
-    def __init__(self):
-        self._model = model_name
-        self._api_key = model_api_key
+    def __init__(self, provider: str = None, base_url: str = None):
+        """
+        :param provider: dashscope 或 local，默认读取环境变量 SNAPROP_LLM_PROVIDER
+        :param base_url: local 服务的地址，默认读取环境变量 SNAPROP_LLM_BASE_URL
+        两者都未指定时使用进程内共用的路由，各实例共享每条路由的耗时统计
+        """
+        self._router = LLMRouter.from_env(provider, base_url) if provider or base_url else get_router()
 
     def disconnect_llm(self):
         return
 
-    def interact_qwen(self, prompt: str, request: str):
+    def interact_qwen(self, prompt: str, request: str, task: str = None):
+        """
+        :param task: 路由使用的任务名，默认取调用方的 span 名（如 llm.classify_message 为 classify_message）
+        """
         message = [{'role': 'system', 'content': prompt},
                    {'role': 'user', 'content': request}]
-        reply = dashscope.Generation.call(
-            model=self._model,
-            api_key=self._api_key,
-            messages=message,
-            result_format='text'
-        )
-        return reply.output.text
+        # token数按调用方（外层 span，如 llm.classify_message）分别统计
+        parent = current_span()
+        operation = parent.name if parent is not None else "llm.qwen"
+        task = task or (operation.removeprefix("llm.") if operation.startswith("llm.") and parent is not None
+                        else "default")
+        logger.debug("调用大模型", extra={"fields": {"task": task, "prompt_chars": len(prompt) + len(request)}})
+        with span("llm.qwen", task=task, prompt_chars=len(prompt) + len(request)) as current:
+            text, usage = self._router.call(task, message)
+            prompt_tokens, response_tokens = usage or (estimate_tokens(prompt + request), estimate_tokens(text or ""))
+            current.set_attribute("prompt_tokens", prompt_tokens)
+            current.set_attribute("response_tokens", response_tokens)
+        LLM_PROMPT_TOKENS.observe(operation, prompt_tokens)
+        LLM_RESPONSE_TOKENS.observe(operation, response_tokens)
+        return text
 
+    @traced("llm.classify_message")
     def classify_message(self, message: str):
         return self.interact_qwen(prompt=Prompt.PROMPT_CLASSIFY_MESSAGE, request=message)
 
+    @traced("llm.respond_null")
     def respond_null(self, message: str):
         return self.interact_qwen(prompt=Prompt.PROMPT_RESPOND_NULL, request=message)
 
+    @traced("llm.respond_info")
     def respond_info(self, message: str, inputs: list[str]):
         prompt = Prompt.PROMPT_RESPOND_INFO.format(lists=",".join(inputs))
         return self.interact_qwen(prompt=prompt, request=message)
 
+    @traced("llm.respond_value")
     def respond_value(self, missing_values: list[str]):
         prompt = Prompt.PROMPT_RESPOND_VALUE.format(lists=",".join(missing_values))
         return self.interact_qwen(prompt=prompt, request="")
 
+    @traced("llm.respond_table")
     def respond_table(self, message: str, inputs: list[str]):
         prompt = Prompt.PROMPT_RESPOND_TABLE.format(lists=",".join(inputs))
         return self.interact_qwen(prompt=prompt, request=message)
 
+    @traced("llm.get_near_loc")
     def get_near_loc(self, message: str):
         return self.interact_qwen(prompt=Prompt.PROMPT_NEAR_LOC, request=message)
 
+    @traced("llm.get_environment")
     def get_environment(self, near_places: list[str], hospital: list[str], school: list[str]):
         prompt = Prompt.PROMPT_NEAR_LOC_SHORT.format(near_places=",".join(near_places), hospital=",".join(hospital),
                                                      school=",".join(school))
@@ -4,12 +4,19 @@
 import os
 import re
 import json
+import zlib
 import numpy as np
 from PIL import Image
 import requests
 from io import BytesIO
 from datetime import datetime
 from config.path_config import MAP_PATH
+from llm.image_features import ImageFeatureExtractor
+from telemetry.tracing import span, url_attribute
+
+TEXT_VECTOR_DIM = 512  # 文本特征哈希到的维度
+TEXT_NGRAMS = (1, 2, 3)  # 文本特征使用的字符n-gram
+
 
 class VisualEncoder:
     """
@@ -17,7 +24,7 @@ class VisualEncoder:
     """
     def __init__(self):
         """初始化视觉编码器"""
-        pass
+        self.feature_extractor = ImageFeatureExtractor()
     
     def process_property_cert(self, image_path):
         """
@@ -51,25 +58,43 @@ class VisualEncoder:
         提取房屋外观特征
         
         Args:
-            image_path: 房屋外观图片路径
+            image_path: 房屋外观图片路径，或多张照片的路径列表（如 Record.field_img）
             
         Returns:
-            dict: 提取的特征
+            dict: 提取的特征，多张照片时向量取平均后归一化、统计量取平均；没有可用照片时为空
         """
-        try:
-            # 打开并预处理图像
-            image = Image.open(image_path)
-            # 模拟特征提取
-            features = {
-                "building_style": "现代",
-                "condition": "良好",
-                "environment": "整洁",
-                "visual_features": np.random.rand(512).tolist()  # 模拟视觉特征向量
-            }
-            return features
-        except Exception as e:
-            print(f"提取房屋外观特征出错: {str(e)}")
+        image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+        photos = [photo for photo in self.extract_batch_features(image_paths) if photo]
+        if not photos:
             return {}
+        vector = np.mean([photo["visual_features"] for photo in photos], axis=0)
+        vector /= np.linalg.norm(vector) or 1
+        features = {key: round(float(np.mean([photo[key] for photo in photos])), 4)
+                    for key in ("brightness", "colourfulness", "green_ratio", "sky_ratio", "sharpness")}
+        features["photo_count"] = len(photos)
+        features["visual_features"] = vector.tolist()
+        return features
+    
+    def extract_batch_features(self, image_paths):
+        """
+        批量提取每张照片的特征
+        
+        Args:
+            image_paths: 照片路径列表
+            
+        Returns:
+            list: 与 image_paths 对应，每项包含 digest（内容哈希）、visual_features 与亮度、绿化占比等统计，
+                  读取或解码失败的为None
+        """
+        results = []
+        for entry in self.feature_extractor.extract(image_paths):
+            if entry is None:
+                results.append(None)
+                continue
+            photo = {key: value for key, value in entry.items() if key != "vector"}
+            photo["visual_features"] = entry["vector"].tolist()
+            results.append(photo)
+        return results
     
     def align_visual_semantic(self, visual_features, text_features):
         """
@@ -82,14 +107,13 @@ class VisualEncoder:
         Returns:
             dict: 对齐后的特征
         """
-        # 实际项目中应实现复杂的对齐算法，这里简化处理
-        aligned_features = {
-            "combined_features": np.mean([
-                np.array(visual_features.get("visual_features", [])), 
-                np.array(text_features.get("text_vector", []))
-            ], axis=0).tolist() if visual_features.get("visual_features") and text_features.get("text_vector") else []
-        }
-        return aligned_features
+        # 两种向量来自不同的特征空间，维度也不同，不能逐元素平均；各自归一化后拼接，两部分权重相同
+        visual = np.array(visual_features.get("visual_features", []), dtype=float)
+        text = np.array(text_features.get("text_vector", []), dtype=float)
+        if not visual.size or not text.size:
+            return {"combined_features": []}
+        parts = [part / (np.linalg.norm(part) or 1) / np.sqrt(2) for part in (visual, text)]
+        return {"combined_features": np.concatenate(parts).tolist()}
 
 
 class TextEncoder:
@@ -153,9 +177,15 @@ class TextEncoder:
         Returns:
             dict: 语义特征
         """
-        # 实际项目中应使用词嵌入或语言模型，这里简化处理
-        text_vector = np.random.rand(512).tolist()  # 模拟文本向量
-        return {"text": text, "text_vector": text_vector}
+        # 字符n-gram按crc32哈希到固定维度（跨进程稳定），词频取对数后L2归一化
+        counts = np.zeros(TEXT_VECTOR_DIM)
+        compact = re.sub(r"\s+", "", text or "")
+        for n in TEXT_NGRAMS:
+            for i in range(len(compact) - n + 1):
+                counts[zlib.crc32(compact[i:i + n].encode("utf-8")) % TEXT_VECTOR_DIM] += 1
+        text_vector = np.log1p(counts)
+        text_vector /= np.linalg.norm(text_vector) or 1
+        return {"text": text, "text_vector": text_vector.tolist()}
 
 
 class SpatialEncoder:
@@ -179,7 +209,8 @@ class SpatialEncoder:
         """
         url = f"https://api.map.baidu.com/geocoding/v3/?address={address}&city={city}&output=json&ak={self.api_key}"
         try:
-            response = requests.get(url)
+            with span("http.baidu.geocoding", url=url_attribute(url)):
+                response = requests.get(url)
             result = response.json()
             if result.get('status') == 0:
                 location = result['result']['location']
@@ -204,7 +235,8 @@ class SpatialEncoder:
         """
         url = f"https://api.map.baidu.com/reverse_geocoding/v3/?location={lat},{lng}&output=json&ak={self.api_key}"
         try:
-            response = requests.get(url)
+            with span("http.baidu.reverse_geocoding", url=url_attribute(url)):
+                response = requests.get(url)
             result = response.json()
             if result.get('status') == 0:
                 return result['result']
@@ -242,7 +274,8 @@ class SpatialEncoder:
             for keyword in keywords:
                 url = f"https://api.map.baidu.com/place/v2/search?query={keyword}&location={lat},{lng}&radius={radius}&output=json&ak={self.api_key}"
                 try:
-                    response = requests.get(url)
+                    with span("http.baidu.place_search", url=url_attribute(url)):
+                        response = requests.get(url)
                     result = response.json()
                     if result.get('status') == 0:
                         poi_results[category].extend([
@@ -315,7 +348,8 @@ class SpatialEncoder:
         url = f"https://api.map.baidu.com/staticimage/v2?ak={self.api_key}&width=512&height=400&zoom=16&center={lng},{lat}&markers={lng},{lat}"
         
         try:
-            response = requests.get(url)
+            with span("http.baidu.staticimage", url=url_attribute(url)):
+                response = requests.get(url)
             if response.status_code == 200:
                 # 将响应内容转换为二进制流
                 image_data = BytesIO(response.content)
@@ -352,7 +386,7 @@ class MultimodalEncoder:
         
         Args:
             property_cert_image: 房产证图片路径
-            property_photo: 房屋外观图片路径
+            property_photo: 房屋外观图片路径，或多张照片的路径列表
             property_text: 房产描述文本
             address: 房产地址
             city: 所在城市
@@ -0,0 +1,273 @@
+"""
+本模块包含大模型输出的解析
+
+提示要求大模型返回Python/JSON字面量（如二维列表），但回复常带有代码块标记、前后的说明文字、中文标点、
+弯引号、JSON与Python写法混用，或因截断缺少结尾的括号。这里只用 json / ast.literal_eval 解析，不执行任何代码，
+先尝试原文，失败时在本地修复上述问题后再解析，最后按调用方需要的结构校验并丢弃不合格的项，
+格式上的小错误不必再请求一次大模型。
+"""
+import ast
+import json
+import re
+
+from telemetry.logs import get_logger
+
+logger = get_logger("llm")
+
+FENCE_PATTERN = re.compile(r"```[\w+-]*[ \t]*\n?(.*?)```", re.S)
+OPEN_FENCE_PATTERN = re.compile(r"^```[\w+-]*[ \t]*\n?")
+OPENERS = {"[": "]", "{": "}"}
+CLOSERS = {"]", "}"}
+FULLWIDTH = str.maketrans({"，": ",", "：": ":", "【": "[", "】": "]", "｛": "{", "｝": "}", "、": ","})
+CURLY_QUOTES = {"“": ("\"", "”"), "‘": ("'", "’")}  # 开引号 -> (替换为, 对应的闭引号)
+JSON_WORDS = re.compile(r"\b(null|true|false)\b")
+PYTHON_VALUES = {"null": "None", "true": "True", "false": "False"}
+LIST_SEPARATORS = re.compile(r"[,，、;；\n]+")
+
+
+class OutputParseError(ValueError):
+    """大模型输出无法解析为需要的结构"""
+
+
+def strip_fences(text: str) -> str:
+    """
+    去掉Markdown代码块标记，有多个代码块时取第一个；只有开头的标记（输出被截断）时去掉开头
+    """
+    match = FENCE_PATTERN.search(text)
+    if match:
+        return match.group(1).strip()
+    return OPEN_FENCE_PATTERN.sub("", text.strip()).strip()
+
+
+def _segments(text: str) -> list:
+    """
+    按引号切分为 (是否字符串, 片段)，弯引号视为直引号，字符串内的换行转义，未闭合的字符串补上引号
+    """
+    segments = []
+    current = []
+    closer = None  # 当前字符串的闭引号，None 表示在字符串外
+    quote = None  # 当前字符串输出使用的引号
+    escaped = False
+    for ch in text:
+        if closer is None:
+            if ch in ("\"", "'") or ch in CURLY_QUOTES:
+                if current:
+                    segments.append((False, "".join(current)))
+                quote, closer = CURLY_QUOTES.get(ch, (ch, ch))
+                current = [quote]
+            else:
+                current.append(ch)
+            continue
+        if escaped:
+            escaped = False
+            current.append(ch)
+        elif ch == "\\":
+            escaped = True
+            current.append(ch)
+        elif ch == closer:
+            current.append(quote)
+            segments.append((True, "".join(current)))
+            current, closer = [], None
+        elif ch == quote:
+            current.append("\\" + ch)  # 弯引号字符串中的直引号
+        elif ch == "\n":
+            current.append("\\n")
+        else:
+            current.append(ch)
+    if closer is not None:
+        current.append(quote)
+        segments.append((True, "".join(current)))
+    elif current:
+        segments.append((False, "".join(current)))
+    return segments
+
+
+def _extract(segments: list, python: bool) -> str | None:
+    """
+    取第一个括号开始到与其配对的括号为止的字面量：字符串外的全角标点换为半角，
+    python=True 时把 null/true/false 换为Python写法；括号未闭合（输出被截断）时，
+    先丢弃最内层未闭合括号中最后一个逗号之后的元素（可能只输出了一半，如 136.79 截断为 13），再按顺序补齐括号
+    """
+    pieces = []
+    stack = []
+    starts = []  # 各层括号中最后一个元素在 pieces 中的起点（括号或逗号的位置）
+    complete = []  # 各层最后一个元素是否为已闭合的括号
+    for is_string, piece in segments:
+        if is_string:
+            if stack:
+                pieces.append(piece)
+                complete[-1] = False
+            continue
+        piece = piece.translate(FULLWIDTH)
+        if python:
+            piece = JSON_WORDS.sub(lambda match: PYTHON_VALUES[match.group(1)], piece)
+        for ch in piece:
+            if not stack:
+                if ch in OPENERS:
+                    stack.append(OPENERS[ch])
+                    pieces.append(ch)
+                    starts.append(len(pieces))
+                    complete.append(False)
+                continue
+            if ch == ",":
+                starts[-1] = len(pieces)
+                complete[-1] = False
+            elif ch in OPENERS:
+                stack.append(OPENERS[ch])
+                pieces.append(ch)
+                starts.append(len(pieces))
+                complete.append(False)
+                continue
+            elif ch in CLOSERS:
+                if ch != stack[-1]:
+                    return None
+                stack.pop()
+                starts.pop()
+                complete.pop()
+                pieces.append(ch)
+                if not stack:
+                    return "".join(pieces)
+                complete[-1] = True
+                continue
+            elif not ch.isspace():
+                complete[-1] = False
+            pieces.append(ch)
+    if not pieces:
+        return None
+    if not complete[-1]:
+        del pieces[starts[-1]:]
+    literal = "".join(pieces).rstrip().rstrip(",")
+    return literal + "".join(reversed(stack))
+
+
+def _load(candidate: str):
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+
+
+def _to_plain(value):
+    """元组转为列表，与JSON的结构一致；含有集合、字节串等无法对应JSON的值时为None"""
+    if isinstance(value, (list, tuple)):
+        items = [_to_plain(item) for item in value]
+        return None if any(item is None and original is not None for item, original in zip(items, value)) else items
+    if isinstance(value, dict):
+        items = {str(key): _to_plain(item) for key, item in value.items()}
+        return None if any(items[str(key)] is None and item is not None for key, item in value.items()) else items
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return None
+
+
+def parse_literal(text: str, expected=(list, dict)):
+    """
+    解析大模型输出的字面量
+
+    Args:
+        text: 大模型输出
+        expected: 期望的顶层类型
+
+    Returns:
+        list | dict: 解析结果，元组转为列表
+
+    Raises:
+        OutputParseError: 原文与修复后都无法解析为期望的类型
+    """
+    if not isinstance(text, str):
+        raise OutputParseError(f"输出不是字符串: {type(text).__name__}")
+    stripped = text.strip()
+    value = _load(stripped)
+    if not isinstance(value, expected):
+        segments = _segments(strip_fences(stripped))
+        value = None
+        for python in (False, True):
+            literal = _extract(segments, python)
+            if literal is None:
+                break
+            value = _load(literal)
+            if isinstance(value, expected):
+                logger.debug("已修复大模型输出格式", extra={"fields": {"output": text[:200]}})
+                break
+    value = _to_plain(value) if isinstance(value, expected) else None
+    if value is None:
+        raise OutputParseError(f"无法解析大模型输出: {text[:200]}")
+    return value
+
+
+def _is_scalar(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) or isinstance(value, str)
+
+
+def parse_pairs(text: str, keys=None) -> list:
+    """
+    解析 [[key, value], ...] 形式的字段列表，也接受 {key: value} 与单个 [key, value]
+
+    Args:
+        text: 大模型输出
+        keys: 允许的key，为None时不限制
+
+    Returns:
+        list: [[key, value]]，只保留key允许、value为非空字符串或数字的项，字符串两端的空白去掉
+
+    Raises:
+        OutputParseError: 无法解析为列表或字典
+    """
+    value = parse_literal(text)
+    if isinstance(value, dict):
+        items = list(value.items())
+    elif len(value) == 2 and isinstance(value[0], str) and not isinstance(value[1], list):
+        items = [value]
+    else:
+        items = value
+
+    pairs = []
+    dropped = []
+    for item in items:
+        if not isinstance(item, (list, tuple)) or len(item) != 2 or not isinstance(item[0], str):
+            dropped.append(item)
+            continue
+        key, field_value = item[0].strip(), item[1]
+        if isinstance(field_value, str):
+            field_value = field_value.strip()
+        if (keys is not None and key not in keys) or not _is_scalar(field_value) or field_value == "":
+            dropped.append(item)
+            continue
+        pairs.append([key, field_value])
+    if dropped:
+        logger.debug("丢弃不合格的字段", extra={"fields": {"dropped": dropped}})
+    return pairs
+
+
+def parse_string_list(text: str) -> list:
+    """
+    解析一维字符串列表；输出中没有列表时按逗号、顿号、换行等分隔
+
+    Args:
+        text: 大模型输出
+
+    Returns:
+        list: 去重后的非空字符串，保持原顺序
+
+    Raises:
+        OutputParseError: 含有列表但无法解析
+    """
+    try:
+        value = parse_literal(text, expected=list)
+    except OutputParseError:
+        if not isinstance(text, str) or "[" in text:
+            raise
+        value = LIST_SEPARATORS.split(strip_fences(text))
+    names = []
+    for item in value:
+        if isinstance(item, list) and len(item) == 1:
+            item = item[0]
+        if _is_scalar(item):
+            name = str(item).strip().strip("'\"“”‘’")
+            if name and name not in names:
+                names.append(name)
+    return names
@@ -0,0 +1,126 @@
+"""
+本模块包含提示词预算管理
+
+提示词按段登记，每段可给出由详到略的多个版本（如POI取前10个、前5个、前2个），
+估算各段token数，超出预算时从优先级最低的段开始换用更简略的版本，仍超出时截断；
+另提供JSON压缩（去缩进、数值取整）与按距离保留前k个POI的工具。
+token数按字符估算：中文等全角字符约1个token，其余约4个字符1个token。
+"""
+import json
+import math
+import re
+
+CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def round_numbers(value, digits: int = 4):
+    """
+    递归地把浮点数保留 digits 位小数
+    """
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {key: round_numbers(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_numbers(item, digits) for item in value]
+    return value
+
+
+def compact_json(value, digits: int = 4) -> str:
+    """
+    紧凑JSON：不缩进、无多余空格、浮点数取整、中文不转义
+    """
+    return json.dumps(round_numbers(value, digits), ensure_ascii=False, separators=(",", ":"))
+
+
+def top_pois(poi_struct: dict, k: int) -> dict:
+    """
+    每类POI按距离保留最近的k个，距离缺失或无法比较的排在后面
+    """
+    def distance(poi):
+        try:
+            return float(poi.get("distance"))
+        except (TypeError, ValueError):
+            return math.inf
+
+    return {category: sorted(pois, key=distance)[:k] for category, pois in poi_struct.items()}
+
+
+class PromptBudget:
+    """
+    提示词预算 类
+    """
+    def __init__(self, max_tokens: int):
+        """
+        :param max_tokens: 各段合计的最大token数
+        """
+        self.max_tokens = max_tokens
+        self._sections = []  # [{"name", "variants", "priority", "index", "text"}]
+
+    def add(self, name: str, variants, priority: int = 0):
+        """
+        登记一段
+        :param name: 段名
+        :param variants: 文本，或由详到略的多个版本
+        :param priority: 优先级，超出预算时先压缩优先级低的段
+        """
+        variants = [variants] if isinstance(variants, str) else list(variants)
+        self._sections.append({"name": name, "variants": variants, "priority": priority, "index": 0,
+                               "text": variants[0]})
+
+    def total_tokens(self) -> int:
+        return sum(estimate_tokens(section["text"]) for section in self._sections)
+
+    def fit(self) -> list:
+        """
+        压缩到预算以内
+        :return: 各段 {"name", "text"}，按登记顺序
+        """
+        for section in sorted(self._sections, key=lambda s: s["priority"]):
+            while self.total_tokens() > self.max_tokens and section["index"] + 1 < len(section["variants"]):
+                section["index"] += 1
+                section["text"] = section["variants"][section["index"]]
+        for section in sorted(self._sections, key=lambda s: s["priority"]):
+            excess = self.total_tokens() - self.max_tokens
+            if excess <= 0:
+                break
+            section["text"] = self._truncate(section["text"], estimate_tokens(section["text"]) - excess)
+        return [{"name": section["name"], "text": section["text"]} for section in self._sections]
+
+    def usage(self) -> dict:
+        """
+        各段token数与压缩情况
+        :return: {"max_tokens", "total_tokens", "sections": {段名: token数}, "compacted": [换用简略版本或截断的段]}
+        """
+        return {
+            "max_tokens": self.max_tokens,
+            "total_tokens": self.total_tokens(),
+            "sections": {section["name"]: estimate_tokens(section["text"]) for section in self._sections},
+            "compacted": [section["name"] for section in self._sections
+                          if section["text"] != section["variants"][0]]
+        }
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        low, high = 0, len(text)
+        # 二分查找不超过 max_tokens 的最长前缀（含截断标记）
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(text[:middle] + TRUNCATION_MARK) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low] + TRUNCATION_MARK if low else ""
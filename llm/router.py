@@ -0,0 +1,343 @@
+"""
+本模块包含 大模型路由 类
+
+同一进程内的大模型调用按任务（classify_message、enhance 等）路由到不同的服务：
+简单任务优先用小而快的模型，信息增强用大模型，其余用默认模型。每条路由（任务, 服务）记录最近的耗时与失败，
+始终按配置的偏好顺序选首选服务，只有它的p95耗时超过该任务的时延目标或成功率过低时才降到后面；
+开启对冲时，首选服务超过该路由的p95耗时仍未返回，或直接失败时，向下一个不同的候选再发一次请求，取先返回的成功结果。
+
+服务的后端与地址沿用 llm_manager 的 SNAPROP_LLM_PROVIDER / SNAPROP_LLM_BASE_URL，
+快、大模型名由 SNAPROP_LLM_FAST_MODEL / SNAPROP_LLM_LARGE_MODEL 指定，未设置时与默认模型相同；
+对冲会增加请求量与费用，默认关闭，SNAPROP_LLM_HEDGE=on 开启。
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from config.qianwen_config import model_name, model_api_key
+from telemetry.logs import get_logger
+from telemetry.tracing import LLM_HEDGES, LLM_ROUTE_DURATION, set_attribute
+
+logger = get_logger("llm")
+
+LLM_PROVIDER_ENV = "SNAPROP_LLM_PROVIDER"
+LLM_BASE_URL_ENV = "SNAPROP_LLM_BASE_URL"
+LLM_FAST_MODEL_ENV = "SNAPROP_LLM_FAST_MODEL"
+LLM_LARGE_MODEL_ENV = "SNAPROP_LLM_LARGE_MODEL"
+LLM_HEDGE_ENV = "SNAPROP_LLM_HEDGE"
+BACKENDS = ("dashscope", "local")
+DEFAULT_LOCAL_URL = "http://127.0.0.1:8790/v1"
+LOCAL_TIMEOUT = 60  # 秒
+
+# 任务 -> 候选服务，按偏好排序；未列出的任务走 default
+ROUTES = {
+    "classify_message": ("fast", "default"),
+    "get_near_loc": ("fast", "default"),
+    "enhance": ("large", "default"),
+    "default": ("default", "fast"),
+}
+
+# 任务的p95时延目标（秒），首选服务超过时降级；未列出的任务用 default
+LATENCY_SLO = {
+    "classify_message": 5.0,
+    "get_near_loc": 5.0,
+    "enhance": 30.0,
+    "default": 20.0,
+}
+MIN_SUCCESS_RATE = 0.9  # 成功率低于此值的服务降级
+
+WINDOW_SIZE = 200  # 每条路由保留的最近调用数
+MIN_SAMPLES = 20  # 服务有这么多样本后才按实测判断是否降级
+EXPLORE_EVERY = 20  # 每隔这么多次调用把样本最少的候选作为首选，使各候选的统计保持更新
+DEFAULT_HEDGE_AFTER = 3.0  # 样本不足时的对冲等待（秒）
+MIN_HEDGE_AFTER = 0.2  # 对冲等待的下限（秒）
+MAX_HEDGES = 16  # 同时进行的对冲请求上限，达到上限时不再对冲，避免过载时加倍请求
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class Provider:
+    """
+    一个大模型服务：后端（dashscope / local）与模型
+    """
+    def __init__(self, name: str, backend: str, model: str, api_key: str = None, base_url: str = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的大模型服务: {backend}，可选 {', '.join(BACKENDS)}")
+        self.name = name
+        self.backend = backend
+        self.model = model
+        self.api_key = api_key
+        self.base_url = (base_url or DEFAULT_LOCAL_URL).rstrip("/")
+
+    def call(self, message: list):
+        """
+        :return: (回复, (输入token数, 输出token数))，接口未返回 usage 时后者为None
+        """
+        if self.backend == "local":
+            return self._call_local(message)
+        return self._call_dashscope(message)
+
+    def _call_dashscope(self, message: list):
+        import dashscope
+
+        reply = dashscope.Generation.call(
+            model=self.model,
+            api_key=self.api_key,
+            messages=message,
+            result_format='text'
+        )
+        text = reply.output.text
+        usage = getattr(reply, "usage", None)
+        try:
+            return text, (int(usage.input_tokens), int(usage.output_tokens))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return text, None
+
+    def _call_local(self, message: list):
+        """调用 OpenAI 兼容接口的本地服务"""
+        import requests
+
+        response = requests.post(f"{self.base_url}/chat/completions",
+                                 json={"model": self.model, "messages": message}, timeout=LOCAL_TIMEOUT)
+        response.raise_for_status()
+        payload = response.json()
+        usage = payload.get("usage") or {}
+        try:
+            tokens = int(usage["prompt_tokens"]), int(usage["completion_tokens"])
+        except (KeyError, TypeError, ValueError):
+            tokens = None
+        return payload["choices"][0]["message"]["content"], tokens
+
+
+class RouteStats:
+    """
+    一条路由最近调用的耗时与成败
+    """
+    def __init__(self, size: int = WINDOW_SIZE):
+        self._samples = deque(maxlen=size)  # (耗时秒数, 是否成功)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self._samples.append((seconds, ok))
+
+    def summary(self) -> dict:
+        """
+        :return: {"count", "p50", "p95", "success_rate"}，耗时只统计成功的调用，没有时为None
+        """
+        with self._lock:
+            samples = list(self._samples)
+        latencies = sorted(seconds for seconds, ok in samples if ok)
+        return {
+            "count": len(samples),
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+            "success_rate": len(latencies) / len(samples) if samples else None
+        }
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LLMRouter:
+    """
+    大模型路由 类
+    """
+    def __init__(self, providers: dict, routes: dict = None, hedge: bool = False):
+        """
+        :param providers: 服务名 -> Provider
+        :param routes: 任务 -> 候选服务名，须包含 default；候选中不存在的服务忽略
+        :param hedge: 是否发出对冲请求
+        """
+        self.providers = providers
+        self.routes = {task: [name for name in names if name in providers]
+                       for task, names in (routes or ROUTES).items()}
+        if not self.routes.get("default"):
+            self.routes["default"] = list(providers)
+        self.hedge = hedge
+        self._stats = {}  # (任务, 服务名) -> RouteStats
+        self._stats_lock = threading.Lock()
+        self._calls = 0
+        self._hedge_slots = threading.BoundedSemaphore(MAX_HEDGES)
+
+    @classmethod
+    def from_env(cls, backend: str = None, base_url: str = None):
+        """
+        按环境变量建立 default / fast / large 三个服务，fast / large 未指定模型时使用默认模型
+        :param backend: dashscope 或 local，默认读取 SNAPROP_LLM_PROVIDER
+        :param base_url: local 服务的地址，默认读取 SNAPROP_LLM_BASE_URL
+        """
+        backend = (backend or os.environ.get(LLM_PROVIDER_ENV) or "dashscope").strip().lower()
+        base_url = base_url or os.environ.get(LLM_BASE_URL_ENV)
+        models = {
+            "default": model_name,
+            "fast": os.environ.get(LLM_FAST_MODEL_ENV) or model_name,
+            "large": os.environ.get(LLM_LARGE_MODEL_ENV) or model_name,
+        }
+        providers = {name: Provider(name, backend, model, model_api_key, base_url) for name, model in models.items()}
+        hedge = os.environ.get(LLM_HEDGE_ENV, "off").strip().lower() in ("on", "1", "true", "yes")
+        return cls(providers, hedge=hedge)
+
+    def stats(self, task: str, provider: str) -> RouteStats:
+        key = (task, provider)
+        with self._stats_lock:
+            if key not in self._stats:
+                self._stats[key] = RouteStats()
+            return self._stats[key]
+
+    def snapshot(self) -> dict:
+        """
+        :return: {任务: {服务名: RouteStats.summary()}}
+        """
+        with self._stats_lock:
+            keys = list(self._stats)
+        result = {}
+        for task, provider in keys:
+            result.setdefault(task, {})[provider] = self.stats(task, provider).summary()
+        return result
+
+    def healthy(self, task: str, provider: str) -> bool:
+        """该路由是否满足时延目标与成功率；样本不足时视为满足"""
+        summary = self.stats(task, provider).summary()
+        if summary["count"] < MIN_SAMPLES:
+            return True
+        slo = LATENCY_SLO.get(task, LATENCY_SLO["default"])
+        return (summary["success_rate"] >= MIN_SUCCESS_RATE
+                and summary["p95"] is not None and summary["p95"] <= slo)
+
+    def candidates(self, task: str) -> list:
+        """
+        候选服务：保持配置的偏好顺序，不满足时延目标或成功率的服务排到后面；
+        定期让样本最少的候选当首选，使降级的服务有机会恢复
+        """
+        names = list(self.routes.get(task) or self.routes["default"])
+        with self._stats_lock:
+            self._calls += 1
+            explore = self._calls % EXPLORE_EVERY == 0
+        if len(names) < 2:
+            return names
+        if explore:
+            fewest = min(names, key=lambda name: self.stats(task, name).summary()["count"])
+            return [fewest] + [name for name in names if name != fewest]
+        # sorted 是稳定排序，满足目标的服务之间仍按配置顺序
+        return sorted(names, key=lambda name: not self.healthy(task, name))
+
+    def hedge_after(self, task: str, provider: str) -> float:
+        """该路由的对冲等待（秒）：实测p95，样本不足时为默认值"""
+        summary = self.stats(task, provider).summary()
+        if summary["count"] < MIN_SAMPLES or summary["p95"] is None:
+            return DEFAULT_HEDGE_AFTER
+        return max(summary["p95"], MIN_HEDGE_AFTER)
+
+    def call(self, task: str, message: list):
+        """
+        按路由调用大模型，必要时发出对冲请求
+
+        Args:
+            task: 任务名
+            message: 消息列表
+
+        Returns:
+            tuple: (回复, (输入token数, 输出token数) 或 None)
+
+        Raises:
+            Exception: 首选与对冲的服务都失败时，抛出首选服务的异常
+        """
+        names = self.candidates(task)
+        primary = names[0]
+        backup = self._backup(primary, names[1:])
+        if not self.hedge or backup is None:
+            # 不对冲或没有不同的候选时直接在调用线程中请求
+            set_attribute("provider", primary)
+            set_attribute("model", self.providers[primary].model)
+            return self._run(task, primary, message)
+
+        futures = {self._start(task, primary, message): primary}
+        done, _ = wait(futures, timeout=self.hedge_after(task, primary))
+        if not done or next(iter(done)).exception() is not None:
+            hedge_reason = "timeout" if not done else "error"
+            if self._hedge_slots.acquire(blocking=False):
+                futures[self._start(task, backup, message, self._hedge_slots.release)] = backup
+                LLM_HEDGES.inc(f"{task}:{hedge_reason}")
+                logger.debug("发出对冲请求", extra={"fields": {"task": task, "primary": primary, "backup": backup,
+                                                           "reason": hedge_reason}})
+            else:
+                LLM_HEDGES.inc(f"{task}:skipped")
+
+        errors = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                if future.exception() is not None:
+                    errors[name] = future.exception()
+                    continue
+                hedged = len(futures) > 1
+                set_attribute("provider", name)
+                set_attribute("model", self.providers[name].model)
+                set_attribute("hedged", hedged)
+                if hedged:
+                    LLM_HEDGES.inc(f"{task}:{'primary' if future is next(iter(futures)) else 'backup'}_won")
+                return future.result()
+        raise errors.get(primary) or next(iter(errors.values()))
+
+    def _backup(self, primary: str, names: list):
+        """第一个与首选服务的后端、地址、模型不同的候选；都相同时为None，对同一服务重复请求没有意义"""
+        key = lambda name: (self.providers[name].backend, self.providers[name].base_url, self.providers[name].model)
+        return next((name for name in names if key(name) != key(primary)), None)
+
+    def _run(self, task: str, name: str, message: list):
+        """调用服务，结束时（包括对冲中落后、结果被丢弃的调用）记录该路由的耗时"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = self.providers[name].call(message)
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats(task, name).record(elapsed, ok)
+            if ok:
+                LLM_ROUTE_DURATION.observe(f"{task}:{name}", elapsed)
+
+    def _start(self, task: str, name: str, message: list, on_done=None) -> Future:
+        """
+        在新线程中调用服务。每个调用独占一个线程，不经过共享线程池，
+        调用不会因排队而被计入对冲等待
+        :param on_done: 调用结束后执行，用于归还对冲名额
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                future.set_result(context.run(self._run, task, name, message))
+            except BaseException as error:
+                future.set_exception(error)
+            finally:
+                if on_done is not None:
+                    on_done()
+
+        threading.Thread(target=run, name=f"llm-route-{name}", daemon=True).start()
+        return future
+
+
+def get_router() -> LLMRouter:
+    """
+    进程内共用的大模型路由，首次调用时按环境变量建立
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = LLMRouter.from_env()
+    return _default
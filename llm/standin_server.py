@@ -0,0 +1,419 @@
+"""
+本模块包含 本地大模型替身服务
+
+不依赖dashscope与网络，提供与OpenAI兼容的 /v1/chat/completions 接口：按系统消息识别 Prompt 中的模板，
+用规则从用户消息中生成格式正确的回复（分类编号、二维字段列表、小区名单、环境描述、增强信息JSON等），
+相同的消息总是得到相同的回复；延迟按对数正态分布注入，并可按比例返回错误，随机数由种子决定。
+QianwenManager 设置 SNAPROP_LLM_PROVIDER=local 后即调用本服务，可在隔离的机器上测量整个应用的吞吐与尾延迟。
+
+用法:
+    python -m llm.standin_server                                   # 监听 127.0.0.1:8790，不注入延迟
+    python -m llm.standin_server --latency-ms 800 --latency-sigma 0.4 --error-rate 0.01
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm.output_parser import OutputParseError, parse_string_list
+from llm.prompt import Prompt
+from llm.prompt_budget import estimate_tokens
+from telemetry.logs import get_logger
+
+logger = get_logger("llm.standin")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8790
+
+CITIES = ("北京", "上海", "天津", "重庆", "广州", "深圳", "杭州", "南京", "苏州", "成都", "武汉", "西安", "长沙",
+          "郑州", "青岛", "宁波", "无锡", "厦门", "合肥", "济南", "福州", "东莞", "佛山", "昆明", "沈阳", "大连")
+ESTATE_PATTERN = re.compile(r"[一-龥]{2,12}?(?:小区|花园|家园|新村|公寓|雅苑|名苑|苑|园|庭|府|城|湾|邸|轩|墅|居)")
+ESTATE_PREFIX = re.compile(r"^(?:我家|我的房子|房子|房屋|目标住宅)?(?:在|位于|坐落于?|住在)?")
+DISTRICT_PREFIX = re.compile(r"^[一-龥]{1,4}?[区县]")
+ESTATE_SUFFIX = re.compile(r"(?:[（(][^）)]*[）)]|[一二三四五六七八九十\d]+期|[东西南北中A-Za-z]区)+$")
+AREA_PATTERNS = (re.compile(r"(\d+(?:\.\d+)?)\s*(?:平方米|平米|平|㎡|m2)"), re.compile(r"面积.{0,40}?(\d{2,4}\.\d+)"))
+HOUSE_TYPE_PATTERN = re.compile(r"(\d)室(\d)厅(?:(\d)厨)?(?:(\d)卫)?")
+YEAR_PATTERN = re.compile(r"((?:19|20)\d{2})\s*年")
+FLOOR_RATIO_PATTERNS = (re.compile(r"(\d+)\s*[/／]\s*(\d+)\s*层"), re.compile(r"第?(\d+)层.{0,6}?共(\d+)层"))
+GREEN_RATE_PATTERNS = (re.compile(r"绿化率\D{0,4}?(\d+(?:\.\d+)?)\s*[%％]"), re.compile(r"绿化率\D{0,4}?(0\.\d+)"))
+
+# 分类规则按顺序匹配，返回 MessageType 的值
+CLASSIFY_RULES = (
+    (re.compile(r"报告"), 3),
+    (re.compile(r"没问题|无误|确认|正确|对的|没错"), 4),
+    (re.compile(r"估价|估值|估一下|多少钱|值多少|单价|总价|价格"), 2),
+    (re.compile(r"查看|看看|已获得|目前.{0,4}信息|有哪些信息"), 5),
+    (re.compile(r"小区|平米|平方|㎡|室|厅|楼层|装修|精装|简装|毛坯|绿化|建成|年代|坐落|面积"), 1),
+)
+
+QUESTIONS = {
+    "house_location": "房子在哪个小区",
+    "city": "在哪个城市",
+    "house_area": "面积大概多少平",
+    "house_type": "是几室几厅几卫",
+    "house_year": "是哪一年建成的",
+    "house_structure": "是平层还是复式",
+    "house_floor": "在低楼层、中楼层还是高楼层",
+    "house_decorating": "装修情况怎么样",
+    "green_rate": "小区的绿化率大概是多少"
+}
+
+
+def _prefix(template: str) -> str:
+    return template.split("{")[0]
+
+
+def _requested_keys(system: str, template: str, end: str) -> list:
+    """系统消息中 {lists} 位置填入的字段名"""
+    rest = system[len(_prefix(template)):]
+    return [key.strip() for key in rest.split(end)[0].strip("。").split(",") if key.strip()]
+
+
+def _find_city(message: str):
+    for city in CITIES:
+        if city in message:
+            return city
+    match = re.search(r"([一-龥]{2,3})市", message)
+    return match.group(1) if match else None
+
+
+def _find_location(message: str, city):
+    for match in ESTATE_PATTERN.finditer(message):
+        name = ESTATE_PREFIX.sub("", match.group(0))
+        if city:
+            name = re.sub(rf"^{city}市?", "", name)
+        name = DISTRICT_PREFIX.sub("", name)
+        if len(name) >= 2:
+            return name
+    return None
+
+
+def _find_floor(message: str):
+    match = re.search(r"([低中高])楼?层", message)
+    if match:
+        return f"{match.group(1)}楼层"
+    for pattern in FLOOR_RATIO_PATTERNS:
+        match = pattern.search(message)
+        if match and int(match.group(2)) > 0:
+            ratio = int(match.group(1)) / int(match.group(2))
+            return "低楼层" if ratio < 0.33 else "中楼层" if ratio <= 0.66 else "高楼层"
+    return None
+
+
+def _find_green_rate(message: str):
+    for i, pattern in enumerate(GREEN_RATE_PATTERNS):
+        match = pattern.search(message)
+        if match:
+            value = float(match.group(1))
+            return round(value / 100, 4) if i == 0 else value
+    return None
+
+
+def extract_fields(message: str) -> dict:
+    """
+    用规则从消息中提取住宅信息
+    :param message: 用户消息或产证表格
+    :return: {字段名: 值}，只包含找到的字段
+    """
+    city = _find_city(message)
+    fields = {"house_location": _find_location(message, city), "city": city}
+    for pattern in AREA_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            fields["house_area"] = float(match.group(1))
+            break
+    match = HOUSE_TYPE_PATTERN.search(message)
+    if match:
+        rooms, halls, kitchens, baths = match.groups()
+        fields["house_type"] = f"{rooms}室{halls}厅{kitchens or 1}厨{baths or 1}卫"
+    match = YEAR_PATTERN.search(message)
+    if match:
+        fields["house_year"] = int(match.group(1))
+    match = re.search(r"复式|跃层|平层", message)
+    if match:
+        fields["house_structure"] = "平层" if match.group(0) == "平层" else "复式"
+    fields["house_floor"] = _find_floor(message)
+    match = re.search(r"精装|豪装|简装|毛坯", message)
+    if match:
+        fields["house_decorating"] = "精装" if match.group(0) == "豪装" else match.group(0)
+    fields["green_rate"] = _find_green_rate(message)
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def _parse_sections(message: str) -> dict:
+    """LLMEnhancer 输入数据中的各段：{段名: JSON值}"""
+    sections = {}
+    for line in message.splitlines():
+        name, sep, text = line.partition(": ")
+        if not sep:
+            continue
+        try:
+            sections[name.strip()] = json.loads(text)
+        except ValueError:
+            continue
+    return sections
+
+
+class StandInModel:
+    """
+    规则回复 类：按系统消息识别模板，生成对应格式的回复
+    """
+    def __init__(self):
+        from llm.llm_enhancer import system_prompt
+
+        # 带 {lists} 等占位符的模板按占位符之前的部分匹配
+        self._routes = [
+            ("classify_message", lambda system: system == Prompt.PROMPT_CLASSIFY_MESSAGE, self.classify),
+            ("respond_null", lambda system: system == Prompt.PROMPT_RESPOND_NULL, self.respond_null),
+            ("respond_info", lambda system: system.startswith(_prefix(Prompt.PROMPT_RESPOND_INFO)),
+             self.respond_info),
+            ("respond_table", lambda system: system.startswith(_prefix(Prompt.PROMPT_RESPOND_TABLE)),
+             self.respond_table),
+            ("respond_value", lambda system: system.startswith(_prefix(Prompt.PROMPT_RESPOND_VALUE)),
+             self.respond_value),
+            ("get_near_loc", lambda system: system == Prompt.PROMPT_NEAR_LOC, self.near_loc),
+            ("get_environment", lambda system: system.startswith(_prefix(Prompt.PROMPT_NEAR_LOC_SHORT)),
+             self.environment),
+            ("enhance", lambda system: system == system_prompt(), self.enhance),
+        ]
+
+    def route(self, system: str) -> str:
+        """系统消息对应的模板名，无法识别时为 unknown"""
+        for name, matches, _ in self._routes:
+            if matches(system):
+                return name
+        return "unknown"
+
+    def respond(self, system: str, user: str):
+        """
+        :return: (模板名, 回复)
+        """
+        for name, matches, respond in self._routes:
+            if matches(system):
+                return name, respond(system, user)
+        return "unknown", "好的。"
+
+    @staticmethod
+    def classify(system, user):
+        for pattern, value in CLASSIFY_RULES:
+            if pattern.search(user):
+                return str(value)
+        return "0"
+
+    @staticmethod
+    def respond_null(system, user):
+        return "您好，我是房产估价助手，请告诉我您想评估的住宅信息，例如小区名称、面积、房型和建成年份。"
+
+    @staticmethod
+    def respond_info(system, user):
+        keys = _requested_keys(system, Prompt.PROMPT_RESPOND_INFO, "这里列举")
+        fields = extract_fields(user)
+        return str([[key, fields[key]] for key in keys if key in fields])
+
+    @staticmethod
+    def respond_table(system, user):
+        keys = _requested_keys(system, Prompt.PROMPT_RESPOND_TABLE, "这里列举")
+        fields = extract_fields(user)
+        return str([[key, fields[key]] for key in keys if key in fields])
+
+    @staticmethod
+    def respond_value(system, user):
+        keys = _requested_keys(system, Prompt.PROMPT_RESPOND_VALUE, "其中")
+        questions = [QUESTIONS[key] for key in keys if key in QUESTIONS]
+        if not questions:
+            return "请问还有其他需要补充的住宅信息吗？"
+        return f"还想再了解一下：{'，'.join(questions)}？"
+
+    @staticmethod
+    def near_loc(system, user):
+        try:
+            names = parse_string_list(user)
+        except OutputParseError:
+            names = []
+        estates = []
+        for name in names:
+            name = ESTATE_SUFFIX.sub("", name) or name
+            if name not in estates:
+                estates.append(name)
+        return str(estates)
+
+    @staticmethod
+    def environment(system, user):
+        match = re.search(r"住宅区有(.*?),医院有(.*?)，学校有(.*?)，请仿照", system, re.S)
+        if not match:
+            return "区域范围内住宅区较多，各类医院、学校等配套完善。"
+        places, hospitals, schools = ([name for name in group.split(",") if name] for group in match.groups())
+        facilities = "、".join(hospitals[:1] + schools[:1]) or "各类医院、学校"
+        estates = f"有{'、'.join(places[:3])}等住宅区，" if places else "住宅区较多，"
+        return f"区域范围内{estates}{facilities}等配套完善。"
+
+    @staticmethod
+    def enhance(system, user):
+        sections = _parse_sections(user)
+        text = sections.get("文本特征") or {}
+        geo = sections.get("地理位置") or {}
+        pois = sections.get("设施评分") or {}
+        value_factors = []
+        for category, items in pois.items():
+            if items:
+                nearest = items[0]
+                value_factors.append({"factor": category,
+                                      "impact": f"最近的{nearest.get('name', '')}约{nearest.get('distance', '')}米",
+                                      "weight": round(1 / max(len(pois), 1), 2)})
+        return json.dumps({
+            "property_info": {
+                "location": text.get("house_location") or geo.get("address", ""),
+                "area": text.get("house_area"),
+                "type": text.get("house_type", ""),
+                "year": text.get("house_year"),
+                "floor": text.get("house_floor", ""),
+                "decoration": text.get("house_decorating", ""),
+                "structure": text.get("house_structure", "")
+            },
+            "consistency_check": {"conflicts": [], "resolutions": []},
+            "value_factors": value_factors,
+            "market_trends": {"current_price_level": "持平", "price_trend": "平稳", "liquidity": "一般",
+                              "policy_impact": "无明显影响"},
+            "estimated_price_range": {"low": None, "high": None, "confidence": 0}
+        }, ensure_ascii=False)
+
+
+class FaultInjector:
+    """
+    延迟与错误注入：延迟服从中位数为 latency_ms 的对数正态分布，按 error_rate 的比例返回错误
+    """
+    def __init__(self, latency_ms: float = 0.0, latency_sigma: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        :return: (延迟秒数, 是否返回错误)
+        """
+        with self._lock:
+            delay = self.latency_ms * math.exp(self.latency_sigma * self._rng.gauss(0, 1)) / 1000
+            failed = self._rng.random() < self.error_rate
+        return delay, failed
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    本地大模型替身服务
+    """
+    daemon_threads = True
+
+    def __init__(self, address, model: StandInModel = None, faults: FaultInjector = None):
+        self.model = model or StandInModel()
+        self.faults = faults or FaultInjector()
+        self.stats = Counter()  # "模板名" / "模板名:error" -> 次数
+        self._stats_lock = threading.Lock()
+        super().__init__(address, _Handler)
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/stats":
+            with self.server._stats_lock:
+                self._send(200, dict(self.server.stats))
+        else:
+            self._send(404, {"error": {"message": f"未知路径: {self.path}", "type": "not_found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send(404, {"error": {"message": f"未知路径: {self.path}", "type": "not_found"}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages = body["messages"]
+            system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+            user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": {"message": f"请求格式错误: {str(e)}", "type": "invalid_request_error"}})
+            return
+
+        delay, failed = self.server.faults.draw()
+        if delay > 0:
+            time.sleep(delay)
+        route = self.server.model.route(system)
+        if failed:
+            self.server.count(f"{route}:error")
+            self._send(self.server.faults.error_status,
+                       {"error": {"message": "注入的错误", "type": "standin_injected_error"}})
+            return
+
+        route, text = self.server.model.respond(system, user)
+        self.server.count(route)
+        prompt_tokens = estimate_tokens(system) + estimate_tokens(user)
+        completion_tokens = estimate_tokens(text)
+        self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "standin"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **fault_options) -> StandInServer:
+    """
+    在后台线程启动替身服务
+    :param fault_options: 传给 FaultInjector 的参数
+    :return: StandInServer，用 server_address 取实际端口（port=0 时随机分配），shutdown() 停止
+    """
+    server = StandInServer((host, port), faults=FaultInjector(**fault_options))
+    threading.Thread(target=server.serve_forever, name="llm-standin", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地大模型替身服务（OpenAI兼容接口）")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="对数正态分布的sigma，越大尾延迟越长")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的比例")
+    parser.add_argument("--error-status", type=int, default=500, help="错误的HTTP状态码，如429、500、503")
+    parser.add_argument("--seed", type=int, default=0, help="延迟与错误的随机种子")
+    args = parser.parse_args()
+
+    standin = StandInServer((args.host, args.port), faults=FaultInjector(
+        args.latency_ms, args.latency_sigma, args.error_rate, args.error_status, args.seed))
+    print(f"大模型替身服务: http://{args.host}:{standin.server_address[1]}/v1")
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server_close()
@@ -6,61 +6,102 @@ import os
 import sys
 import json
 import argparse
+import socket
+import socketserver
+import threading
 from datetime import datetime
 
 # 确保可以导入其他模块
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-try:
-    from llm.multimodal_encoder import MultimodalEncoder
-    from llm.llm_enhancer import LLMEnhancer
-    from rules.differentiable_rule import DifferentiableRuleLearningFramework, create_example_rules
-    from price.imca import IMCA
-except ImportError as e:
-    print(f"导入模块失败: {str(e)}")
-    print("请确保已安装所有依赖项，并且所有模块都存在")
-    sys.exit(1)
+# 常驻进程（daemon）默认监听地址
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.environ.get("SNAPROP_DAEMON_PORT", 8765))
+
 
 class PropertyValuationSystem:
     """
     房产估值系统
+
+    各子系统（多模态编码器、LLM增强器、规则框架、IMCA）在首次使用时才导入并构建，
+    依赖的PIL、numpy、pandas、dashscope等重型库也随之延迟导入。
     """
+    RULES_DIR = os.path.join("rules", "trained_rules")
+
     def __init__(self):
         """初始化房产估值系统"""
-        print("初始化房产估值系统...")
-        
-        # 创建多模态编码器
-        self.multimodal_encoder = MultimodalEncoder()
-        
-        # 创建LLM增强器
-        self.llm_enhancer = LLMEnhancer()
-        
-        # 创建规则框架
-        self.rule_framework = None
+        self._multimodal_encoder = None
+        self._llm_enhancer = None
+        self._rule_framework = None
+        self._rule_framework_ready = False
+        self._imca = None
+        self._report_catalog = None
+
+    @property
+    def multimodal_encoder(self):
+        """多模态编码器"""
+        if self._multimodal_encoder is None:
+            from llm.multimodal_encoder import MultimodalEncoder
+            self._multimodal_encoder = MultimodalEncoder()
+        return self._multimodal_encoder
+
+    @property
+    def llm_enhancer(self):
+        """LLM增强器"""
+        if self._llm_enhancer is None:
+            from llm.llm_enhancer import LLMEnhancer
+            self._llm_enhancer = LLMEnhancer()
+        return self._llm_enhancer
+
+    @property
+    def rule_framework(self):
+        """规则框架，初始化失败时为None"""
+        if not self._rule_framework_ready:
+            self._rule_framework_ready = True
+            self._rule_framework = self._create_rule_framework()
+        return self._rule_framework
+
+    @property
+    def imca(self):
+        """IMCA估值器"""
+        if self._imca is None:
+            from price.imca import IMCA
+            self._imca = IMCA(rule_framework=self.rule_framework)
+        return self._imca
+
+    @property
+    def report_catalog(self):
+        """报告目录索引"""
+        if self._report_catalog is None:
+            from database.report_catalog import ReportCatalog
+            self._report_catalog = ReportCatalog(os.path.join("static", "reports"))
+        return self._report_catalog
+
+    def _create_rule_framework(self):
+        """
+        加载训练好的规则框架，不存在时在内存中创建示例规则（不写盘，由训练流程负责保存）
+
+        Returns:
+            DifferentiableRuleLearningFramework: 规则框架，失败时为None
+        """
         try:
-            # 尝试加载规则框架
-            rules_dir = os.path.join("rules", "trained_rules")
-            if os.path.exists(rules_dir):
-                self.rule_framework = DifferentiableRuleLearningFramework.load(rules_dir)
+            from rules.differentiable_rule import DifferentiableRuleLearningFramework, create_example_rules
+            if os.path.exists(self.RULES_DIR):
+                framework = DifferentiableRuleLearningFramework.load(self.RULES_DIR)
                 print("已加载训练好的规则框架")
             else:
-                # 创建示例规则
                 print("创建示例规则框架...")
-                self.rule_framework = DifferentiableRuleLearningFramework()
-                example_rules = create_example_rules()
-                self.rule_framework.add_rule_set(example_rules)
-                
-                # 保存示例规则
-                os.makedirs(rules_dir, exist_ok=True)
-                self.rule_framework.save(rules_dir)
-                print("已创建并保存示例规则框架")
+                framework = DifferentiableRuleLearningFramework()
+                framework.add_rule_set(create_example_rules())
+            return framework
         except Exception as e:
             print(f"初始化规则框架失败: {str(e)}")
-            self.rule_framework = None
-        
-        # 创建IMCA估值器
-        self.imca = IMCA(rule_framework=self.rule_framework)
-        
+            return None
+
+    def warm_up(self):
+        """预先构建所有子系统（常驻进程启动时调用）"""
+        print("初始化房产估值系统...")
+        _ = self.multimodal_encoder, self.llm_enhancer, self.imca
         print("房产估值系统初始化完成")
     
     def process_property_data(self, property_data):
@@ -70,7 +111,7 @@ class PropertyValuationSystem:
         Args:
             property_data: 房产数据，包含以下字段：
                 - property_cert_image: 房产证图片路径（可选）
-                - property_photo: 房屋外观图片路径（可选）
+                - property_photo: 房屋外观图片路径，或多张照片的路径列表（可选）
                 - property_text: 房产描述文本（可选）
                 - address: 房产地址
                 - city: 所在城市
@@ -94,6 +135,43 @@ class PropertyValuationSystem:
         
         return enhanced_result
     
+    def find_comparable_cases(self, city, target_property, house_type, house_structure="平层", address=""):
+        """
+        从所在城市的案例表精筛可比案例，转为IMCA的案例格式（带照片在特征库中的归属）
+        
+        Args:
+            city: 所在城市
+            target_property: 目标房产数据（size, floor, fitment, built_time）
+            house_type: 房型，如 3室2厅1厨2卫
+            house_structure: 产品形态
+            address: 小区地址
+            
+        Returns:
+            list: 可比案例；城市没有案例表、房型无法解析或查询失败时为空列表
+        """
+        from database.mysql_manager import MySQLManager
+        from price import parsing
+        
+        table = MySQLManager.city_tables.get((city or "").removesuffix("市"))
+        if not table or parsing.house_type_counts(house_type or "") is None:
+            return []
+        try:
+            from config.mysql_config import mysql_host, mysql_db, mysql_port, mysql_username, mysql_password
+            from price.careful_selection import careful_selection
+            from price.imca import case_from_record
+            
+            selection = careful_selection(username=mysql_username, password=mysql_password, host=mysql_host,
+                                          port=mysql_port, database=mysql_db, table=table,
+                                          house_floor=target_property.get("floor", "中楼层"),
+                                          house_area=target_property["size"], house_type=house_type,
+                                          house_decoration=target_property.get("fitment", "简装"),
+                                          house_year=parsing.parse_date(target_property["built_time"]).year,
+                                          house_structure=house_structure, house_loc=address)
+            return [case_from_record(record, table) for record in selection.selction()]
+        except Exception as e:
+            print(f"精筛可比案例失败: {str(e)}")
+            return []
+    
     def estimate_property_value(self, target_property, comparable_cases=None):
         """
         估算房产价值
@@ -187,35 +265,29 @@ class PropertyValuationSystem:
         # 保存报告
         with open(report_path, 'w', encoding='utf-8') as f:
             json.dump(report_data, f, ensure_ascii=False, indent=2)
+        self.report_catalog.add(report_filename, report_data)
         
         print(f"报告已生成: {report_path}")
         return report_path
 
-def main():
-    """主函数"""
-    parser = argparse.ArgumentParser(description="房估宝 - 房产估值新范式")
-    parser.add_argument("--address", help="房产地址", required=True)
-    parser.add_argument("--city", help="所在城市", required=True)
-    parser.add_argument("--area", help="房屋面积（平方米）", type=float, required=True)
-    parser.add_argument("--floor", help="楼层（低楼层/中楼层/高楼层）", default="中楼层")
-    parser.add_argument("--fitment", help="装修情况（毛坯/简装/精装）", default="简装")
-    parser.add_argument("--year", help="建成年份", type=int, default=2015)
-    parser.add_argument("--cert", help="房产证图片路径")
-    parser.add_argument("--photo", help="房屋外观图片路径")
-    parser.add_argument("--text", help="房产描述文本")
-    
-    args = parser.parse_args()
-    
-    # 创建房产估值系统
-    system = PropertyValuationSystem()
-    
+def run_valuation(system, params):
+    """
+    执行一次完整估值：处理房产数据、估算价值并生成报告
+
+    Args:
+        system: PropertyValuationSystem
+        params: 估值参数，包含 address, city, area, floor, fitment, year, house_type, structure, cert, photo, text
+
+    Returns:
+        dict: 估值结果，附带 report_path
+    """
     # 准备房产数据
     property_data = {
-        "address": args.address,
-        "city": args.city,
-        "property_cert_image": args.cert,
-        "property_photo": args.photo,
-        "property_text": args.text
+        "address": params["address"],
+        "city": params["city"],
+        "property_cert_image": params.get("cert"),
+        "property_photo": params.get("photo"),
+        "property_text": params.get("text")
     }
     
     # 处理房产数据
@@ -223,19 +295,152 @@ def main():
     
     # 准备目标房产数据
     target_property = {
-        "size": args.area,
-        "floor": args.floor,
-        "fitment": args.fitment,
-        "built_time": f"{args.year}-01-01",
+        "size": params["area"],
+        "floor": params.get("floor", "中楼层"),
+        "fitment": params.get("fitment", "简装"),
+        "built_time": f"{params.get('year', 2015)}-01-01",
         "green_rate": processed_data.get("enhanced_data", {}).get("property_info", {}).get("green_rate", 0.3),
-        "transaction_type": 1
+        "transaction_type": 1,
+        # 照片特征向量，可比案例在照片特征库中有照片时计入视觉相似度
+        "visual_features": processed_data.get("original_data", {}).get("visual_features", {}).get("visual_features")
     }
     
+    # 精筛可比案例，房型未提供时使用文本中提取的房型
+    house_type = params.get("house_type") or processed_data.get("original_data", {}).get(
+        "structured_info", {}).get("house_type")
+    comparable_cases = system.find_comparable_cases(params["city"], target_property, house_type,
+                                                    params.get("structure") or "平层", params["address"])
+    
     # 估算房产价值
-    estimation_result = system.estimate_property_value(target_property)
+    estimation_result = system.estimate_property_value(target_property, comparable_cases)
     
     # 生成报告
     report_path = system.generate_report(property_data, estimation_result)
+    # 常驻进程与请求方的工作目录可能不同，返回绝对路径
+    return {**estimation_result, "report_path": os.path.abspath(report_path)}
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    """常驻进程请求处理：每个连接一行JSON请求、一行JSON响应"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            with self.server.lock:
+                result = run_valuation(self.server.system, request)
+            # 在 try 内序列化，结果中有无法转为JSON的值时也返回错误响应，而不是断开连接
+            line = json.dumps({"success": True, "result": result}, ensure_ascii=False)
+        except Exception as e:
+            line = json.dumps({"success": False, "error": str(e)}, ensure_ascii=False)
+        self.wfile.write((line + "\n").encode("utf-8"))
+
+
+class ValuationDaemon(socketserver.ThreadingTCPServer):
+    """
+    常驻估值进程，保持已预热的PropertyValuationSystem，仅监听本机地址
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, system=None):
+        super().__init__((host, port), _DaemonHandler)
+        self.system = system or PropertyValuationSystem()
+        self.lock = threading.Lock()
+
+
+def serve(host=DAEMON_HOST, port=DAEMON_PORT):
+    """
+    启动常驻估值进程
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+    """
+    system = PropertyValuationSystem()
+    system.warm_up()
+    with ValuationDaemon(host, port, system) as server:
+        print(f"估值常驻进程已启动: {host}:{port}")
+        server.serve_forever()
+
+
+def request_daemon(params, host=DAEMON_HOST, port=DAEMON_PORT, timeout=300):
+    """
+    向常驻进程发送估值请求
+
+    Args:
+        params: 估值参数
+        host: 常驻进程地址
+        port: 常驻进程端口
+        timeout: 等待结果的超时时间（秒）
+
+    Returns:
+        dict: 估值结果；常驻进程未运行时返回None
+    """
+    try:
+        conn = socket.create_connection((host, port), timeout=0.2)
+    except OSError:
+        return None
+    with conn:
+        conn.settimeout(timeout)
+        conn.sendall((json.dumps(params, ensure_ascii=False) + "\n").encode("utf-8"))
+        with conn.makefile("rb") as f:
+            line = f.readline().decode("utf-8")
+    if not line.strip():
+        raise RuntimeError("常驻进程未返回结果")
+    response = json.loads(line)
+    if not response.get("success"):
+        raise RuntimeError(response.get("error"))
+    return response["result"]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="房估宝 - 房产估值新范式")
+    parser.add_argument("--address", help="房产地址")
+    parser.add_argument("--city", help="所在城市")
+    parser.add_argument("--area", help="房屋面积（平方米）", type=float)
+    parser.add_argument("--floor", help="楼层（低楼层/中楼层/高楼层）", default="中楼层")
+    parser.add_argument("--fitment", help="装修情况（毛坯/简装/精装）", default="简装")
+    parser.add_argument("--year", help="建成年份", type=int, default=2015)
+    parser.add_argument("--house-type", help="房型（如 3室2厅1厨2卫），用于从案例表精筛可比案例")
+    parser.add_argument("--structure", help="产品形态", default="平层")
+    parser.add_argument("--cert", help="房产证图片路径")
+    parser.add_argument("--photo", help="房屋外观图片路径")
+    parser.add_argument("--text", help="房产描述文本")
+    parser.add_argument("--serve", help="以常驻进程方式运行，接受本机估值请求", action="store_true")
+    parser.add_argument("--port", help="常驻进程端口", type=int, default=DAEMON_PORT)
+    parser.add_argument("--no-daemon", help="不使用常驻进程，直接在本进程内估值", action="store_true")
+    
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(port=args.port)
+        return
+
+    missing = [name for name in ("address", "city", "area") if getattr(args, name) is None]
+    if missing:
+        parser.error("缺少参数: " + ", ".join(f"--{name}" for name in missing))
+
+    # 常驻进程的工作目录可能与本进程不同，图片路径转为绝对路径再发送
+    params = {
+        "address": args.address,
+        "city": args.city,
+        "area": args.area,
+        "floor": args.floor,
+        "fitment": args.fitment,
+        "year": args.year,
+        "house_type": args.house_type,
+        "structure": args.structure,
+        "cert": os.path.abspath(args.cert) if args.cert else None,
+        "photo": os.path.abspath(args.photo) if args.photo else None,
+        "text": args.text
+    }
+
+    # 优先交给已预热的常驻进程，未运行时在本进程内估值
+    estimation_result = None if args.no_daemon else request_daemon(params, port=args.port)
+    if estimation_result is None:
+        estimation_result = run_valuation(PropertyValuationSystem(), params)
+    report_path = estimation_result["report_path"]
     
     # 打印估值结果
     print("\n===== 房产估值结果 =====")
@@ -247,4 +452,4 @@ def main():
     print(f"\n报告已保存至: {report_path}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,4 +1,86 @@
 import datetime
+import numpy as np
+from price import parsing
+
+DATE_KEYS = ("transaction_time", "built_time")
+
+
+def _to_ordinal(value, time_str_model) -> int:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.toordinal()
+    return parsing.date_ordinal(value, time_str_model)
+
+
+def parse_cases(cases: list, keys, time_str_model: str = '%Y-%m-%d') -> dict:
+    """
+    把房产信息列表按key转换为数组，日期转换为序数日（由 price.parsing 缓存，同一字符串只解析一次）
+    :param cases: 房产信息列表
+    :param keys: 需要转换的key
+    :param time_str_model: 日期格式
+    :return: {key: (float64数组, 是否有值的布尔数组)}，缺失或为None的位置值为NaN
+    """
+    arrays = {}
+    for key in keys:
+        values = np.full(len(cases), np.nan)
+        present = np.zeros(len(cases), dtype=bool)
+        for i, case in enumerate(cases):
+            value = case.get(key)
+            if value is None:
+                continue
+            if key in DATE_KEYS:
+                value = _to_ordinal(value, time_str_model)
+            values[i] = value
+            present[i] = True
+        arrays[key] = (values, present)
+    return arrays
+
+
+def _step(diff, low, high):
+    """差值小于low为0档，不超过high为1档，否则为2档"""
+    return np.select([diff < low, diff <= high], [0, 1], default=2)
+
+
+def adjustment_factors(cases: dict, target: dict, unit_adjust_table: dict) -> np.ndarray:
+    """
+    计算各比较房产相对目标房产的修正系数，各因子按阶梯规则一次性对整列计算
+    :param cases: parse_cases 的结果
+    :param target: parse_cases 的结果，长度为1（单个目标），或与比较房产可广播的形状（批量目标）
+    :param unit_adjust_table: 单位因子调整幅度
+    :return: 修正系数数组
+    """
+    shape = np.broadcast_shapes(*(values.shape for values, _ in cases.values()),
+                                *(values.shape for values, _ in target.values()))
+    factor = np.ones(shape)
+    with np.errstate(invalid='ignore'):
+        for key, (c, c_present) in cases.items():
+            if key not in target or key not in unit_adjust_table:
+                continue
+            t, t_present = target[key]
+            if not t_present.any():
+                continue
+            if key in ('transaction_type', 'fitment'):
+                diff = -(c - t)
+            elif key == 'transaction_time':
+                diff = np.digitize(np.abs(c - t) // 365, [1, 3])
+                diff = np.where(c > t, -diff, diff)
+            elif key == 'green_rate':
+                diff = _step(np.abs(c - t), 0.3, 0.5)
+                diff = np.where(c > t, -diff, diff)
+            elif key == 'built_time':
+                diff = np.abs(c - t) // 365 // 5
+                diff = np.where(c > t, -diff, diff)
+            elif key == 'floor':
+                diff = np.abs(c - t) // 5
+                diff = np.where(c > t, -diff, diff)
+            elif key == 'size':
+                diff = _step(np.abs(c - t) / t, 0.2, 0.5)
+                diff = np.where(c < t, -diff, diff)
+            else:
+                continue
+            # 任一方缺少该信息时不修正
+            diff = np.where(c_present & t_present, diff, 0)
+            factor = factor * (1.00 + diff * unit_adjust_table[key])
+    return factor
 
 
 class RealEstateValuation:
@@ -37,6 +119,7 @@ class RealEstateValuation:
         self.comparable_cases = []
         self.target_case = {}
         self.adjust_price_table = []
+        self._case_arrays = None  # 比较房产的数组形式，比较房产变化时重建
         if weights:
             self.unit_adjust_table.update(weights)
 
@@ -55,6 +138,14 @@ class RealEstateValuation:
         TODO:或许可以添加缺省赋予默认值（概率最大？），不然就是默认和目标房产相同
         """
         self.comparable_cases.append(case)
+        self._case_arrays = None
+
+    def set_comparable_cases(self, cases: list):
+        """
+        替换全部比较房产的信息。
+        """
+        self.comparable_cases = list(cases)
+        self._case_arrays = None
 
     def add_target_case(self, case: dict):
         """
@@ -63,78 +154,39 @@ class RealEstateValuation:
         """
         self.target_case = case
 
-    def adjust(self):
-        self.adjust_price_table = []
-        for case in self.comparable_cases:
-            factor = 1
-            for key in case.keys():
-                if key not in self.target_case.keys() or self.target_case[key] == None:
-                    continue
-                elif key == 'transaction_type':
-                    diff = -(case[key] - self.target_case[key])
-                elif key == 'transaction_time':
-                    date_case = datetime.datetime.strptime(case[key], self.time_str_model)
-                    date_target = datetime.datetime.strptime(self.target_case[key], self.time_str_model)
-                    date_diff = abs((date_case - date_target).days) // 365
-                    if date_diff < 1:
-                        diff = 0
-                    elif date_diff <= 2:
-                        diff = 1
-                    else:
-                        diff = 2
-                    if date_case > date_target: diff = -diff  #这里有疑问，房价总趋势不是涨吗，越近交易越贵吧？
-                elif key == 'green_rate':
-                    green_diff = abs(case[key] - self.target_case[key])
-                    if green_diff < 0.3:
-                        diff = 0
-                    elif green_diff <= 0.5:
-                        diff = 1
-                    else:
-                        diff = 2
-                    if case[key] > self.target_case[key]: diff = -diff
-                elif key == 'built_time':
-                    date_case = datetime.datetime.strptime(case[key], self.time_str_model)
-                    date_target = datetime.datetime.strptime(self.target_case[key], self.time_str_model)
-                    diff = abs((date_case - date_target).days) // 365 // 5
-                    if date_case > date_target: diff = -diff
-                elif key == 'floor':
-                    diff = abs(case[key] - self.target_case[key]) // 5
-                    if case[key] > self.target_case[key]: diff = -diff
-                elif key == 'size':
-                    size_diff = abs(case[key] - self.target_case[key]) / self.target_case[key]
-                    if size_diff < 0.2:
-                        diff = 0
-                    elif size_diff <= 0.5:
-                        diff = 1
-                    else:
-                        diff = 2
-                    if case[key] < self.target_case[key]: diff = -diff
-                elif key == 'fitment':
-                    diff = -(case[key] - self.target_case[key])
-                else:
-                    diff = 0
-                factor *= (1.00 + diff * self.unit_adjust_table[key])
-            try:
-                self.adjust_price_table.append(case['price'] * factor)
-            except:
-                if ("price" not in case.keys()):
-                    print(f"第{self.comparable_cases.index(case) + 1}个比较房产缺失价格信息")
-                    print(f"该房产信息：{case}")
-                pass
-            # print(factor,end=' ')
-        # print('\n')
-        # print(self.adjust_price_table)
+    def case_arrays(self) -> dict:
+        """
+        比较房产的数组形式（只在比较房产变化后重新解析）
+        """
+        if self._case_arrays is None:
+            self._case_arrays = parse_cases(self.comparable_cases, self.key_table, self.time_str_model)
+        return self._case_arrays
+
+    def adjust(self, unit_table: dict = None):
+        """
+        计算修正后的比较房产价格表
+        :param unit_table: 仅本次使用的单位因子调整幅度，不修改 unit_adjust_table
+        """
+        cases = self.case_arrays()
+        prices, has_price = cases["price"]
+        target = parse_cases([self.target_case], [k for k in self.key_table if k != "price"], self.time_str_model)
+        factors = adjustment_factors({k: v for k, v in cases.items() if k != "price"}, target,
+                                     {**self.unit_adjust_table, **(unit_table or {})})
+        for i in np.flatnonzero(~has_price):
+            print(f"第{i + 1}个比较房产缺失价格信息")
+            print(f"该房产信息：{self.comparable_cases[i]}")
+        self.adjust_price_table = (prices * factors)[has_price].tolist()
         return
 
     def evaluate(self, com_cases: list, target_case: dict, unit_table: dict = None):
         """
-        评估价格
+        评估价格，每次调用使用传入的比较房产，可重复调用
         """
-        for case in com_cases:
-            self.add_comparable_case(case)
+        self.set_comparable_cases(com_cases)
         self.add_target_case(target_case)
-        self.update_unit_table(unit_table)
-        self.adjust()
+        self.adjust(unit_table)
+        if not self.adjust_price_table:
+            raise ValueError("没有带价格信息的比较房产，无法估价")
         estimated_price = sum(self.adjust_price_table) / len(self.adjust_price_table)
         return estimated_price
 
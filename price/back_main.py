@@ -1,9 +1,11 @@
-import re
+import numpy as np
 import pandas as pd
-from price.careful_selection import careful_selection
-from price.RealEstateValuation import RealEstateValuation
+from price.careful_selection import careful_selection, rank_candidates, YEAR_WINDOW
+from price.RealEstateValuation import RealEstateValuation, parse_cases, adjustment_factors
+from price import parsing
 from record.record import Record
 from database.mysql_manager import MySQLManager
+from telemetry.tracing import traced
 
 
 #感觉写的很丑陋，后续可以统一成一个函数
@@ -14,31 +16,39 @@ def trans_type():
 
 
 def trans_fitment(str):
-    if "精装" in str:
-        return 1
-    elif "毛坯" in str:
-        return 0
-    return 0
+    return parsing.fitment(str)
 
 
 def trans_floor(str) -> int:
-    f = re.findall(r'\d+', str)
-    if "低" in str:
-        return int(f[0]) // 6
-    elif "中" in str:
-        return int(f[0]) // 2
-    elif "高" in str:
-        return 5 * int(f[0]) // 6
-    return 0
+    return parsing.floor_number(str)
 
 
 def trans_green_rate(str) -> float:
-    f = re.findall(r'\d+', str)
-    if "%" in str:
-        return int(f[0]) / 100
-    return 0
+    return parsing.green_rate(str)
 
 
+YEAR_BAND = 10  # 批量估价时按建成年代（10年一段）分组共用候选查询
+
+
+def trans_case(item, with_price=True) -> dict:
+    """
+    精筛结果的一条记录转换为市场比较法使用的房产信息
+    """
+    case = {
+        "transaction_type": trans_type(),
+        "transaction_time": item["transaction_time"],  # 因为默认挂牌，后续还要根据交易类型判断读取哪个时间
+        "green_rate": trans_green_rate(item["green_rate"]),
+        "built_time": f"{item['house_year']}-1-1",
+        "size": float(item['house_area']),
+        "fitment": trans_fitment(item['house_decoration']),
+        "floor": trans_floor(item['house_floor']),
+    }
+    if with_price:
+        case = {"price": item["u_price"], **case}
+    return case
+
+
+@traced("price.back_main")
 def back_main(city, house_floor, house_area, house_type, house_decoration, house_year, house_structure,
               house_loc, selection_weights=None):  #TODO：入参数未设置，待粗筛加入后可以只设置前端传来的待估价房屋具体信息
     selction_example = careful_selection(username=MySQLManager()._username, password=MySQLManager()._password,
@@ -55,30 +65,10 @@ def back_main(city, house_floor, house_area, house_type, house_decoration, house
     # print(df)
     # 市场比较法：
     # 目标房产信息（这个应该直接从前端/用户传过来，不用从精筛处传过来）
-    target_property = {
-        "transaction_type": trans_type(),
-        "transaction_time": df[0]["transaction_time"],  # 因为默认挂牌，后续还要根据交易类型判断读取哪个时间
-        "green_rate": trans_green_rate(df[0]["green_rate"]),
-        "built_time": f"{df[0]['house_year']}-1-1",
-        "size": float(df[0]['house_area']),
-        "fitment": trans_fitment(df[0]['house_decoration']),
-        "floor": trans_floor(df[0]['house_floor']),
-    }
+    target_property = trans_case(df[0], with_price=False)
     # print(target_property)
     # 比较房产信息
-    compare_cases = []
-    for i in df[1:]:
-        tmp = {
-            "price": i["u_price"],
-            "transaction_type": trans_type(),
-            "transaction_time": i["transaction_time"],  # 因为默认挂牌，后续还要根据交易类型判断读取哪个时间
-            "green_rate": trans_green_rate(i["green_rate"]),
-            "built_time": f"{i['house_year']}-1-1",
-            "size": float(i['house_area']),
-            "fitment": trans_fitment(i['house_decoration']),
-            "floor": trans_floor(i['house_floor']),
-        }
-        compare_cases.append(tmp)
+    compare_cases = [trans_case(i) for i in df[1:]]
     valuation_example = RealEstateValuation(weights=selection_weights)
     # 调用方法计算估价
     estimated_price = valuation_example.evaluate(compare_cases, target_property)
@@ -88,6 +78,84 @@ def back_main(city, house_floor, house_area, house_type, house_decoration, house
     return df, estimated_price  #返回精筛结果和估计房价
 
 
+@traced("price.back_main_batch")
+def back_main_batch(city, targets: list, selection_weights=None) -> list:
+    """
+    批量估价：同一小区、同一产品形态、同一建成年代段的目标共用一次候选查询，并在一次向量化计算中完成打分与修正
+    :param city: 城市
+    :param targets: 目标房产列表，每个为包含 house_floor, house_area, house_type, house_decoration, house_year,
+                    house_structure, house_loc 的字典
+    :param selection_weights: 单位因子调整幅度
+    :return: 与 targets 顺序一致的 [(精筛结果, 估计房价)]，每项与 back_main 的返回值相同；无可用案例时为 ([], 0.0)
+    """
+    groups = {}
+    for index, target in enumerate(targets):
+        key = (target['house_loc'], target['house_structure'], int(target['house_year']) // YEAR_BAND)
+        groups.setdefault(key, []).append(index)
+
+    manager = MySQLManager()
+    table = manager.get_table(city)
+    results = [([], 0.0)] * len(targets)
+    try:
+        for (house_loc, house_structure, _), indexes in groups.items():
+            group = [targets[i] for i in indexes]
+            first = group[0]
+            selection = careful_selection(username=manager._username, password=manager._password,
+                                          host=manager._host, port=manager._port, database=manager._db, table=table,
+                                          house_floor=first['house_floor'], house_area=first['house_area'],
+                                          house_type=first['house_type'],
+                                          house_decoration=first['house_decoration'],
+                                          house_year=first['house_year'], house_structure=house_structure,
+                                          house_loc=house_loc)
+            years = [int(target['house_year']) for target in group]
+            pool = selection.candidate_pool(min(years) - YEAR_WINDOW, max(years) + YEAR_WINDOW)
+            ranked = rank_candidates(pool, group, selection.today)
+            prices = estimate_batch(ranked, selection_weights)
+            for index, df, price in zip(indexes, ranked, prices):
+                results[index] = (df, price)
+    finally:
+        manager.close()
+    return results
+
+
+def estimate_batch(ranked: list, selection_weights=None) -> list:
+    """
+    对多组精筛结果一次性计算市场比较法估价，规则与 back_main 相同：每组第一条作为目标，其余作为比较房产
+    :param ranked: 精筛结果列表
+    :param selection_weights: 单位因子调整幅度
+    :return: 估计房价列表，比较房产不足时为0.0
+    """
+    valuation = RealEstateValuation(weights=selection_weights)
+    keys = [key for key in valuation.key_table if key != "price"]
+    targets, cases, owners = [], [], []
+    for owner, df in enumerate(ranked):
+        if len(df) < 2:
+            continue
+        targets.append(trans_case(df[0], with_price=False))
+        for item in df[1:]:
+            cases.append(trans_case(item))
+            owners.append(len(targets) - 1)
+    prices = [0.0] * len(ranked)
+    if not cases:
+        return prices
+
+    owners = np.array(owners)
+    target_arrays = {key: (values[owners], present[owners])
+                     for key, (values, present) in parse_cases(targets, keys, valuation.time_str_model).items()}
+    case_arrays = parse_cases(cases, valuation.key_table, valuation.time_str_model)
+    case_prices, has_price = case_arrays.pop("price")
+    factors = adjustment_factors(case_arrays, target_arrays, valuation.unit_adjust_table)
+    adjusted = np.where(has_price, case_prices * factors, 0.0)
+    totals = np.bincount(owners, weights=adjusted, minlength=len(targets))
+    counts = np.bincount(owners, weights=has_price, minlength=len(targets))
+    estimated = np.divide(totals, counts, out=np.zeros(len(targets)), where=counts > 0)
+
+    valued = [owner for owner, df in enumerate(ranked) if len(df) >= 2]
+    for position, owner in enumerate(valued):
+        prices[owner] = float(estimated[position])
+    return prices
+
+
 # 实例
 # if __name__ == "__main__":
 #     # 示例权重
@@ -1,10 +1,18 @@
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
 import pandas as pd
-import re
 import time
-from sklearn.preprocessing import MinMaxScaler
 import numpy as np
+import warnings
+from price import parsing
+from telemetry.tracing import span
+from telemetry.logs import get_logger
+
+logger = get_logger("price")
+
+YEAR_WINDOW = 5  # 粗筛：建成年份相差5年内
+DISTINCTION_COLUMNS = ['house_floor_distinction', 'house_area_distinction', 'house_type_distinction',
+                       'house_decorating_distinction', 'house_year_distinction', 'transaction_time_distinction']
+RANK_CHUNK_ELEMENTS = 2_000_000  # 批量打分时每块 目标数x候选数 的上限，控制中间数组的内存
 
 
 class careful_selection:
@@ -22,32 +30,16 @@ class careful_selection:
         self.today = time.strftime("%Y-%m-%d", time.localtime())
         #print(self.today)
 
+        from sqlalchemy import create_engine
+
         uri = f"mysql+mysqlconnector://{username}:{password}@{host}:{port}/{database}"
         self.engine = create_engine(uri)
 
     def house_floor_distinction(self, floor1, floor2):
-        if "低" in floor1:
-            floor1 = "低"
-        elif "中" in floor1:
-            floor1 = "中"
-        elif "高" in floor1:
-            floor1 = "高"
-        if "低" in floor2:
-            floor2 = "低"
-        elif "中" in floor2:
-            floor2 = "中"
-        elif "高" in floor2:
-            floor2 = "高"
-
-        if (floor1 == "低" and floor2 == "低") or (floor1 == "中" and floor2 == "中") or (
-                floor1 == "高" and floor2 == "高"):
-            return 0
-        elif (floor1 == "低" and floor2 == "中") or (floor1 == "中" and floor2 == "低") or (
-                floor1 == "中" and floor2 == "高") or (floor1 == "高" and floor2 == "中"):
-            return 1
-        elif (floor1 == "低" and floor2 == "高") or (floor1 == "高" and floor2 == "低"):
-            return 2
-        return 3
+        level1, level2 = parsing.floor_level(floor1), parsing.floor_level(floor2)
+        if level1 < 0 or level2 < 0:
+            return 3
+        return abs(level1 - level2)
 
     def house_area_distinction(self, area1, area2):
         return abs(area1 - area2)
@@ -58,34 +50,34 @@ class careful_selection:
         w_bathroom = 1
         w_kitchen = 1
 
-        pattern = r'(\d+)室(\d+)厅(\d+)厨(\d+)卫'
-        match1 = re.search(pattern, type1)
-        match2 = re.search(pattern, type2)
-        room1, hall1, kitchen1, bathroom1 = int(match1.group(1)), int(match1.group(2)), int(match1.group(3)), int(
-            match1.group(4))
-        room2, hall2, kitchen2, bathroom2 = int(match2.group(1)), int(match2.group(2)), int(match2.group(3)), int(
-            match2.group(4))
+        counts1, counts2 = parsing.house_type_counts(type1), parsing.house_type_counts(type2)
+        if counts1 is None or counts2 is None:
+            raise ValueError(f"无法解析房型: {type1 if counts1 is None else type2}")
+        room1, hall1, kitchen1, bathroom1 = counts1
+        room2, hall2, kitchen2, bathroom2 = counts2
         return w_room * abs(room1 - room2) + w_hall * abs(hall1 - hall2) + w_bathroom * abs(
             bathroom1 - bathroom2) + w_kitchen * abs(kitchen1 - kitchen2)
 
     def house_decorating_distinction(self, decoration1, decoration2):
-        if (decoration1 == "毛坯" and decoration2 == "毛坯") or (decoration1 == "简装" and decoration2 == "简装") or (
-                decoration1 == "精装" and decoration2 == "精装"):
-            return 0
-        elif (decoration1 == "毛坯" and decoration2 == "简装") or (decoration1 == "简装" and decoration2 == "毛坯") or (
-                decoration1 == "简装" and decoration2 == "精装") or (decoration1 == "精装" and decoration2 == "简装"):
-            return 1
-        elif (decoration1 == "毛坯" and decoration2 == "精装") or (decoration1 == "精装" and decoration2 == "毛坯"):
-            return 2
-        return 3
+        level1, level2 = parsing.decoration_level(decoration1), parsing.decoration_level(decoration2)
+        if level1 < 0 or level2 < 0:
+            return 3
+        return abs(level1 - level2)
 
     def house_year_distinction(self, year1, year2):
         return abs(int(year1) - int(year2))
 
     def transaction_time_distinction(self, date1, date2):
-        date1 = datetime.strptime(date1, "%Y-%m-%d")
-        date2 = datetime.strptime(date2, "%Y-%m-%d")
-        return abs(date1 - date2).days
+        return abs(parsing.date_ordinal(date1) - parsing.date_ordinal(date2))
+
+    def estate_mean_year(self):
+        """
+        小区统计中的平均建成年份，用于填补"未知"，没有该小区的统计时为None
+        """
+        from database.estate_stats import get_estate_stats
+
+        stats = get_estate_stats().get(self.table, self.house_loc)
+        return stats["mean_year"] if stats else None
 
     def selction(self) -> list:
         # 加入粗筛
@@ -100,17 +92,22 @@ class careful_selection:
             f" AND STR_TO_DATE(transaction_time, '%Y-%m-%d') >= STR_TO_DATE('{two_years_ago}', '%Y-%m-%d')"  # 近2年的交易记录
         )
         # TODO:粗筛有点问题
-        print(query)
+        logger.debug("粗筛查询", extra={"fields": {"query": query}})
 
-        df = pd.read_sql(query, self.engine)
+        with span("db.query", db_system="mysql", table=self.table) as query_span:
+            df = pd.read_sql(query, self.engine)
+            query_span.set_attribute("rows", len(df))
         # print("粗筛：")
         # print(df)
         features = ['house_floor', 'house_area', 'house_type', 'house_decoration', 'house_year',
                     'transaction_time']
         df = df[~df[features].apply(lambda row: row.astype(str).str.contains('暂无数据')).any(axis=1)]
         df['house_year'] = df['house_year'].replace('未知', np.nan)
-        mean_value = int(df['house_year'].dropna().astype(int).mean())
-        df['house_year'] = df['house_year'].replace(np.nan, mean_value)
+        if df['house_year'].isna().any():
+            mean_value = self.estate_mean_year()
+            if mean_value is None:
+                mean_value = int(df['house_year'].dropna().astype(int).mean())
+            df['house_year'] = df['house_year'].replace(np.nan, mean_value)
         df['house_year'] = df['house_year'].astype(int)
         # df = df.dropna()
         df['house_floor_distinction'] = df['house_floor'].apply(
@@ -126,6 +123,8 @@ class careful_selection:
         df['transaction_time_distinction'] = df['transaction_time'].apply(
             lambda x: self.transaction_time_distinction(x, self.today))
 
+        from sklearn.preprocessing import MinMaxScaler
+
         scaler = MinMaxScaler()
 
         columns_to_scale = ['house_floor_distinction', 'house_area_distinction', 'house_type_distinction',
@@ -148,6 +147,111 @@ class careful_selection:
         return df[:3].to_dict(orient='records')
         # df[:4].to_csv(f'{table}.csv', index=False,encoding='utf_8_sig')
 
+    def candidate_pool(self, year_min: int, year_max: int) -> pd.DataFrame:
+        """
+        粗筛出建成年份在 [year_min, year_max] 内的全部候选，供同一小区、同一产品形态的多个目标共用
+        :param year_min: 最早建成年份
+        :param year_max: 最晚建成年份
+        :return: 已去除"暂无数据"、以均值填补"未知"建成年份的候选
+        """
+        two_years_ago = (datetime.now() - timedelta(days=2 * 365)).strftime('%Y-%m-%d')
+
+        query = (
+            "SELECT *"
+            f" FROM {self.table}"
+            f" WHERE house_loc LIKE '仁恒森兰雅苑%'"  # 同一小区
+            f" AND CAST(house_year AS SIGNED) BETWEEN {int(year_min)} AND {int(year_max)}"  # 覆盖各目标的建成年份范围
+            f" AND house_structure = '{self.house_structure}'"  # 产品形态一致
+            f" AND STR_TO_DATE(transaction_time, '%Y-%m-%d') >= STR_TO_DATE('{two_years_ago}', '%Y-%m-%d')"  # 近2年的交易记录
+        )
+        logger.debug("批量粗筛查询", extra={"fields": {"query": query}})
+
+        with span("db.query", db_system="mysql", table=self.table) as query_span:
+            df = pd.read_sql(query, self.engine)
+            query_span.set_attribute("rows", len(df))
+        features = ['house_floor', 'house_area', 'house_type', 'house_decoration', 'house_year',
+                    'transaction_time']
+        df = df[~df[features].astype(str).apply(lambda column: column.str.contains('暂无数据')).any(axis=1)].copy()
+        years = pd.to_numeric(df['house_year'].replace('未知', np.nan), errors='coerce')
+        if years.isna().any():
+            mean_value = self.estate_mean_year()
+            if mean_value is None and years.notna().any():
+                mean_value = int(years.mean())
+            if mean_value is not None:
+                years = years.fillna(mean_value)
+        df['house_year'] = years.fillna(0).astype(int)
+        return df.reset_index(drop=True)
+
+
+def _house_type_counts(text) -> tuple:
+    counts = parsing.house_type_counts(text)
+    return (np.nan,) * 4 if counts is None else counts
+
+
+def rank_candidates(pool: pd.DataFrame, targets: list, today: str, top_n: int = 3) -> list:
+    """
+    对同一候选集批量打分，每个目标取差异最小的前 top_n 个
+    差异的计算与 careful_selection.selction 相同：六项差异分别在该目标建成年份5年内的候选上做最小-最大归一化后求和
+    :param pool: candidate_pool 的结果
+    :param targets: 目标列表，每个包含 house_floor, house_area, house_type, house_decoration, house_year
+    :param today: 估价日期，格式 %Y-%m-%d
+    :param top_n: 每个目标保留的案例数
+    :return: 与 targets 顺序一致的案例列表，每个案例为候选的字典并附带各项归一化差异与总差异 distinction
+    """
+    if pool.empty or not targets:
+        return [[] for _ in targets]
+
+    floors = np.array([parsing.floor_level(str(x)) for x in pool['house_floor']])
+    areas = pool['house_area'].astype(float).to_numpy()
+    types = np.array([_house_type_counts(str(x)) for x in pool['house_type']], dtype=float)
+    decorations = np.array([parsing.decoration_level(x) for x in pool['house_decoration']])
+    years = pool['house_year'].to_numpy(dtype=float)
+    days = np.abs(np.array([parsing.date_ordinal(x) for x in pool['transaction_time']], dtype=float)
+                  - parsing.date_ordinal(today))
+
+    t_floors = np.array([parsing.floor_level(str(t['house_floor'])) for t in targets])[:, None]
+    t_areas = np.array([float(t['house_area']) for t in targets])[:, None]
+    t_types = np.array([_house_type_counts(str(t['house_type'])) for t in targets], dtype=float)
+    t_decorations = np.array([parsing.decoration_level(t['house_decoration']) for t in targets])[:, None]
+    t_years = np.array([int(t['house_year']) for t in targets], dtype=float)[:, None]
+
+    records = pool.to_dict(orient='records')
+    ranked = []
+    chunk = max(1, RANK_CHUNK_ELEMENTS // len(pool))
+    for start in range(0, len(targets), chunk):
+        end = min(start + chunk, len(targets))
+        distinctions = np.stack([
+            np.where((floors >= 0) & (t_floors[start:end] >= 0), np.abs(floors - t_floors[start:end]), 3),
+            np.abs(areas - t_areas[start:end]),
+            np.abs(types[None, :, :] - t_types[start:end, None, :]).sum(axis=2),
+            np.where((decorations >= 0) & (t_decorations[start:end] >= 0),
+                     np.abs(decorations - t_decorations[start:end]), 3),
+            np.abs(years - t_years[start:end]),
+            np.broadcast_to(days, (end - start, len(pool)))
+        ]).astype(float)
+        eligible = (distinctions[4] <= YEAR_WINDOW) & ~np.isnan(distinctions[2])
+        distinctions[:, ~eligible] = np.nan
+        # 与 MinMaxScaler 相同：极差为0的列缩放后全为0
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            low = np.nanmin(distinctions, axis=2, keepdims=True)
+            spread = np.nanmax(distinctions, axis=2, keepdims=True) - low
+        scaled = (distinctions - low) / np.where(spread > 0, spread, 1)
+        total = scaled.sum(axis=0)
+        order = np.argsort(np.where(eligible, total, np.inf), axis=1, kind='stable')[:, :top_n]
+
+        for row, candidates in enumerate(order):
+            cases = []
+            for j in candidates:
+                if not eligible[row, j]:
+                    break
+                case = dict(records[j])
+                case.update({column: float(scaled[k, row, j]) for k, column in enumerate(DISTINCTION_COLUMNS)})
+                case['distinction'] = float(total[row, j])
+                cases.append(case)
+            ranked.append(cases)
+    return ranked
+
 # username = 'root'
 # password = '123456'
 # host = '127.0.0.1'
@@ -10,6 +10,11 @@ import sys
 # 添加项目根目录到路径，以便导入其他模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from price import parsing
+
+FLOOR_NAMES = {level: f"{name}楼层" for name, level in parsing.FLOOR_LEVELS.items()}
+VISUAL_SEARCH_K = 50  # 每次估值在照片特征库中近似检索的照片数
+
 try:
     from rules.differentiable_rule import DifferentiableRuleLearningFramework
 except ImportError:
@@ -20,12 +25,13 @@ class IMCA:
     """
     智能化市场比较法（Intelligent Market Comparison Approach）
     """
-    def __init__(self, rule_framework=None):
+    def __init__(self, rule_framework=None, photo_store=None):
         """
         初始化IMCA
         
         Args:
             rule_framework: 可微分规则学习框架
+            photo_store: 照片特征库（database.photo_store.PhotoStore），默认在首次需要时打开进程内共用的特征库
         """
         self.rule_framework = rule_framework
         
@@ -39,6 +45,11 @@ class IMCA:
             'transaction': 0.15     # 交易特性权重
         }
         
+        # 视觉相似度（目标照片与案例照片）的权重：目标有照片向量且案例在照片特征库中有照片时，
+        # 综合相似度为 (1 - 权重) * 上述各项的加权和 + 权重 * 视觉相似度，否则不变
+        self.visual_weight = 0.15
+        self._photo_store = photo_store
+        
         # 默认特征相似度计算参数
         self.similarity_params = {
             'time_decay_rate': 0.1,  # 时间衰减率（每年）
@@ -71,7 +82,7 @@ class IMCA:
             target['age'] = current_year - target['built_year']
         elif 'built_time' in target:
             try:
-                built_year = datetime.strptime(target['built_time'], '%Y-%m-%d').year
+                built_year = parsing.parse_date(target['built_time']).year
                 target['age'] = current_year - built_year
             except:
                 target['age'] = 0
@@ -81,7 +92,7 @@ class IMCA:
                 case['age'] = current_year - case['built_year']
             elif 'built_time' in case:
                 try:
-                    built_year = datetime.strptime(case['built_time'], '%Y-%m-%d').year
+                    built_year = parsing.parse_date(case['built_time']).year
                     case['age'] = current_year - built_year
                 except:
                     case['age'] = 0
@@ -89,20 +100,21 @@ class IMCA:
             # 计算交易时间与当前时间的差（年）
             if 'transaction_time' in case:
                 try:
-                    transaction_date = datetime.strptime(case['transaction_time'], '%Y-%m-%d')
+                    transaction_date = parsing.parse_date(case['transaction_time'])
                     case['time_diff'] = (datetime.now() - transaction_date).days / 365.0
                 except:
                     case['time_diff'] = 0
         
         return target, cases
     
-    def calculate_similarity(self, target, case):
+    def calculate_similarity(self, target, case, visual_neighbours=None):
         """
         计算目标房产与可比案例的相似度
         
         Args:
             target: 目标房产
             case: 可比案例
+            visual_neighbours: find_visual_neighbours 的结果（可选）
             
         Returns:
             dict: 相似度得分
@@ -182,11 +194,73 @@ class IMCA:
         # 计算综合相似度
         total_similarity = sum(self.default_weights[key] * similarities[key] for key in similarities.keys())
         
+        # 7. 视觉相似度（目标照片与案例照片的特征向量，向量按需从特征库读取）
+        visual_similarity = self.calculate_visual_similarity(target, case, visual_neighbours)
+        if visual_similarity is not None:
+            similarities['visual'] = visual_similarity
+            total_similarity = (1 - self.visual_weight) * total_similarity + self.visual_weight * visual_similarity
+        
         return {
             'similarities': similarities,
             'total_similarity': total_similarity
         }
     
+    def _get_photo_store(self):
+        if self._photo_store is None:
+            from database.photo_store import get_photo_store
+            self._photo_store = get_photo_store()
+        return self._photo_store
+    
+    def find_visual_neighbours(self, target, cases):
+        """
+        在照片特征库中近似检索与目标照片最相似的挂牌照片（LSH索引），每次估值只查询一次
+        
+        Args:
+            target: 目标房产
+            cases: 可比案例
+            
+        Returns:
+            dict: 案例归属名 -> 检索到的该案例照片的最大相似度；目标没有照片向量或案例都没有归属时为空
+        """
+        from database.photo_store import case_owner
+        
+        vector = target.get('visual_features')
+        owners = {case_owner(case) for case in cases} - {None}
+        if vector is None or not len(vector) or not owners:
+            return {}
+        neighbours = {}
+        for hit in self._get_photo_store().search(vector, k=VISUAL_SEARCH_K, kind="listing"):
+            if hit['owner'] in owners:
+                neighbours[hit['owner']] = max(neighbours.get(hit['owner'], -1.0), hit['similarity'])
+        return neighbours
+    
+    def calculate_visual_similarity(self, target, case, visual_neighbours=None):
+        """
+        目标照片与可比案例照片的视觉相似度
+        
+        Args:
+            target: 目标房产，visual_features 为照片特征向量（VisualEncoder.extract_property_features 的结果）
+            case: 可比案例，photo_owner 或 case_table 与 id 指明案例照片在特征库中的归属
+            visual_neighbours: find_visual_neighbours 的结果；案例照片在其中时直接使用，
+                               否则只读取该案例的照片向量精确计算
+            
+        Returns:
+            float: 与案例各照片余弦相似度的最大值（0~1），目标没有照片向量或案例没有照片时为None
+        """
+        vector = target.get('visual_features')
+        if vector is None or not len(vector):
+            return None
+        from database.photo_store import case_owner
+        
+        owner = case_owner(case)
+        if owner is None:
+            return None
+        if visual_neighbours and owner in visual_neighbours:
+            similarity = visual_neighbours[owner]
+        else:
+            similarity = self._get_photo_store().best_similarity(owner, vector)
+        return None if similarity is None else float(np.clip(similarity, 0, 1))
+    
     def calculate_adjustment_factors(self, target, case):
         """
         计算修正系数
@@ -326,8 +400,9 @@ class IMCA:
         # 预处理数据
         target, cases = self.preprocess_data(target_property, comparable_cases)
         
-        # 计算相似度
-        similarities = [self.calculate_similarity(target, case) for case in cases]
+        # 计算相似度（视觉相似度先在照片特征库中检索一次）
+        visual_neighbours = self.find_visual_neighbours(target, cases)
+        similarities = [self.calculate_similarity(target, case, visual_neighbours) for case in cases]
         
         # 计算修正系数
         adjustments = [self.calculate_adjustment_factors(target, case) for case in cases]
@@ -462,4 +537,30 @@ class IMCA:
         else:
             explanation += "表示可比案例与目标房产相似度较低，估值结果仅供参考。"
         
-        return explanation 
\ No newline at end of file
+        return explanation 
+
+def case_from_record(record, table):
+    """
+    把精筛（careful_selection）返回的案例转为IMCA的可比案例，并带上案例照片在特征库中的归属
+    
+    Args:
+        record: 案例表的一行
+        table: 案例表名
+        
+    Returns:
+        dict: 可比案例
+    """
+    from database.photo_store import listing_owner
+    
+    return {
+        'price': float(record['u_price']),
+        'size': float(record['house_area']),
+        'floor': FLOOR_NAMES.get(parsing.floor_level(str(record.get('house_floor', ''))), '中楼层'),
+        'fitment': record.get('house_decoration', ''),
+        'built_time': f"{int(record['house_year'])}-01-01",
+        'transaction_time': str(record.get('transaction_time', '')),
+        'green_rate': parsing.green_rate(str(record.get('green_rate') or '')),
+        'address': record.get('house_loc', ''),
+        'transaction_type': 1,
+        'photo_owner': listing_owner(table, record['id'])
+    }
@@ -0,0 +1,125 @@
+"""
+本模块包含房源文本字段的解析：房型、楼层、装修、绿化率、建成年份与日期
+
+数据集中这些字段只有几百种不同取值（如 "2室1厅1厨2卫"、"中楼层(共14层)"、"35%"），
+各解析函数按输入字符串做LRU缓存，同一字符串只解析一次，返回的结果为不可变对象，可安全共用。
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+
+TEXT_CACHE_SIZE = 4096  # 房型、楼层等文本字段的缓存条数
+DATE_CACHE_SIZE = 65536  # 日期字段的缓存条数
+
+FLOOR_LEVELS = {"低": 0, "中": 1, "高": 2}
+DECORATION_LEVELS = {"毛坯": 0, "简装": 1, "精装": 2}
+HOUSE_TYPE_PATTERN = re.compile(r'(\d+)室(\d+)厅(\d+)厨(\d+)卫')
+NUMBER_PATTERN = re.compile(r'\d+')
+UNKNOWN_YEARS = ('', '未知', '暂无数据', 'nan', 'None')
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def house_type_counts(text: str):
+    """
+    解析房型 "*室*厅*厨*卫"
+    :return: (室, 厅, 厨, 卫)，无法解析时为None
+    """
+    match = HOUSE_TYPE_PATTERN.search(text)
+    if match is None:
+        return None
+    return tuple(int(match.group(i)) for i in range(1, 5))
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def floor_level(text: str) -> int:
+    """
+    楼层等级：低楼层0、中楼层1、高楼层2，无法识别时为-1
+    """
+    for name, level in FLOOR_LEVELS.items():
+        if name in text:
+            return level
+    return -1
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def floor_number(text: str) -> int:
+    """
+    由 "中楼层(共14层)" 估计所在楼层：低楼层取总层数的1/6，中楼层1/2，高楼层5/6，无法识别等级时为0
+    """
+    numbers = NUMBER_PATTERN.findall(text)
+    if "低" in text:
+        return int(numbers[0]) // 6
+    elif "中" in text:
+        return int(numbers[0]) // 2
+    elif "高" in text:
+        return 5 * int(numbers[0]) // 6
+    return 0
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def decoration_level(text: str) -> int:
+    """
+    装修等级：毛坯0、简装1、精装2，其他为-1
+    """
+    return DECORATION_LEVELS.get(text, -1)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def fitment(text: str) -> int:
+    """
+    市场比较法使用的装修标记：精装为1，其余为0
+    """
+    return 1 if "精装" in text else 0
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def green_rate(text: str) -> float:
+    """
+    解析 "35%" 为0.35，不含百分号时为0
+    """
+    if "%" in text:
+        return int(NUMBER_PATTERN.findall(text)[0]) / 100
+    return 0
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def house_year(text: str):
+    """
+    解析建成年份，"未知"、空值等返回None
+    """
+    text = text.strip()
+    if text in UNKNOWN_YEARS:
+        return None
+    numbers = NUMBER_PATTERN.findall(text)
+    return int(numbers[0]) if numbers else None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(text: str, time_str_model: str = '%Y-%m-%d') -> datetime:
+    return datetime.strptime(text, time_str_model)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def date_ordinal(text: str, time_str_model: str = '%Y-%m-%d') -> int:
+    return parse_date(text, time_str_model).toordinal()
+
+
+PARSERS = (house_type_counts, floor_level, floor_number, decoration_level, fitment, green_rate, house_year,
+           parse_date, date_ordinal)
+
+
+def cache_info() -> dict:
+    """
+    各解析函数的缓存命中情况
+    :return: {函数名: {"hits", "misses", "size"}}
+    """
+    info = {}
+    for parser in PARSERS:
+        stats = parser.cache_info()
+        info[parser.__name__] = {"hits": stats.hits, "misses": stats.misses, "size": stats.currsize}
+    return info
+
+
+def cache_clear():
+    for parser in PARSERS:
+        parser.cache_clear()
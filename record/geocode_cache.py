@@ -0,0 +1,90 @@
+"""
+本模块包含 地点检索缓存 类
+
+百度地图地点检索的结果（首个结果的坐标与所在城市、全部结果的名称）按 (地点, 城市) 保存在JSON文件中，
+同一小区再次生成位置图、周边环境时不再请求接口，补全用户记录时也可以按小区名查到所在城市。
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+from config.path_config import MAP_PATH
+
+CACHE_FILE = "geocode_cache.json"
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class GeocodeCache:
+    """
+    地点检索缓存 类
+    """
+    def __init__(self, path=None):
+        """
+        :param path: 缓存文件路径，默认为 MAP_PATH/geocode_cache.json
+        """
+        self.path = Path(path or Path(MAP_PATH) / CACHE_FILE)
+        self._lock = threading.Lock()
+        self._entries = None  # 地点 -> {检索城市: {"location": {"lat", "lng"}, "city": 结果所在城市, "names": [名称]}}
+
+    def get(self, place_name: str, city: str) -> dict | None:
+        """
+        查找地点检索结果
+        :param place_name: 地点
+        :param city: 检索的城市
+        :return: {"location", "city", "names"}，未命中返回None
+        """
+        with self._lock:
+            return self._load().get(place_name, {}).get(city or "")
+
+    def put(self, place_name: str, city: str, entry: dict):
+        """
+        写入地点检索结果
+        :param place_name: 地点
+        :param city: 检索的城市
+        :param entry: {"location", "city", "names"}
+        """
+        with self._lock:
+            entries = self._load()
+            entries.setdefault(place_name, {})[city or ""] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def find_city(self, place_name: str) -> str | None:
+        """
+        按地点名查所在城市
+        :param place_name: 地点
+        :return: 缓存的检索结果指向唯一城市时返回该城市（结果未给出城市时取检索的城市），否则为None
+        """
+        with self._lock:
+            results = self._load().get(place_name, {})
+        cities = {entry.get("city") or city for city, entry in results.items()} - {""}
+        return cities.pop() if len(cities) == 1 else None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if self.path.exists():
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"读取地点检索缓存失败 {self.path}: {str(e)}")
+        return self._entries
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """
+    进程内共用的地点检索缓存
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = GeocodeCache()
+    return _default
@@ -2,9 +2,12 @@
 本模块包含 用户记录 类
 """
 
-from record.save_map import map_main
+import csv
+import io
 from pathlib import Path
 
+from record.uploads import release
+
 
 class Record:
     """
@@ -28,8 +31,9 @@ class Record:
         self.green_rate: float = 0.0  # 小区绿化率
         self.price: float = 0.0  # 房屋单价
         self.map: str = ""  # 位置图
-        self.production_cert_img: list[str] = []  # 产证图片，可能多张
-        self.production_ocr: str = ""  # OCR识别表格
+        self.production_cert_img: list[str] = []  # 产证图片，可能多张；与实地图片一样是共享的上传文件，clear 时只释放引用
+        self.production_ocr: str = ""  # OCR表格导出的Excel路径，下载时才生成
+        self.production_ocr_table: dict = {}  # OCR识别表格，{工作表名: {"columns", "data", "merges"}}
         self.field_img: list[str] = []  # 实地图片，可能多张
 
     def clear(self):
@@ -44,12 +48,13 @@ class Record:
         self.green_rate = 0.0
         #把文件删了
         self._clean_file(self.map)  # 清理地图文件
-        self._clean_files(self.production_cert_img)  # 清理产权证明图片
+        self._release_files(self.production_cert_img)  # 释放产权证明图片，其他记录仍在使用的不删除
         self._clean_file(self.production_ocr)  # 清理OCR文件
-        self._clean_files(self.field_img)  # 清理实地照片
+        self._release_files(self.field_img)  # 释放实地照片
         self.map = ""
         self.production_cert_img.clear()
         self.production_ocr = ""
+        self.production_ocr_table = {}
         self.field_img.clear()
     
     def _clean_file(self, file_path: str):
@@ -68,9 +73,17 @@ class Record:
         for file_path in file_list:
             self._clean_file(file_path)
 
-    def get_record(self):
+    def _release_files(self, file_list: list):
+        """释放共享的上传文件"""
+        for file_path in file_list:
+            release(file_path)
+
+    def get_record(self, keys: list = None):
+        """
+        :param keys: 需要列出的字段，默认为全部
+        """
         result = ""
-        for key in self.expected_keys:
+        for key in keys or self.expected_keys:
             try:
                 if key == 'house_location' and self.house_location != "":
                     result += f"-小区名称：{self.house_location}\n"
@@ -104,6 +117,8 @@ class Record:
         return result
 
     def get_map(self):
+        from record.save_map import map_main
+
         img_path = map_main(self.house_location, self.city)
         if img_path:
             self.map = img_path
@@ -114,9 +129,90 @@ class Record:
     def add_property_ocr(self, file_path: str):
         self.production_ocr = file_path
 
+    def add_property_ocr_table(self, table: dict, file_path: str = ""):
+        """
+        保存用户确认后的OCR表格
+        :param table: {工作表名: {"columns", "data", "merges"}}
+        :param file_path: 下载时导出Excel的路径
+        """
+        self._clean_file(self.production_ocr)  # 旧表格导出的Excel已过期
+        self.production_ocr_table = table
+        self.production_ocr = file_path
+
+    def get_ocr_rows(self) -> list:
+        """
+        OCR表格按工作表展开为二维列表，空单元格为空字符串
+        :return: [工作表[行[单元格]]]
+        """
+        return [[["" if cell is None else cell for cell in row] for row in sheet.get('data', [])]
+                for sheet in self.production_ocr_table.values()]
+
+    def get_ocr_text(self) -> str:
+        """
+        OCR表格转为CSV文本，供大模型提取信息
+        :return: 各工作表CSV拼接的文本
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for rows in self.get_ocr_rows():
+            writer.writerows(rows)
+        return buffer.getvalue()
+
     def add_field(self, img_url: str):
         self.field_img.append(img_url)
 
+    def autofill(self) -> list:
+        """
+        用本地数据补充缺失字段，只有补充不了的才需要询问用户：
+        所在城市取自有该小区案例的城市表或地点检索缓存，建成年份与绿化率取自小区统计
+        :return: 补充的字段
+        """
+        filled = []
+        if self.city == "" and self.house_location != "":
+            city = self._find_city()
+            if city:
+                self.city = city
+                filled.append("city")
+        return filled + self.fill_from_estate_stats()
+
+    def _find_city(self):
+        from database.estate_stats import get_estate_stats
+        from database.mysql_manager import MySQLManager
+        from record.geocode_cache import get_geocode_cache
+
+        tables = get_estate_stats().tables_for(self.house_location)
+        cities = [city for city, table in MySQLManager.city_tables.items() if table in tables]
+        if len(cities) == 1:
+            return cities[0]
+        city = get_geocode_cache().find_city(self.house_location) or ""
+        if city.endswith("市"):
+            city = city[:-1]  # 检索结果为"上海市"，案例表按"上海"登记
+        # 只返回有案例表的城市，其他城市留空由用户确认，避免估价时找不到案例表
+        return city if city in MySQLManager.city_tables else ""
+
+    def fill_from_estate_stats(self) -> list:
+        """
+        用小区统计补充缺失的建成年份与绿化率
+        :return: 补充的字段
+        """
+        if self.house_location == "" or (self.house_year != 0 and self.green_rate != 0.0):
+            return []
+        from database.estate_stats import get_estate_stats
+        from database.mysql_manager import MySQLManager
+
+        table = MySQLManager.city_tables.get(self.city)
+        stats = get_estate_stats().get(table, self.house_location) if table else None
+        if not stats:
+            return []
+        filled = []
+        if self.house_year == 0 and stats["mean_year"]:
+            self.house_year = stats["mean_year"]
+            filled.append("house_year")
+        if self.green_rate == 0.0 and stats["green_rate"]:
+            self.add_green_rate(stats["green_rate"])
+            filled.append("green_rate")
+        return filled
+
     def get_null(self):
         missing_value = []
         if self.house_location == "":
@@ -130,14 +226,12 @@ class Record:
         if self.house_structure == "":
             missing_value.append("house_structure")
         if self.house_year == 0:
-            # TODO：内存库中先搜素该小区，若无该小区案例，询问用户
             missing_value.append("house_year")
         if self.house_floor == "":
             missing_value.append("house_floor")
         if self.house_decorating == "":
             missing_value.append("house_decorating")
         if self.green_rate == 0.0:
-            # TODO：内存库中先搜素该小区，若无该小区案例，询问用户
             missing_value.append("green_rate")
         return missing_value
 
@@ -5,29 +5,38 @@ from pathlib import Path
 from datetime import datetime
 from config.path_config import MAP_PATH
 from llm.llm_manager import QianwenManager
-import json
+from llm.output_parser import parse_string_list, OutputParseError
+from record.geocode_cache import get_geocode_cache
+from telemetry.tracing import span, url_attribute
 
 
 def get_origin_place(place_name, city, status):  #定位函数
-    url = f"https://api.map.baidu.com/place/v2/search?query={place_name}&region={city}&output=json&ak=EbkD3DWCB5Ev9HfZkMwTJymCxxgc28nr"
-    response = requests.get(url)
-    result = response.json()
-
-    if result.get('status') == 0 and result.get('results'):
-        location = result['results'][0]['location']
-        if status == 0:
-            return f'{location["lng"]},{location["lat"]}'
-        elif status == 1:
-            return f'{location["lat"]},{location["lng"]}', [r['name'] for r in result['results']]
-        else:
+    entry = get_geocode_cache().get(place_name, city)
+    if entry is None:
+        url = f"https://api.map.baidu.com/place/v2/search?query={place_name}&region={city}&output=json&ak=EbkD3DWCB5Ev9HfZkMwTJymCxxgc28nr"
+        with span("http.baidu.place_search", url=url_attribute(url)):
+            response = requests.get(url)
+        result = response.json()
+        if not (result.get('status') == 0 and result.get('results')):
             return None
+        first = result['results'][0]
+        entry = {"location": first['location'], "city": first.get('city', ""),
+                 "names": [r['name'] for r in result['results']]}
+        get_geocode_cache().put(place_name, city, entry)
+
+    location = entry['location']
+    if status == 0:
+        return f'{location["lng"]},{location["lat"]}'
+    elif status == 1:
+        return f'{location["lat"]},{location["lng"]}', entry['names']
     else:
         return None
 
 
 def get_nearby_places(location, search_place_name, radius=2000):  #搜索函数
     url = f"https://api.map.baidu.com/place/v2/search?location={location}&radius={radius}&query={search_place_name}&output=json&ak=EbkD3DWCB5Ev9HfZkMwTJymCxxgc28nr"
-    response = requests.get(url)
+    with span("http.baidu.place_search", url=url_attribute(url)):
+        response = requests.get(url)
     result = response.json()
 
     if result.get('status') == 0 and result.get('results'):
@@ -40,7 +49,8 @@ def map_location(location):
     url = f"https://api.map.baidu.com/staticimage/v2?ak=EbkD3DWCB5Ev9HfZkMwTJymCxxgc28nr&width=512&height=400&zoom=16&scale=2&center={location}&markers={location}"
     # print(url)
     # 发送HTTP GET请求获取图片
-    response = requests.get(url)
+    with span("http.baidu.staticimage", url=url_attribute(url)):
+        response = requests.get(url)
     # 检查请求是否成功
     if response.status_code == 200:
         # 将响应内容转换为二进制流
@@ -72,10 +82,9 @@ def nearby_list(loc, city):
         # nearby_places.append(loc)
         nearby_list = QianwenManager().get_near_loc(str(nearby_places))
         try:
-            list = json.loads(json.dumps(eval(nearby_list)))
-            return list
-        except:
-            print(f"预期为二维列表，实际为{nearby_list}")
+            return parse_string_list(nearby_list)
+        except OutputParseError:
+            print(f"预期为一维列表，实际为{nearby_list}")
             return None
     else:
         print("百度地图api出错")
@@ -0,0 +1,117 @@
+"""
+本模块包含上传文件的内容寻址存储
+
+上传文件按内容的SHA-256命名，相同的照片只保存一份，由各用户记录的实地照片、产证图片共享；
+每个引用计数一次，最后一个引用释放时才删除文件。
+引用计数保存在上传目录下的SQLite文件中，多个web进程共用，重启后仍然有效。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from telemetry.logs import get_logger
+
+logger = get_logger("record")
+
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 每次从请求流读取的字节数
+HASH_NAME_LENGTH = 32  # 文件名取哈希的前32位十六进制
+REFS_FILE = ".refs.sqlite3"  # 引用计数文件名
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS refs (
+    filename TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+
+@contextmanager
+def _refs_transaction(folder: Path):
+    """
+    打开上传目录的引用计数并开始写事务（BEGIN IMMEDIATE），
+    事务持有期间其他进程、线程的查重落盘与释放删除都会等待，正常结束时提交
+    """
+    connection = sqlite3.connect(str(folder / REFS_FILE), timeout=30, isolation_level=None)
+    try:
+        connection.execute(_SCHEMA)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+
+def save_upload(stream, folder, suffix: str) -> str:
+    """
+    分块读取上传流写入临时文件并计算哈希，完成后按内容哈希命名；同名文件已存在则直接复用
+    调用方获得该文件的一次引用，不再使用时调用 release 释放
+    :param stream: 可读的二进制流
+    :param folder: 保存目录
+    :param suffix: 文件扩展名，如 ".png"
+    :return: 保存的文件名
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = folder / f".upload.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        filename = f"{digest.hexdigest()[:HASH_NAME_LENGTH]}{suffix.lower()}"
+        target = folder / filename
+        # 查重、落盘与计数在同一个事务内完成，避免与 release 的删除交错
+        with _refs_transaction(folder) as connection:
+            if target.exists():
+                tmp_path.unlink()
+            else:
+                os.replace(tmp_path, target)
+            connection.execute("INSERT INTO refs (filename, count) VALUES (?, 1) "
+                               "ON CONFLICT (filename) DO UPDATE SET count = count + 1", (filename,))
+        return filename
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def release(file_path, folder=None) -> bool:
+    """
+    释放一次引用，没有引用时删除文件
+    没有引用记录的文件（如计数功能上线前的上传）与上传目录之外的文件不处理，留待离线清理
+    :param file_path: 文件路径
+    :param folder: 上传目录，默认为 config.path_config.UPLOAD_FOLDER
+    :return: 是否删除了文件
+    """
+    if not file_path:
+        return False
+    if folder is None:
+        from config.path_config import UPLOAD_FOLDER
+        folder = UPLOAD_FOLDER
+    path = Path(file_path).resolve()
+    # 只处理直接位于上传目录下的文件，不在其他目录创建引用计数文件
+    if path.parent != Path(folder).resolve() or not path.parent.exists():
+        return False
+    with _refs_transaction(path.parent) as connection:
+        row = connection.execute("SELECT count FROM refs WHERE filename = ?", (path.name,)).fetchone()
+        if row is None:
+            return False
+        if row[0] > 1:
+            connection.execute("UPDATE refs SET count = count - 1 WHERE filename = ?", (path.name,))
+            return False
+        connection.execute("DELETE FROM refs WHERE filename = ?", (path.name,))
+        try:
+            if path.exists() and path.is_file():
+                path.unlink()
+                logger.info("已删除上传文件", extra={"fields": {"file": path.name}})
+                return True
+        except Exception:
+            logger.exception("删除上传文件失败", extra={"fields": {"file": path.name}})
+    return False
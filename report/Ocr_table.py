@@ -1,5 +1,6 @@
 import datetime
 import io
+import json
 import os
 import sys
 import time
@@ -67,7 +68,10 @@ class OCR_Table:
             UtilClient.assert_as_string(error.message)
     @staticmethod
     def trans_to_url(ak_id,ak_secret,img_path) -> str | None:
-        url = eval(OCR_Table.trans_to_str(ak_id,ak_secret,img_path))['body']["Data"]["SubImages"][0]["TableInfo"]["TableExcel"]  # important
+        resp = OCR_Table.trans_to_str(ak_id,ak_secret,img_path)
+        if resp is None:
+            return None
+        url = json.loads(resp)['body']["Data"]["SubImages"][0]["TableInfo"]["TableExcel"]  # important
         return url
     @staticmethod
     def trans_to_xlsx(ak_id,ak_secret,img_path) -> str | None:
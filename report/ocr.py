@@ -1,39 +1,165 @@
+import contextvars
 import datetime
 import io
 import os
+import queue
 import sys
+import threading
 import time
+from contextlib import contextmanager
 from typing import List
 
-import openpyxl
-import requests
-from alibabacloud_ocr_api20210707.client import Client as ocr_api20210707Client
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_ocr_api20210707 import models as ocr_api_20210707_models
-from alibabacloud_tea_util import models as util_models
-from alibabacloud_tea_util.client import Client as UtilClient
-from PIL import Image
 from pathlib import Path
-import pandas as pd
 from config.ocr_config import ocr_api_id, ocr_api_secret
 from config.path_config import OCR_PATH,UPLOAD_FOLDER
+from telemetry.tracing import span, url_attribute
+from telemetry.logs import get_logger
+
+OCR_MAX_SIDE = 2048  # 上传前缩放到的最长边（像素），超过该分辨率对表格识别已无增益
+OCR_JPEG_QUALITY = 85  # 重新压缩的JPEG质量
+OCR_POOL_SIZE = 4  # 每组AK的客户端池大小
+
+_client_pools = {}
+_client_pools_lock = threading.Lock()
+_last_stats = contextvars.ContextVar("ocr_last_stats", default=None)  # 当前请求（线程/上下文）最近一次识别的统计
+logger = get_logger("ocr")
+
+
+def preprocess_image(img_path, crop_box=None, max_side=OCR_MAX_SIDE, grayscale=True,
+                     quality=OCR_JPEG_QUALITY) -> bytes:
+    """
+    OCR上传前的图片预处理：按EXIF方向摆正、裁剪、灰度化、缩放到OCR有效分辨率并重新压缩
+    :param img_path: 图片路径
+    :param crop_box: 裁剪框 (left, upper, right, lower)，为None时不裁剪
+    :param max_side: 最长边上限（像素）
+    :param grayscale: 是否转为灰度图
+    :param quality: JPEG质量
+    :return: 处理后的图片字节；若处理后反而更大则返回原图字节
+    """
+    from PIL import Image, ImageOps
+
+    with open(img_path, 'rb') as img_file:
+        raw = img_file.read()
+    with Image.open(io.BytesIO(raw)) as img:
+        img = ImageOps.exif_transpose(img)
+        if crop_box:
+            img = img.crop(crop_box)
+        img = img.convert("L") if grayscale else img.convert("RGB")
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    processed = buffer.getvalue()
+    return processed if len(processed) < len(raw) else raw
+
+
+def parse_table_json(data: dict) -> dict:
+    """
+    将表格识别结果（RecognizeAllText 的 Data 字段）解析为表格结构
+    :param data: 识别结果 Data，包含 SubImages[].TableInfo.TableDetails[].CellDetails
+    :return: {工作表名: {"columns", "data", "merges"}}，每个识别出的表格一个工作表；没有单元格明细时返回空字典
+    """
+    result = {}
+    for sub_image in data.get("SubImages") or []:
+        table_info = sub_image.get("TableInfo") or {}
+        for table in table_info.get("TableDetails") or []:
+            cells = table.get("CellDetails") or []
+            if not cells:
+                continue
+            row_count = max([table.get("RowCount") or 0] + [cell["RowEnd"] + 1 for cell in cells])
+            col_count = max([table.get("ColumnCount") or 0] + [cell["ColumnEnd"] + 1 for cell in cells])
+            rows = [[None] * col_count for _ in range(row_count)]
+            merges = []
+            for cell in cells:
+                # 合并单元格的内容只放在左上角，与Excel一致
+                rows[cell["RowStart"]][cell["ColumnStart"]] = cell.get("CellContent")
+                if cell["RowEnd"] > cell["RowStart"] or cell["ColumnEnd"] > cell["ColumnStart"]:
+                    merges.append({
+                        'start_row': cell["RowStart"],
+                        'end_row': cell["RowEnd"],
+                        'start_col': cell["ColumnStart"],
+                        'end_col': cell["ColumnEnd"]
+                    })
+            result[f"Sheet{len(result) + 1}"] = {
+                "columns": list(range(col_count)),
+                "data": rows,
+                "merges": merges
+            }
+    return result
+
+
+class _ClientPool:
+    """
+    OCR客户端池，按AK复用长期存活的客户端，避免每次识别都重新创建
+    """
+    def __init__(self, factory, size=OCR_POOL_SIZE):
+        self._factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def client(self):
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            client = self._factory()
+        try:
+            yield client
+        finally:
+            try:
+                self._idle.put_nowait(client)
+            except queue.Full:
+                pass
 
 
 class OCR_Table:
-    def __init__(self, api_id: str = ocr_api_id, api_secret: str = ocr_api_secret):
+    def __init__(self, api_id: str = ocr_api_id, api_secret: str = ocr_api_secret, preprocess: bool = True):
         """初始化OCR处理器
+        :param preprocess: 上传前是否预处理图片（摆正、灰度、缩放、重新压缩）
         """
         self.api_id = api_id
         self.api_secret = api_secret
+        self.preprocess = preprocess
         # self.temp_dir = Path(OCR_PATH)
         # self.temp_dir.mkdir(exist_ok=True)
 
-    def create_client(self) -> ocr_api20210707Client:
+    @property
+    def last_stats(self) -> dict:
+        """
+        当前请求最近一次识别的耗时与上传体积
+        实例在各web请求间共用，统计保存在contextvar中，并发请求互不覆盖
+        """
+        return _last_stats.get() or {}
+
+    def _client_pool(self) -> _ClientPool:
+        key = (self.api_id, self.api_secret)
+        with _client_pools_lock:
+            if key not in _client_pools:
+                _client_pools[key] = _ClientPool(self.create_client)
+            return _client_pools[key]
+
+    def load_image(self, img_path) -> bytes:
+        """
+        读取待上传的图片字节，按需预处理
+        :param img_path: 图片路径
+        :return: 图片字节
+        """
+        if self.preprocess:
+            try:
+                return preprocess_image(img_path)
+            except Exception as e:
+                logger.warning(f"图片预处理失败，使用原图: {str(e)}")
+        with open(img_path, 'rb') as img_file:
+            return img_file.read()
+
+    def create_client(self) -> 'ocr_api20210707Client':
         """
         使用AK&SK初始化账号Client
         @return: Client
         @throws Exception
         """
+        from alibabacloud_ocr_api20210707.client import Client as ocr_api20210707Client
+        from alibabacloud_tea_openapi import models as open_api_models
+
         # 工程代码泄露可能会导致 AccessKey 泄露，并威胁账号下所有资源的安全性。以下代码示例仅供参考。
         # 建议使用更安全的 STS 方式，更多鉴权访问方式请参见：https://help.aliyun.com/document_detail/378659.html。
         config = open_api_models.Config(
@@ -47,14 +173,14 @@ class OCR_Table:
         return ocr_api20210707Client(config)
 
     def trans_to_str(self, img_path) -> str | None:
-        with open(img_path, 'rb') as img_file:
-            binary_data = img_file.read()
-        # img=Image.open(img_path)
+        from alibabacloud_ocr_api20210707 import models as ocr_api_20210707_models
+        from alibabacloud_tea_util import models as util_models
+        from alibabacloud_tea_util.client import Client as UtilClient
+
+        start = time.perf_counter()
+        binary_data = self.load_image(img_path)
+        preprocess_ms = (time.perf_counter() - start) * 1000
         img_bytes = io.BytesIO(binary_data)
-        file_name, file_ext = os.path.splitext(img_path)
-        # img.save(img_bytes,format=file_ext[1:])
-        # img_bytes.seek(0)
-        client = self.create_client()
         recognize_all_text_request = ocr_api_20210707_models.RecognizeAllTextRequest(
             body=img_bytes,
             type='Table',
@@ -62,19 +188,57 @@ class OCR_Table:
         )
         runtime = util_models.RuntimeOptions()
         try:
-            resp = client.recognize_all_text_with_options(recognize_all_text_request, runtime)
+            start = time.perf_counter()
+            with span("ocr.recognize", upload_bytes=len(binary_data)), self._client_pool().client() as client:
+                resp = client.recognize_all_text_with_options(recognize_all_text_request, runtime)
+            stats = {
+                "raw_bytes": os.path.getsize(img_path),
+                "upload_bytes": len(binary_data),
+                "preprocess_ms": preprocess_ms,
+                "recognize_ms": (time.perf_counter() - start) * 1000
+            }
+            _last_stats.set(stats)
+            logger.info("OCR识别", extra={"fields": stats})
             # ConsoleClient.log(UtilClient.to_jsonstring(resp))
             return UtilClient.to_jsonstring(resp)
         except Exception as error:
             # 此处仅做打印展示，请谨慎对待异常处理，在工程项目中切勿直接忽略异常。
-            # 错误 message
-            print(error.message)
-            # 诊断地址
-            print(error.data.get("Recommend"))
+            # 错误 message 与诊断地址
+            logger.error(f"OCR识别失败: {error.message}", extra={"fields": {"recommend": error.data.get("Recommend")}})
             UtilClient.assert_as_string(error.message)
 
+    def trans_to_table(self, img_name) -> dict:
+        """
+        识别图片并直接从识别结果JSON解析表格，不经过Excel文件
+        :param img_name: 上传目录下的图片文件名
+        :return: {工作表名: {"columns", "data", "merges"}}，格式同 trans_to_dict
+        """
+        import json
+
+        img_path = f"{UPLOAD_FOLDER}/{img_name}"
+        resp = self.trans_to_str(img_path)
+        if resp is None:
+            raise RuntimeError("OCR识别失败")
+        data = json.loads(resp)['body']["Data"]
+        table = parse_table_json(data)
+        if table:
+            return table
+        # 识别结果中没有单元格明细时，退回到下载云端生成的Excel（只在内存中解析）
+        import requests
+
+        url = data["SubImages"][0]["TableInfo"]["TableExcel"]
+        with span("http.ocr.table_excel", url=url_attribute(url)):
+            response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        return self.trans_to_dict(io.BytesIO(response.content))
+
     def trans_to_url(self, img_path) -> str | None:
-        url = eval(self.trans_to_str(img_path))['body']["Data"]["SubImages"][0]["TableInfo"]["TableExcel"]  # important
+        import json
+
+        resp = self.trans_to_str(img_path)
+        if resp is None:
+            return None
+        url = json.loads(resp)['body']["Data"]["SubImages"][0]["TableInfo"]["TableExcel"]  # important
         return url
 
     def trans_to_path(self, img_path):
@@ -83,10 +247,13 @@ class OCR_Table:
         return filepath
 
     def trans_to_xlsx(self, img_name):
+        import requests
+
         img_path = f"{UPLOAD_FOLDER}/{img_name}"
-        print(img_path)
+        logger.debug("OCR识别并下载Excel", extra={"fields": {"image": img_path}})
         url = self.trans_to_url(img_path)
-        response = requests.get(url, timeout=10)
+        with span("http.ocr.table_excel", url=url_attribute(url)):
+            response = requests.get(url, timeout=10)
         response.raise_for_status()
         save_path = self.trans_to_path(img_name)
         with open(save_path, 'wb') as f:
@@ -107,6 +274,9 @@ class OCR_Table:
     #     return result
 
     def trans_to_dict(self, save_path) -> dict:
+        import openpyxl
+        import pandas as pd
+
         wb = openpyxl.load_workbook(save_path)
         result = {}
 
@@ -132,6 +302,8 @@ class OCR_Table:
         return result
 
     def trans_to_df(self, save_path) -> list | None:
+        import openpyxl
+
         wb = openpyxl.load_workbook(save_path)
         # for sheet_name in wb.sheetnames:
         #     sheet = wb[sheet_name]
@@ -0,0 +1,201 @@
+"""
+本模块包含 OCR结果缓存 类
+
+按上传图片的内容哈希缓存已解析的表格结构（单元格与合并信息），
+重复上传同一张产证照片时无需再调用云端OCR、下载并解析工作簿。
+缓存条目保存在SQLite中，按 (内容哈希, 作用域) 区分，超过容量时淘汰最久未使用的条目。
+默认只使用内容哈希完全相同的条目；近似匹配需显式开启，且要求横向、纵向两个感知哈希都在阈值内。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config.path_config import OCR_PATH
+
+CACHE_FILE = "ocr_cache.sqlite3"
+MAX_ENTRIES = 5000  # 缓存条目上限
+EVICT_EVERY = 100  # 每写入这么多次检查一次容量
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    digest TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT '',
+    phash TEXT,
+    vhash TEXT,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, scope)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_scope ON entries (scope);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used);
+"""
+
+
+def content_hash(img_path) -> str:
+    """
+    图片文件内容的SHA-256
+    :param img_path: 图片路径
+    :return: 十六进制哈希
+    """
+    digest = hashlib.sha256()
+    with open(img_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(img_path, hash_size=16, vertical=False) -> int:
+    """
+    差值感知哈希（dHash），重新编码、轻微缩放后的同一张照片哈希相近
+    :param img_path: 图片路径
+    :param hash_size: 哈希边长，结果为 hash_size * hash_size 位
+    :param vertical: 为True时比较上下相邻的像素，否则比较左右相邻的像素
+    :return: 哈希整数
+    """
+    from PIL import Image, ImageOps
+
+    width, height = (hash_size, hash_size + 1) if vertical else (hash_size + 1, hash_size)
+    with Image.open(img_path) as img:
+        img = ImageOps.exif_transpose(img).convert("L").resize((width, height), Image.LANCZOS)
+        pixels = list(img.getdata())
+    step = width if vertical else 1
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            index = row * width + col
+            value = (value << 1) | (pixels[index] > pixels[index + step])
+    return value
+
+
+class OcrResultCache:
+    """
+    OCR结果缓存 类
+
+    精确匹配使用内容哈希，跨用户共享（优先取同一用户的条目）。近似匹配默认关闭：版式相同的不同产证感知哈希也可能相近，
+    误命中会把别的房产的信息当作本次识别结果；开启后只在同一用户（scope）的上传之间进行，
+    横向与纵向感知哈希须同时在阈值内才算命中。
+    """
+    def __init__(self, cache_dir=None, max_distance: int = 0, max_entries: int = MAX_ENTRIES):
+        """
+        :param cache_dir: 缓存目录，默认为 OCR_PATH/cache
+        :param max_distance: 感知哈希判定为同一张图片的最大汉明距离，默认0，只使用内容哈希完全相同的条目
+        :param max_entries: 缓存条目上限，超过时淘汰最久未使用的条目
+        """
+        self.cache_dir = Path(cache_dir or Path(OCR_PATH) / "cache")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._puts = 0
+        # 多个web进程共用同一个缓存文件，写入时等待其他进程的事务结束
+        self._connection = sqlite3.connect(str(self.cache_dir / CACHE_FILE), timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(entries)")}
+            if "vhash" not in columns:  # 早期的缓存文件没有纵向感知哈希
+                self._connection.execute("ALTER TABLE entries ADD COLUMN vhash TEXT")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, img_path, scope=None) -> dict | None:
+        """
+        查找缓存的表格结构
+        :param img_path: 图片路径
+        :param scope: 作用域（用户ID），用于近似匹配
+        :return: trans_to_dict 格式的表格结构，未命中返回None
+        """
+        scope = _scope_key(scope)
+        key = content_hash(img_path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT digest, scope, result FROM entries WHERE digest = ? ORDER BY scope = ? DESC LIMIT 1",
+                (key, scope)).fetchone()
+        if row is None and self.max_distance > 0:
+            row = self._nearest(img_path, scope)
+        if row is None:
+            return None
+        digest, entry_scope, result = row
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE entries SET last_used = ? WHERE digest = ? AND scope = ?",
+                                     (time.time(), digest, entry_scope))
+        try:
+            return json.loads(result)
+        except ValueError as e:
+            print(f"读取OCR缓存失败 {digest}: {str(e)}")
+            return None
+
+    def _nearest(self, img_path, scope):
+        """同一作用域内横向、纵向感知哈希都在阈值内且总距离最小的条目"""
+        with self._lock:
+            candidates = self._connection.execute(
+                "SELECT digest, phash, vhash FROM entries "
+                "WHERE scope = ? AND phash IS NOT NULL AND vhash IS NOT NULL", (scope,)).fetchall()
+        if not candidates:
+            return None
+        phash = perceptual_hash(img_path)
+        vhash = perceptual_hash(img_path, vertical=True)
+        best_key, best_distance = None, None
+        for digest, candidate_phash, candidate_vhash in candidates:
+            distance = bin(phash ^ int(candidate_phash, 16)).count("1")
+            if distance > self.max_distance:
+                continue
+            # 第二次确认：纵向哈希也须在阈值内
+            vertical_distance = bin(vhash ^ int(candidate_vhash, 16)).count("1")
+            if vertical_distance > self.max_distance:
+                continue
+            if best_distance is None or distance + vertical_distance < best_distance:
+                best_key, best_distance = digest, distance + vertical_distance
+        if best_key is None:
+            return None
+        with self._lock:
+            return self._connection.execute(
+                "SELECT digest, scope, result FROM entries WHERE digest = ? AND scope = ?",
+                (best_key, scope)).fetchone()
+
+    def put(self, img_path, table: dict, scope=None):
+        """
+        写入缓存
+        :param img_path: 图片路径
+        :param table: trans_to_dict 格式的表格结构
+        :param scope: 作用域（用户ID）
+        """
+        key = content_hash(img_path)
+        phash = vhash = None
+        if self.max_distance > 0:
+            try:
+                phash = format(perceptual_hash(img_path), "x")
+                vhash = format(perceptual_hash(img_path, vertical=True), "x")
+            except Exception as e:
+                print(f"计算感知哈希失败: {str(e)}")
+                phash = vhash = None
+        result = json.dumps(table, ensure_ascii=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (digest, scope, phash, vhash, result, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, _scope_key(scope), phash, vhash, result, time.time()))
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 1:
+                self._evict()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        """淘汰超出容量的最久未使用条目，调用方持有锁并处于事务中"""
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+
+def _scope_key(scope) -> str:
+    """作用域统一为字符串，None 记为空串（SQLite主键中的NULL互不相等）"""
+    return "" if scope is None else str(scope)
@@ -0,0 +1,137 @@
+"""
+本模块包含 OCR表格导出Excel 的函数与后台写入线程
+
+表格结构与 OCR_Table.trans_to_dict 相同：{工作表名: {"columns", "data", "merges"}}。
+"""
+import contextvars
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from telemetry.logs import get_logger
+
+ROW_HEIGHT = 15  # 单行文字的行高（磅）
+
+logger = get_logger("ocr")
+
+
+def write_table_xlsx(table: dict, file_path):
+    """
+    将OCR表格写入Excel，先写临时文件再重命名，读者不会看到写了一半的文件
+    :param table: {工作表名: {"columns", "data", "merges"}}
+    :param file_path: 导出路径
+    :return: 导出路径
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import Cell
+    from openpyxl.styles import Alignment
+    from openpyxl.utils import get_column_letter
+
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    alignment = Alignment(wrapText=True, horizontal='center', vertical='center')
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name, sheet_data in table.items():
+        ws = wb.create_sheet(sheet_name[:31])
+        rows = sheet_data.get('data', [])
+        col_count = max([len(sheet_data.get('columns', []))] + [len(row) for row in rows])
+
+        # 居中样式设置在列上；单元格从同一份样式复制，不再逐个单元格注册样式，
+        # 每个单元格持有自己的副本，之后修改一个单元格的样式不会影响其他单元格
+        for col in range(1, col_count + 1):
+            ws.column_dimensions[get_column_letter(col)].alignment = alignment
+        style = Cell(ws)
+        style.alignment = alignment
+        for row_idx, row in enumerate(rows, 1):
+            ws.append([Cell(ws, value=value, style_array=copy.copy(style._style)) for value in row])
+            # 按单元格内的换行数调整行高
+            lines = max([str(value).count('\n') + 1 for value in row if value] + [1])
+            ws.row_dimensions[row_idx].height = ROW_HEIGHT * lines
+
+        # 恢复合并单元格（转换回1-based索引），与已合并区域重叠的区域跳过
+        for merge in _valid_merges(sheet_data.get('merges', [])):
+            ws.merge_cells(start_row=merge['start_row'] + 1, end_row=merge['end_row'] + 1,
+                           start_column=merge['start_col'] + 1, end_column=merge['end_col'] + 1)
+
+    tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return file_path
+
+
+def _valid_merges(merges: list) -> list:
+    """
+    去掉重复、退化（单个单元格）以及与前面区域重叠的合并区域
+    openpyxl 不检查重叠，重叠的合并区域会使导出的Excel文件损坏
+    """
+    covered = set()
+    result = []
+    for merge in merges:
+        cells = {(row, col) for row in range(merge['start_row'], merge['end_row'] + 1)
+                 for col in range(merge['start_col'], merge['end_col'] + 1)}
+        if len(cells) < 2:
+            continue
+        if cells & covered:
+            logger.warning("跳过重叠的合并区域", extra={"fields": {"merge": merge}})
+            continue
+        covered |= cells
+        result.append(merge)
+    return result
+
+
+class OcrExcelWriter:
+    """
+    OCR表格后台写入线程
+
+    保存表格后立即提交导出，请求线程不必等待；下载时若导出尚未完成则等待同一任务，不会重复写入。
+    """
+    def __init__(self, max_workers: int = 1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-xlsx")
+        self._lock = threading.Lock()
+        self._pending = {}  # 导出路径 -> Future
+
+    def submit(self, table: dict, file_path):
+        """
+        提交后台导出
+        :param table: {工作表名: {"columns", "data", "merges"}}
+        :param file_path: 导出路径
+        :return: Future
+        """
+        key = str(Path(file_path).resolve())
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            # 在提交时的上下文中执行，后台导出的日志与追踪仍归属发起保存的请求
+            future = self._executor.submit(contextvars.copy_context().run, write_table_xlsx, table, key)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def wait(self, file_path, timeout=None):
+        """
+        等待该路径的后台导出完成
+        :param file_path: 导出路径
+        :param timeout: 超时秒数
+        :return: 有对应的导出任务返回True，否则返回False
+        """
+        with self._lock:
+            future = self._pending.get(str(Path(file_path).resolve()))
+        if future is None:
+            return False
+        future.result(timeout)
+        return True
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        if future.exception() is not None:
+            logger.error(f"导出OCR表格失败 {key}: {str(future.exception())}")
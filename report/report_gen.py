@@ -12,22 +12,30 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch, cm
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.utils import ImageReader
-from report.ocr import OCR_Table
 from record.record import Record
-from database.mysql_manager import MySQLManager
 from config.path_config import REPORT_PATH
-from record.save_map import environment_main
+from telemetry.tracing import traced
 from datetime import datetime, date
 
-pdfmetrics.registerFont(TTFont("SimHei", "SimHei.ttf"))
-pdfmetrics.registerFont(TTFont("SimSun", "SimSun.ttc"))
-pdfmetrics.registerFont(TTFont("SimSunb", "simsunb.ttf"))
-pdfmetrics.registerFont(TTFont("simfang", "simfang.ttf"))
-pdfmetrics.registerFont(TTFont("simkai", "simkai.ttf"))
-pdfmetrics.registerFont(TTFont("segoeuib", "segoeuib.ttf"))
-pdfmetrics.registerFont(TTFont("segoeuil", "segoeuil.ttf"))
-pdfmetrics.registerFont(TTFont("segoeuisl", "segoeuisl.ttf"))
-pdfmetrics.registerFont(TTFont("seguisb", "seguisb.ttf"))
+_FONTS = {
+    "SimHei": "SimHei.ttf",
+    "SimSun": "SimSun.ttc",
+    "SimSunb": "simsunb.ttf",
+    "simfang": "simfang.ttf",
+    "simkai": "simkai.ttf",
+    "segoeuib": "segoeuib.ttf",
+    "segoeuil": "segoeuil.ttf",
+    "segoeuisl": "segoeuisl.ttf",
+    "seguisb": "seguisb.ttf",
+}
+
+
+def register_fonts():
+    """注册报告所需字体（解析字体文件较慢，首次生成报告时才执行）"""
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, file_name in _FONTS.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(name, file_name))
 
 
 class PageElement:
@@ -137,6 +145,7 @@ class PDFGenerator:
         self.page_height = A4[1]  # 页面高度（点）
         self.margin = 1 * cm  # 页面边距（1厘米）
         # 注册中文字体
+        register_fonts()
         if font_path:
             pdfmetrics.registerFont(TTFont('CustomFont', font_path))
         # 创建样式
@@ -474,6 +483,7 @@ class PDFGenerator:
         if element.dash_pattern:
             canvas.setDash()
 
+    @traced("report.render_pdf")
     def generate(self):
         canvas_obj = canvas.Canvas(self.output_path, pagesize=self.page_size)
         # 按页码分组元素并排序
@@ -499,6 +509,24 @@ class PDFGenerator:
 
 #生成指定模板的报告
 #这一部分仍然有着死数据问题，但至少把生成pdf的类剥离出来了（就是上面的那几个类）
+def estate_market_summary(record: Record) -> str:
+    """
+    根据小区统计生成物业概况中的市场概况，没有该小区的统计时为空
+    """
+    from database.estate_stats import get_estate_stats
+    from database.mysql_manager import MySQLManager
+
+    table = MySQLManager.city_tables.get(record.city)
+    stats = get_estate_stats().get(table, record.house_location) if table else None
+    if not stats or stats["median_u_price"] is None:
+        return ""
+    summary = (f"\n该小区共有{stats['listing_count']}个挂牌案例，挂牌单价中位数为{stats['median_u_price']:.0f}元/平方米，"
+               f"半数案例的单价在{stats['p25_u_price']:.0f}至{stats['p75_u_price']:.0f}元/平方米之间")
+    if stats["green_rate"]:
+        summary += f"，小区绿化率约为{stats['green_rate'] * 100:.0f}%"
+    return summary + f"（统计更新于{stats['updated_at']}）。"
+
+
 class property_report:
     def __init__(self, out_file_path: str, property_name: str, pagesize=A4):
         self.index = ""  # 报告编号
@@ -893,7 +921,11 @@ class property_report:
         self.set_up_down_label(logo_img, index=report_index)
         self.result.generate()
 
+    @traced("report.save_report")
     def save_report(self, uid: int, record: Record):
+        from database.mysql_manager import MySQLManager
+        from record.save_map import environment_main
+
         logo_img = "D:/sitp_work/web/report/logo_img.png"
         cover_img = record.field_img[0]
         client_name = "{}（委托人）".format(uid)  # TODO:数据库里根据uid查找用户名
@@ -902,18 +934,10 @@ class property_report:
         property_summary = (
             f"估价对象位于「{record.house_location}」内，该社区于{record.house_year}年竣工。根据估价人员现场勘查及权利人提供之相关资料，"
             f"估价对象为{record.house_type}的户型。总建筑面积为{record.house_area}平方米。估价对象为{record.house_structure}。"
-            f"于估价时点，估价对象为{record.house_decorating}。")
+            f"于估价时点，估价对象为{record.house_decorating}。") + estate_market_summary(record)
         # property_index = "【房地产权证】沪(2017)浦字不动产权第015342号"
         property_index = "【房地产权证】"
-        print(record.production_ocr)
-        ocr_table = OCR_Table().trans_to_df(record.production_ocr)
-        if ocr_table is not None:
-            # 遍历所有单元格替换None
-            for i in range(len(ocr_table)):
-                if isinstance(ocr_table[i], list):  # 处理二维表格
-                    ocr_table[i] = [cell if cell is not None else "" for cell in ocr_table[i]]
-        else:  # 处理一维数据
-            ocr_table[i] = ocr_table[i] if ocr_table[i] is not None else ""
+        ocr_table = record.get_ocr_rows()
         apppendix = {
             "附录一": [record.map],
             "附录二": record.production_cert_img,
@@ -4,8 +4,82 @@
 import numpy as np
 import json
 import os
+import shutil
 from datetime import datetime
 
+# 参数约束：平滑度/边界的最小值、范围规则上下限的最小间隔、梯度裁剪阈值
+MIN_SCALE = 1e-3
+MIN_RANGE_GAP = 1e-3
+GRAD_CLIP = 1e3
+
+
+def _sigmoid(z):
+    """数值稳定的sigmoid"""
+    return 1 / (1 + np.exp(-np.clip(z, -500, 500)))
+
+
+class FeatureBatch:
+    """
+    批量特征视图，将样本列表按特征列转换为NumPy数组，供规则批量前向/反向计算使用
+    """
+    def __init__(self, samples):
+        """
+        初始化批量特征
+
+        Args:
+            samples: 样本字典列表
+        """
+        self._samples = samples
+        self._numeric_cache = {}
+        self._category_cache = {}
+
+    def __len__(self):
+        return len(self._samples)
+
+    def numeric(self, feature):
+        """
+        取数值特征列
+
+        Args:
+            feature: 特征名
+
+        Returns:
+            np.ndarray: float数组，缺失或无法转换的值为NaN
+        """
+        if feature not in self._numeric_cache:
+            column = np.full(len(self._samples), np.nan)
+            for i, sample in enumerate(self._samples):
+                try:
+                    column[i] = float(sample[feature])
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self._numeric_cache[feature] = column
+        return self._numeric_cache[feature]
+
+    def category_index(self, feature, categories):
+        """
+        取类别特征在类别列表中的索引
+
+        Args:
+            feature: 特征名
+            categories: 类别列表
+
+        Returns:
+            np.ndarray: int数组，缺失或未知类别为-1
+        """
+        key = (feature, tuple(categories))
+        if key not in self._category_cache:
+            lookup = {category: i for i, category in enumerate(categories)}
+            column = np.full(len(self._samples), -1, dtype=np.int64)
+            for i, sample in enumerate(self._samples):
+                try:
+                    column[i] = lookup.get(sample.get(feature), -1)
+                except TypeError:  # 不可哈希的值视为未知类别
+                    pass
+            self._category_cache[key] = column
+        return self._category_cache[key]
+
+
 class RuleType:
     """规则类型枚举"""
     COMPARISON = "comparison"  # 比较规则
@@ -40,7 +114,65 @@ class Rule:
             float: 规则应用结果（0-1之间）
         """
         raise NotImplementedError("子类必须实现此方法")
-    
+
+    # 可训练参数名列表，由子类覆盖
+    param_names = ()
+
+    def prepare(self, batch):
+        """
+        从批量特征中取出规则所需的输入列，训练时只需计算一次
+
+        Args:
+            batch: FeatureBatch
+
+        Returns:
+            tuple: 与样本行对齐的数组元组
+        """
+        raise NotImplementedError("子类必须实现此方法")
+
+    def forward(self, inputs):
+        """
+        批量应用规则
+
+        Args:
+            inputs: prepare返回的数组元组（可按行切片）
+
+        Returns:
+            tuple: (规则结果数组, 反向传播所需的缓存)
+        """
+        raise NotImplementedError("子类必须实现此方法")
+
+    def backward(self, cache, grad_output):
+        """
+        批量反向传播，计算参数的解析梯度
+
+        Args:
+            cache: forward返回的缓存
+            grad_output: 损失对规则结果的梯度数组
+
+        Returns:
+            dict: 参数名 -> 梯度
+        """
+        raise NotImplementedError("子类必须实现此方法")
+
+    def update_params(self, gradients, learning_rate):
+        """
+        按梯度更新参数并施加约束
+
+        Args:
+            gradients: 参数名 -> 梯度
+            learning_rate: 学习率
+        """
+        for name, gradient in gradients.items():
+            gradient = np.clip(gradient, -GRAD_CLIP, GRAD_CLIP)
+            value = np.asarray(getattr(self, name), dtype=float) - learning_rate * gradient
+            setattr(self, name, value.tolist() if value.ndim else float(value))
+        self.constrain_params()
+
+    def constrain_params(self):
+        """将参数投影回合法区间，由子类按需覆盖"""
+        pass
+
     def to_dict(self):
         """
         将规则转换为字典
@@ -68,16 +200,19 @@ class Rule:
             Rule: 规则对象
         """
         rule_type = rule_dict.pop("type", None)
+        is_trainable = rule_dict.pop("is_trainable", True)
         if rule_type == "ComparisonRule":
-            return ComparisonRule(**rule_dict)
+            rule = ComparisonRule(**rule_dict)
         elif rule_type == "ThresholdRule":
-            return ThresholdRule(**rule_dict)
+            rule = ThresholdRule(**rule_dict)
         elif rule_type == "RangeRule":
-            return RangeRule(**rule_dict)
+            rule = RangeRule(**rule_dict)
         elif rule_type == "CategoricalRule":
-            return CategoricalRule(**rule_dict)
+            rule = CategoricalRule(**rule_dict)
         else:
             raise ValueError(f"未知规则类型: {rule_type}")
+        rule.is_trainable = is_trainable
+        return rule
 
 
 class ComparisonRule(Rule):
@@ -130,6 +265,41 @@ class ComparisonRule(Rule):
         else:
             raise ValueError(f"未知比较运算符: {self.operator}")
     
+    param_names = ("margin",)
+
+    def prepare(self, batch):
+        return batch.numeric(self.feature1), batch.numeric(self.feature2)
+
+    def forward(self, inputs):
+        value1, value2 = inputs
+        missing = np.isnan(value1) | np.isnan(value2)
+        margin = self.margin + 1e-6
+
+        if self.operator == "greater":
+            diff = np.nan_to_num(value1 - value2)
+            result = _sigmoid(diff / margin)
+            d_margin = -result * (1 - result) * diff / margin ** 2
+        elif self.operator == "less":
+            diff = np.nan_to_num(value2 - value1)
+            result = _sigmoid(diff / margin)
+            d_margin = -result * (1 - result) * diff / margin ** 2
+        elif self.operator == "equal":
+            diff = np.nan_to_num(np.abs(value1 - value2))
+            result = np.exp(-diff / margin)
+            d_margin = result * diff / margin ** 2
+        else:
+            raise ValueError(f"未知比较运算符: {self.operator}")
+
+        result = np.where(missing, 0.5, result)
+        d_margin = np.where(missing, 0.0, d_margin)
+        return result, d_margin
+
+    def backward(self, cache, grad_output):
+        return {"margin": float(np.dot(grad_output, cache))}
+
+    def constrain_params(self):
+        self.margin = max(self.margin, 0.0)
+
     def to_dict(self):
         """
         将规则转换为字典
@@ -191,6 +361,40 @@ class ThresholdRule(Rule):
         else:
             raise ValueError(f"未知方向: {self.direction}")
     
+    param_names = ("threshold", "smoothness")
+
+    def prepare(self, batch):
+        return (batch.numeric(self.feature),)
+
+    def forward(self, inputs):
+        value, = inputs
+        missing = np.isnan(value)
+        z = np.where(missing, 0.0, value - self.threshold) / self.smoothness
+
+        if self.direction == "above":
+            result = _sigmoid(z)
+            slope = result * (1 - result)
+        elif self.direction == "below":
+            result = _sigmoid(-z)
+            slope = -result * (1 - result)
+        else:
+            raise ValueError(f"未知方向: {self.direction}")
+
+        # dz/dthreshold = -1/s, dz/dsmoothness = -z/s
+        d_threshold = np.where(missing, 0.0, -slope / self.smoothness)
+        d_smoothness = np.where(missing, 0.0, -slope * z / self.smoothness)
+        return np.where(missing, 0.5, result), (d_threshold, d_smoothness)
+
+    def backward(self, cache, grad_output):
+        d_threshold, d_smoothness = cache
+        return {
+            "threshold": float(np.dot(grad_output, d_threshold)),
+            "smoothness": float(np.dot(grad_output, d_smoothness))
+        }
+
+    def constrain_params(self):
+        self.smoothness = max(self.smoothness, MIN_SCALE)
+
     def to_dict(self):
         """
         将规则转换为字典
@@ -272,6 +476,62 @@ class RangeRule(Rule):
         else:
             raise ValueError(f"未知模式: {self.mode}")
     
+    param_names = ("min_value", "max_value", "smoothness")
+
+    def prepare(self, batch):
+        return (batch.numeric(self.feature),)
+
+    def forward(self, inputs):
+        value, = inputs
+        missing = np.isnan(value)
+        value = np.where(missing, self.min_value, value)
+        below = value < self.min_value
+        above = value > self.max_value
+        smoothness = self.smoothness
+
+        if self.mode == "inside":
+            distance = np.where(below, self.min_value - value, np.where(above, value - self.max_value, 0.0))
+            result = np.exp(-distance / smoothness)
+            d_min = np.where(below, -result / smoothness, 0.0)
+            d_max = np.where(above, result / smoothness, 0.0)
+            d_smoothness = result * distance / smoothness ** 2
+        elif self.mode == "outside":
+            inside = ~below & ~above
+            center = (self.min_value + self.max_value) / 2
+            max_distance = (self.max_value - self.min_value) / 2
+            offset = value - center
+            internal_distance = np.abs(offset) / max_distance
+            decay = np.exp(-internal_distance / smoothness)
+            result = np.where(inside, 1 - decay, 1.0)
+            # u = |x-c|/h 对上下限的偏导
+            sign = np.sign(offset)
+            d_u = decay / smoothness
+            d_min = np.where(inside, d_u * 0.5 * (internal_distance - sign) / max_distance, 0.0)
+            d_max = np.where(inside, -d_u * 0.5 * (internal_distance + sign) / max_distance, 0.0)
+            d_smoothness = np.where(inside, -decay * internal_distance / smoothness ** 2, 0.0)
+        else:
+            raise ValueError(f"未知模式: {self.mode}")
+
+        result = np.where(missing, 0.5, result)
+        cache = tuple(np.where(missing, 0.0, d) for d in (d_min, d_max, d_smoothness))
+        return result, cache
+
+    def backward(self, cache, grad_output):
+        d_min, d_max, d_smoothness = cache
+        return {
+            "min_value": float(np.dot(grad_output, d_min)),
+            "max_value": float(np.dot(grad_output, d_max)),
+            "smoothness": float(np.dot(grad_output, d_smoothness))
+        }
+
+    def constrain_params(self):
+        self.smoothness = max(self.smoothness, MIN_SCALE)
+        # 保证 min < max，间隔过小时以中点为中心撑开
+        if self.max_value - self.min_value < MIN_RANGE_GAP:
+            center = (self.min_value + self.max_value) / 2
+            self.min_value = center - MIN_RANGE_GAP / 2
+            self.max_value = center + MIN_RANGE_GAP / 2
+
     def to_dict(self):
         """
         将规则转换为字典
@@ -339,6 +599,27 @@ class CategoricalRule(Rule):
         except ValueError:
             return self.default_value  # 未知类别时返回默认值
     
+    param_names = ("values",)
+
+    def prepare(self, batch):
+        return (batch.category_index(self.feature, self.categories),)
+
+    def forward(self, inputs):
+        index, = inputs
+        known = index >= 0
+        values = np.asarray(self.values, dtype=float)
+        if len(values) == 0:
+            return np.full(len(index), float(self.default_value)), index
+        result = np.where(known, values[np.where(known, index, 0)], self.default_value)
+        return result, index
+
+    def backward(self, cache, grad_output):
+        known = cache >= 0
+        return {"values": np.bincount(cache[known], weights=grad_output[known], minlength=len(self.values))}
+
+    def constrain_params(self):
+        self.values = np.clip(np.asarray(self.values, dtype=float), 0.0, 1.0).tolist()
+
     def to_dict(self):
         """
         将规则转换为字典
@@ -410,6 +691,26 @@ class RuleSet:
             "weighted_average": weighted_average
         }
     
+    def forward(self, inputs):
+        """
+        批量应用规则集
+
+        Args:
+            inputs: 与self.rules一一对应的规则输入（Rule.prepare的返回值）
+
+        Returns:
+            tuple: (规则结果矩阵[n, k], 各规则的反向缓存列表, 加权平均值数组[n])
+        """
+        outputs = [rule.forward(rule_inputs) for rule, rule_inputs in zip(self.rules, inputs)]
+        results = np.stack([result for result, _ in outputs], axis=1)
+        weights = np.array([rule.weight for rule in self.rules], dtype=float)
+        total_weight = weights.sum()
+        if total_weight > 0:
+            weighted_average = results @ weights / total_weight
+        else:
+            weighted_average = np.full(results.shape[0], 0.5)
+        return results, [cache for _, cache in outputs], weighted_average
+
     def to_dict(self):
         """
         将规则集转换为字典
@@ -458,10 +759,15 @@ class RuleSet:
 
 class DifferentiableRuleLearningFramework:
     """可微分规则学习框架"""
+    TRAINING_DATA_DIR = "training_data"  # 列式训练数据存储目录
+    LEGACY_TRAINING_DATA_FILE = "training_data.json"  # 旧版JSON训练数据
+
     def __init__(self):
         """初始化框架"""
         self.rule_sets = {}
-        self.training_data = []
+        self.training_data = []  # 尚未写入存储的训练数据
+        self.training_store = None  # 已持久化的训练数据（列式存储，按需内存映射）
+        self._legacy_training_path = None
     
     def add_rule_set(self, rule_set):
         """
@@ -481,6 +787,35 @@ class DifferentiableRuleLearningFramework:
             label: 标签
         """
         self.training_data.append((data, label))
+
+    def _load_legacy_training_data(self):
+        with open(self._legacy_training_path, 'r', encoding='utf-8') as f:
+            return [(data, label) for data, label in json.load(f)]
+
+    def _training_batch(self):
+        """
+        汇总存储中的和内存中的训练数据
+
+        Returns:
+            tuple: (FeatureBatch, 标签数组)
+        """
+        from rules.training_store import ConcatFeatureBatch
+
+        pending = list(self.training_data)
+        if self._legacy_training_path is not None:
+            pending = self._load_legacy_training_data() + pending
+
+        batches, labels = [], []
+        if self.training_store is not None and len(self.training_store):
+            batches.append(self.training_store.batch())
+            labels.append(np.asarray(self.training_store.labels(), dtype=float))
+        if pending:
+            batches.append(FeatureBatch([data for data, _ in pending]))
+            labels.append(np.array([label for _, label in pending], dtype=float))
+        if not batches:
+            return None, np.empty(0)
+        batch = batches[0] if len(batches) == 1 else ConcatFeatureBatch(batches)
+        return batch, np.concatenate(labels)
     
     def apply_rule_sets(self, data):
         """
@@ -499,60 +834,109 @@ class DifferentiableRuleLearningFramework:
         
         return results
     
-    def train(self, learning_rate=0.01, epochs=100):
+    def train(self, learning_rate=0.01, epochs=100, batch_size=32, param_learning_rate=None,
+              train_params=True, seed=None):
         """
-        训练规则权重
-        
+        训练规则权重与规则参数
+
+        训练数据只在开始时转换为特征列，之后每个小批量都用NumPy完成前向和解析梯度的反向传播，
+        同时更新规则权重和各规则自身的参数（阈值、平滑度、边界、类别取值等）。
+
         Args:
-            learning_rate: 学习率
+            learning_rate: 规则权重的学习率
             epochs: 训练轮数
+            batch_size: 小批量大小，为None时使用全部数据
+            param_learning_rate: 规则参数的学习率，默认与learning_rate相同
+            train_params: 是否训练规则参数（False时只训练权重）
+            seed: 打乱样本顺序的随机种子
             
         Returns:
             list: 训练损失历史
         """
-        if not self.training_data:
+        batch, labels = self._training_batch()
+        if batch is None:
             print("没有训练数据")
             return []
-        
+
+        if param_learning_rate is None:
+            param_learning_rate = learning_rate
+
+        sample_count = len(labels)
+        batch_size = sample_count if not batch_size else min(batch_size, sample_count)
+
+        # 每条规则的输入列只准备一次
+        prepared = {
+            name: [rule.prepare(batch) for rule in rule_set.rules]
+            for name, rule_set in self.rule_sets.items()
+        }
+
+        rng = np.random.default_rng(seed)
         loss_history = []
         
         for epoch in range(epochs):
             epoch_loss = 0
-            
-            for data, label in self.training_data:
-                # 前向传播
-                results = self.apply_rule_sets(data)
-                
-                # 计算损失
-                for rule_set_name, rule_set_result in results.items():
-                    prediction = rule_set_result["weighted_average"]
-                    loss = (prediction - label) ** 2
-                    epoch_loss += loss
-                    
-                    # 反向传播
-                    gradient = 2 * (prediction - label)
-                    
-                    # 更新规则权重
-                    rule_set = self.rule_sets[rule_set_name]
-                    total_weight = sum(rule.weight for rule in rule_set.rules)
-                    
-                    for rule in rule_set.rules:
-                        if rule.is_trainable:
-                            rule_result = rule_set_result["rule_results"][rule.name]
-                            weight_gradient = gradient * (rule_result - prediction) / total_weight
-                            rule.weight -= learning_rate * weight_gradient
-                            
-                            # 确保权重非负
-                            rule.weight = max(0.1, rule.weight)
+            order = rng.permutation(sample_count)
+
+            for start in range(0, sample_count, batch_size):
+                index = order[start:start + batch_size]
+                for rule_set_name, rule_set in self.rule_sets.items():
+                    if not rule_set.rules:
+                        continue
+                    inputs = [tuple(column[index] for column in rule_inputs)
+                              for rule_inputs in prepared[rule_set_name]]
+                    epoch_loss += self._train_step(rule_set, inputs, labels[index], learning_rate,
+                                                   param_learning_rate, train_params)
             
             # 记录平均损失
-            avg_loss = epoch_loss / len(self.training_data)
+            avg_loss = epoch_loss / sample_count
             loss_history.append(avg_loss)
             
             if (epoch + 1) % 10 == 0:
                 print(f"Epoch {epoch + 1}/{epochs}, Loss: {avg_loss:.4f}")
         
         return loss_history
+
+    @staticmethod
+    def _train_step(rule_set, inputs, labels, learning_rate, param_learning_rate, train_params):
+        """
+        对一个规则集执行一次小批量梯度下降
+
+        Args:
+            rule_set: 规则集
+            inputs: 小批量的规则输入
+            labels: 小批量标签
+            learning_rate: 权重学习率
+            param_learning_rate: 参数学习率
+            train_params: 是否训练规则参数
+
+        Returns:
+            float: 小批量的平方误差和
+        """
+        # 前向传播
+        results, caches, prediction = rule_set.forward(inputs)
+        error = prediction - labels
+        loss = float(np.dot(error, error))
+
+        # 反向传播：p = Σ w_j r_j / W
+        gradient = 2 * error / len(labels)
+        weights = np.array([rule.weight for rule in rule_set.rules], dtype=float)
+        total_weight = weights.sum()
+        if total_weight <= 0:
+            return loss
+        weight_gradients = gradient @ (results - prediction[:, None]) / total_weight
+
+        for j, rule in enumerate(rule_set.rules):
+            if not rule.is_trainable:
+                continue
+            if train_params:
+                param_gradients = rule.backward(caches[j], gradient * weights[j] / total_weight)
+                rule.update_params(param_gradients, param_learning_rate)
+            rule.weight -= learning_rate * float(weight_gradients[j])
+
+            # 确保权重非负
+            rule.weight = max(0.1, rule.weight)
+
+        return loss
     
     def save(self, directory):
         """
@@ -568,10 +952,29 @@ class DifferentiableRuleLearningFramework:
             file_path = os.path.join(directory, f"{name}.json")
             rule_set.save(file_path)
         
-        # 保存训练数据
-        training_data_path = os.path.join(directory, "training_data.json")
-        with open(training_data_path, 'w', encoding='utf-8') as f:
-            json.dump(self.training_data, f, ensure_ascii=False, indent=2)
+        # 保存训练数据：追加到列式存储，旧版JSON数据一并迁移
+        from rules.training_store import TrainingDataStore
+
+        store_dir = os.path.join(directory, self.TRAINING_DATA_DIR)
+        current_dir = self.training_store.directory if self.training_store is not None else None
+        if current_dir is not None and os.path.abspath(current_dir) != os.path.abspath(store_dir):
+            if os.path.exists(store_dir):
+                shutil.rmtree(store_dir)
+            shutil.copytree(current_dir, store_dir)
+        store = TrainingDataStore(store_dir)
+
+        pending = list(self.training_data)
+        if self._legacy_training_path is not None:
+            pending = self._load_legacy_training_data() + pending
+        store.extend(pending)
+
+        legacy_path = os.path.join(directory, self.LEGACY_TRAINING_DATA_FILE)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+        self.training_store = store
+        self.training_data = []
+        self._legacy_training_path = None
     
     @staticmethod
     def load(directory):
@@ -588,16 +991,20 @@ class DifferentiableRuleLearningFramework:
         
         # 加载规则集
         for file_name in os.listdir(directory):
-            if file_name.endswith(".json") and file_name != "training_data.json":
+            if file_name.endswith(".json") and file_name != DifferentiableRuleLearningFramework.LEGACY_TRAINING_DATA_FILE:
                 file_path = os.path.join(directory, file_name)
                 rule_set = RuleSet.load(file_path)
                 framework.add_rule_set(rule_set)
         
-        # 加载训练数据
-        training_data_path = os.path.join(directory, "training_data.json")
-        if os.path.exists(training_data_path):
-            with open(training_data_path, 'r', encoding='utf-8') as f:
-                framework.training_data = json.load(f)
+        # 训练数据只打开存储的元数据，训练时才读取样本
+        from rules.training_store import TrainingDataStore
+
+        store_dir = os.path.join(directory, DifferentiableRuleLearningFramework.TRAINING_DATA_DIR)
+        if TrainingDataStore.exists(store_dir):
+            framework.training_store = TrainingDataStore(store_dir)
+        legacy_path = os.path.join(directory, DifferentiableRuleLearningFramework.LEGACY_TRAINING_DATA_FILE)
+        if os.path.exists(legacy_path):
+            framework._legacy_training_path = legacy_path
         
         return framework
 
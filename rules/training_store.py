@@ -0,0 +1,304 @@
+"""
+本模块包含规则学习框架的列式二进制训练数据存储
+
+每个特征一列，数值列以float64、类别列以int32编码存放在独立的二进制文件中，
+可直接内存映射读取并追加写入；列定义、类别表和行数记录在meta.json里。
+"""
+import json
+import os
+
+import numpy as np
+
+from rules.differentiable_rule import FeatureBatch
+
+
+class TrainingDataStore:
+    """列式训练数据存储"""
+    META_FILE = "meta.json"
+    LABEL_FILE = "labels.f8"
+    NUMERIC = "numeric"
+    CATEGORICAL = "categorical"
+    DTYPES = {NUMERIC: np.float64, CATEGORICAL: np.int32}
+
+    def __init__(self, directory):
+        """
+        打开（或新建）训练数据存储，只读取元数据，不加载样本
+
+        Args:
+            directory: 存储目录
+        """
+        self.directory = directory
+        meta_path = os.path.join(directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self._meta = json.load(f)
+        else:
+            self._meta = {"rows": 0, "columns": []}
+        self._columns = {column["name"]: column for column in self._meta["columns"]}
+
+    @staticmethod
+    def exists(directory):
+        """
+        判断目录下是否已有训练数据存储
+
+        Args:
+            directory: 存储目录
+
+        Returns:
+            bool: 是否存在
+        """
+        return os.path.exists(os.path.join(directory, TrainingDataStore.META_FILE))
+
+    def __len__(self):
+        return self._meta["rows"]
+
+    @property
+    def feature_names(self):
+        return list(self._columns)
+
+    def append(self, data, label):
+        """
+        追加一条训练数据
+
+        Args:
+            data: 输入数据
+            label: 标签
+        """
+        self.extend([(data, label)])
+
+    def extend(self, samples):
+        """
+        批量追加训练数据
+
+        Args:
+            samples: (输入数据, 标签) 列表
+        """
+        samples = list(samples)
+        if not samples:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        rows = len(self)
+        self._truncate(rows)
+
+        # 新出现的特征先登记并用缺失值补齐已有行
+        for data, _ in samples:
+            for name, value in data.items():
+                if name not in self._columns and value is not None:
+                    self._add_column(name, value, rows)
+
+        for name, column in self._columns.items():
+            values = [data.get(name) for data, _ in samples]
+            self._write(column["file"], self._encode(column, values))
+        self._write(self.LABEL_FILE, np.array([label for _, label in samples], dtype=np.float64))
+
+        self._meta["rows"] = rows + len(samples)
+        self._save_meta()
+
+    def column(self, name):
+        """
+        内存映射读取一列
+
+        Args:
+            name: 特征名
+
+        Returns:
+            np.ndarray: 列数据（只读），特征不存在时返回None
+        """
+        column = self._columns.get(name)
+        if column is None:
+            return None
+        return self._map(column["file"], self.DTYPES[column["kind"]])
+
+    def labels(self):
+        """
+        内存映射读取标签列
+
+        Returns:
+            np.ndarray: 标签数组（只读）
+        """
+        return self._map(self.LABEL_FILE, np.float64)
+
+    def batch(self):
+        """
+        以列的形式构造批量特征，不还原为逐条字典
+
+        Returns:
+            ColumnarFeatureBatch: 批量特征
+        """
+        return ColumnarFeatureBatch(self)
+
+    def categories(self, name):
+        """
+        取类别列的类别表
+
+        Args:
+            name: 特征名
+
+        Returns:
+            list: 类别表，非类别列返回None
+        """
+        column = self._columns.get(name)
+        if column is None or column["kind"] != self.CATEGORICAL:
+            return None
+        return column["categories"]
+
+    def is_numeric(self, name):
+        column = self._columns.get(name)
+        return column is not None and column["kind"] == self.NUMERIC
+
+    def __iter__(self):
+        """逐条还原为 (输入数据, 标签)，仅用于兼容旧接口"""
+        columns = {name: self.column(name) for name in self._columns}
+        labels = self.labels()
+        for i in range(len(self)):
+            data = {}
+            for name, values in columns.items():
+                value = self._decode(self._columns[name], values[i])
+                if value is not None:
+                    data[name] = value
+            yield data, float(labels[i])
+
+    def _add_column(self, name, value, rows):
+        # 按值能否转为数值决定列的类型，"120.5" 这样以字符串给出的数值也按数值列存储
+        try:
+            float(value)
+            kind = self.NUMERIC
+        except (TypeError, ValueError):
+            kind = self.CATEGORICAL
+        column = {"name": name, "file": f"col_{len(self._columns):04d}.bin", "kind": kind}
+        if kind == self.CATEGORICAL:
+            column["categories"] = []
+            column["_lookup"] = {}
+        self._meta["columns"].append(column)
+        self._columns[name] = column
+        self._write(column["file"], self._encode(column, [None] * rows))
+
+    def _encode(self, column, values):
+        if column["kind"] == self.NUMERIC:
+            encoded = np.full(len(values), np.nan)
+            for i, value in enumerate(values):
+                try:
+                    encoded[i] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            return encoded
+
+        lookup = column.get("_lookup")
+        if lookup is None:
+            lookup = column["_lookup"] = {category: i for i, category in enumerate(column["categories"])}
+        encoded = np.full(len(values), -1, dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None or not isinstance(value, (str, int, float, bool)):
+                continue
+            if value not in lookup:
+                lookup[value] = len(column["categories"])
+                column["categories"].append(value)
+            encoded[i] = lookup[value]
+        return encoded
+
+    def _decode(self, column, value):
+        if column["kind"] == self.NUMERIC:
+            return None if np.isnan(value) else float(value)
+        return None if value < 0 else column["categories"][value]
+
+    def _path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def _map(self, file_name, dtype):
+        rows = len(self)
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(file_name), dtype=dtype, mode='r', shape=(rows,))
+
+    def _write(self, file_name, array):
+        with open(self._path(file_name), 'ab') as f:
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _truncate(self, rows):
+        """截掉上次中断写入残留在文件尾部、未计入元数据的数据"""
+        files = [(self.LABEL_FILE, np.float64)]
+        files += [(column["file"], self.DTYPES[column["kind"]]) for column in self._columns.values()]
+        for file_name, dtype in files:
+            path = self._path(file_name)
+            expected = rows * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > expected:
+                with open(path, 'r+b') as f:
+                    f.truncate(expected)
+
+    def _save_meta(self):
+        meta = {
+            "rows": self._meta["rows"],
+            "columns": [{k: v for k, v in column.items() if not k.startswith("_")}
+                        for column in self._meta["columns"]]
+        }
+        meta_path = self._path(self.META_FILE)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, meta_path)
+
+
+class ColumnarFeatureBatch(FeatureBatch):
+    """
+    直接基于列式存储的批量特征
+    """
+    def __init__(self, store):
+        super().__init__([])
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def numeric(self, feature):
+        if feature not in self._numeric_cache:
+            if self._store.is_numeric(feature):
+                column = np.array(self._store.column(feature), dtype=float)
+            else:
+                column = np.full(len(self), np.nan)
+            self._numeric_cache[feature] = column
+        return self._numeric_cache[feature]
+
+    def category_index(self, feature, categories):
+        key = (feature, tuple(categories))
+        if key not in self._category_cache:
+            lookup = {category: i for i, category in enumerate(categories)}
+            stored_categories = self._store.categories(feature)
+            if stored_categories is not None:
+                # 存储内的类别编码 -> 规则类别索引
+                table = np.array([lookup.get(category, -1) for category in stored_categories] + [-1],
+                                 dtype=np.int64)
+                codes = np.asarray(self._store.column(feature))
+                column = table[np.where(codes >= 0, codes, len(stored_categories))]
+            else:
+                column = np.full(len(self), -1, dtype=np.int64)
+                if self._store.is_numeric(feature):
+                    values = np.asarray(self._store.column(feature))
+                    for i, category in enumerate(categories):
+                        if isinstance(category, (int, float)) and not isinstance(category, bool):
+                            column[values == category] = i
+            self._category_cache[key] = column
+        return self._category_cache[key]
+
+
+class ConcatFeatureBatch(FeatureBatch):
+    """
+    按行拼接多个批量特征
+    """
+    def __init__(self, batches):
+        super().__init__([])
+        self._batches = batches
+
+    def __len__(self):
+        return sum(len(batch) for batch in self._batches)
+
+    def numeric(self, feature):
+        if feature not in self._numeric_cache:
+            self._numeric_cache[feature] = np.concatenate([batch.numeric(feature) for batch in self._batches])
+        return self._numeric_cache[feature]
+
+    def category_index(self, feature, categories):
+        key = (feature, tuple(categories))
+        if key not in self._category_cache:
+            self._category_cache[key] = np.concatenate(
+                [batch.category_index(feature, categories) for batch in self._batches])
+        return self._category_cache[key]
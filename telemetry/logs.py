@@ -0,0 +1,193 @@
+"""
+本模块包含结构化日志
+
+日志先经级别过滤与请求采样，再由 QueueHandler 放入有界队列，由后台线程格式化并写出，请求线程不做同步IO；
+每条日志附带当前请求ID（同一请求内的大模型、OCR、数据库调用共用），与追踪数据中的 request_id 属性一致。
+
+环境变量:
+    SNAPROP_LOG_LEVEL   日志级别，默认 INFO；请求明细（会话、请求头等）为 DEBUG
+    SNAPROP_LOG_SAMPLE  DEBUG 级别请求明细的采样率（0-1），按请求整体采样，默认 0.01
+    SNAPROP_LOG_FORMAT  json（默认，每行一条JSON）或 text
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL_ENV = "SNAPROP_LOG_LEVEL"
+LOG_SAMPLE_ENV = "SNAPROP_LOG_SAMPLE"
+LOG_FORMAT_ENV = "SNAPROP_LOG_FORMAT"
+ROOT_LOGGER = "snaprop"
+LOG_QUEUE_SIZE = 10000  # 待写出日志的上限，超出丢弃
+DEFAULT_SAMPLE_RATE = 0.01
+REDACTED = "***"
+# 写入日志前打码的键（不区分大小写，包含即打码）：认证请求头、会话令牌与各类密钥
+SENSITIVE_KEYS = ("authorization", "cookie", "token", "secret", "password", "csrf", "api-key", "api_key")
+
+_request_id = contextvars.ContextVar("snaprop_request_id", default="-")
+_sampled = contextvars.ContextVar("snaprop_log_sampled", default=True)
+
+_setup_lock = threading.Lock()
+_listener = None
+_sample_rate = DEFAULT_SAMPLE_RATE
+dropped_records = 0  # 队列已满而丢弃的日志条数
+
+
+class ContextFilter(logging.Filter):
+    """
+    在调用线程中附加请求ID，并丢弃未被采样请求的采样日志（extra={"sampled": True}）
+    """
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and not _sampled.get():
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    队列满时丢弃日志而不阻塞调用线程
+    """
+
+    def enqueue(self, record):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志一行JSON：时间、级别、模块、请求ID、消息，以及 extra={"fields": {...}} 中的结构化字段
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + json.dumps(fields, ensure_ascii=False, default=str)
+        return text
+
+
+def setup(level: str = None, sample_rate: float = None, fmt: str = None, stream=None):
+    """
+    配置 snaprop 日志（只生效一次，get_logger 首次调用时自动按环境变量配置）
+
+    Args:
+        level: 日志级别
+        sample_rate: DEBUG 级别请求明细的采样率
+        fmt: json 或 text
+        stream: 输出流，默认标准输出
+    """
+    global _listener, _sample_rate
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = (level or os.environ.get(LOG_LEVEL_ENV) or "INFO").upper()
+        if sample_rate is None:
+            sample_rate = float(os.environ.get(LOG_SAMPLE_ENV, DEFAULT_SAMPLE_RATE))
+        _sample_rate = min(max(sample_rate, 0.0), 1.0)
+        fmt = (fmt or os.environ.get(LOG_FORMAT_ENV) or "json").lower()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.handlers[:] = [handler]
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    取模块日志器，如 get_logger("web") 即 snaprop.web
+    """
+    if _listener is None:
+        setup()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def bind_request(request_id: str = None):
+    """
+    为当前请求设置请求ID并决定是否采样，必须与 unbind_request 成对调用
+
+    Args:
+        request_id: 上游传入的请求ID，为空时生成新的
+
+    Returns:
+        tuple: (请求ID, 用于恢复的令牌)
+    """
+    if _listener is None:
+        setup()
+    request_id = (request_id or "")[:64] or secrets.token_hex(8)
+    tokens = (_request_id.set(request_id), _sampled.set(random.random() < _sample_rate))
+    return request_id, tokens
+
+
+def unbind_request(tokens):
+    request_token, sampled_token = tokens
+    _sampled.reset(sampled_token)
+    _request_id.reset(request_token)
+
+
+def get_request_id() -> str:
+    """当前请求ID，不在请求内时为 "-" """
+    return _request_id.get()
+
+
+def is_sampled() -> bool:
+    """当前请求是否被采样，用于在构造开销较大的明细前提前判断"""
+    return _sampled.get()
+
+
+def redact(mapping) -> dict:
+    """
+    复制请求头、会话等键值对，敏感键的值替换为 ***
+    :param mapping: 键值对（dict、werkzeug Headers、flask session）
+    :return: 可以写入日志的 dict
+    """
+    return {key: REDACTED if any(word in str(key).lower() for word in SENSITIVE_KEYS) else value
+            for key, value in dict(mapping).items()}
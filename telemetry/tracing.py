@@ -0,0 +1,418 @@
+"""
+本模块包含轻量级链路追踪与分阶段耗时指标
+
+用 span 包裹一次处理中的各个阶段（Estimator 的各处理步骤、大模型调用、数据库查询、外部HTTP请求、PDF渲染），
+同一请求内的 span 通过 contextvars 形成父子关系。每个 span 结束时：
+1. 耗时计入按阶段名区分的直方图，由 render_metrics 输出为 Prometheus 文本格式（web.py 的 /metrics）
+2. 若配置了导出，放入有界队列，由后台线程批量写出；队列满时直接丢弃，不阻塞请求
+
+导出方式由环境变量 SNAPROP_TRACE_EXPORT 指定：
+    未设置或为空        不导出，只统计指标
+    json:<文件路径>     每个 span 一行JSON
+    otlp:<collector地址> 以 OTLP/HTTP JSON 发送到 OpenTelemetry collector，如 otlp:http://127.0.0.1:4318
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+TRACE_EXPORT_ENV = "SNAPROP_TRACE_EXPORT"
+SERVICE_NAME = "snaprop"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # 秒
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+EXPORT_QUEUE_SIZE = 4096  # 待导出 span 的上限，超出丢弃
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 2.0  # 后台线程最长攒批时间（秒）
+
+_current_span = contextvars.ContextVar("snaprop_current_span", default=None)
+
+
+class Span:
+    """
+    一个处理阶段
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "OK"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒），未结束时为到现在的耗时"""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class Histogram:
+    """
+    按一个标签区分的累积直方图（Prometheus 语义）
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape_label(label_value)}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """
+    按一个标签区分的计数器
+    """
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: int = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_value, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape_label(label_value)}"}} {value}')
+        return lines
+
+
+STAGE_DURATION = Histogram("snaprop_stage_duration_seconds", "各处理阶段耗时（秒）", "stage")
+STAGE_ERRORS = Counter("snaprop_stage_errors_total", "各处理阶段抛出异常的次数", "stage")
+DROPPED_SPANS = Counter("snaprop_trace_dropped_spans_total", "导出队列已满而丢弃的span数", "reason")
+LLM_PROMPT_TOKENS = Histogram("snaprop_llm_prompt_tokens", "每次大模型调用的提示词token数", "operation", TOKEN_BUCKETS)
+LLM_RESPONSE_TOKENS = Histogram("snaprop_llm_response_tokens", "每次大模型调用的回复token数", "operation", TOKEN_BUCKETS)
+LLM_ROUTE_DURATION = Histogram("snaprop_llm_route_duration_seconds", "各路由（任务:服务）的大模型调用耗时（秒）", "route")
+LLM_HEDGES = Counter("snaprop_llm_hedges_total", "对冲请求的发出原因与胜出方", "event")
+
+
+class JsonLinesExporter:
+    """
+    每个 span 一行JSON，追加写入本地文件
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: list[Span]):
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+                f.write("\n")
+
+
+class OtlpHttpExporter:
+    """
+    以 OTLP/HTTP JSON 格式发送到 OpenTelemetry collector 的 /v1/traces
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith("/v1/traces") else f"{endpoint}/v1/traces"
+        self.timeout = timeout
+
+    def export(self, spans: list[Span]):
+        from urllib.request import Request, urlopen
+
+        body = json.dumps(self.payload(spans), ensure_ascii=False, default=str).encode('utf-8')
+        request = Request(self.url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    @staticmethod
+    def payload(spans: list[Span]) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "snaprop.tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+                    "status": {"code": 2 if span.status == "ERROR" else 1}
+                } for span in spans]
+            }]
+        }]}
+
+
+class BatchSpanProcessor:
+    """
+    有界队列 + 后台线程批量导出，请求线程只做一次非阻塞入队
+    """
+
+    def __init__(self, exporter, queue_size: int = EXPORT_QUEUE_SIZE, batch_size: int = EXPORT_BATCH_SIZE,
+                 interval: float = EXPORT_INTERVAL):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            DROPPED_SPANS.inc("queue_full")
+
+    def flush(self, timeout: float = 5.0):
+        """立即导出已入队的 span 并等待完成"""
+        deadline = time.monotonic() + timeout
+        try:
+            # None 让后台线程不再攒批，立即导出当前批次
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            batch = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.interval
+            while item is not None:
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self.exporter.export(batch)
+            except Exception as e:
+                DROPPED_SPANS.inc("export_error", len(batch))
+                print(f"导出追踪数据失败: {str(e)}")
+            finally:
+                for _ in range(len(batch) + (item is None)):
+                    self._queue.task_done()
+
+
+_processor = None
+_processor_lock = threading.Lock()
+_configured = False
+
+
+def configure(exporter=None):
+    """
+    设置导出方式，exporter 为 None 时关闭导出（指标照常统计）
+
+    Args:
+        exporter: 带有 export(spans) 方法的对象，如 JsonLinesExporter、OtlpHttpExporter
+    """
+    global _processor, _configured
+    with _processor_lock:
+        _processor = BatchSpanProcessor(exporter) if exporter is not None else None
+        _configured = True
+
+
+def exporter_from_env():
+    """
+    按 SNAPROP_TRACE_EXPORT 创建导出器
+
+    Returns:
+        导出器，未配置时为 None
+    """
+    setting = os.environ.get(TRACE_EXPORT_ENV, "").strip()
+    if not setting:
+        return None
+    kind, _, target = setting.partition(":")
+    if kind == "json" and target:
+        return JsonLinesExporter(target)
+    if kind == "otlp" and target:
+        return OtlpHttpExporter(target)
+    print(f"无法识别的 {TRACE_EXPORT_ENV}: {setting}，不导出追踪数据")
+    return None
+
+
+def _get_processor():
+    global _processor, _configured
+    if not _configured:
+        with _processor_lock:
+            if not _configured:
+                exporter = exporter_from_env()
+                _processor = BatchSpanProcessor(exporter) if exporter is not None else None
+                _configured = True
+    return _processor
+
+
+def flush(timeout: float = 5.0):
+    """等待已结束的 span 导出完毕（进程退出或测试时使用）"""
+    processor = _processor
+    if processor is not None:
+        processor.flush(timeout)
+
+
+def start_span(name: str, **attributes):
+    """
+    开始一个 span 并设为当前 span，必须与 end_span 成对调用
+    （用于无法使用 with 的场合，如 Flask 的 before_request / teardown_request）
+
+    Returns:
+        tuple: (Span, 用于恢复上一个当前 span 的令牌)
+    """
+    span = Span(name, _current_span.get(), attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span: Span, token, error: BaseException = None):
+    """
+    结束 span：恢复上一个当前 span，记录耗时指标并提交导出
+    """
+    span.end_ns = time.time_ns()
+    _current_span.reset(token)
+    if error is not None:
+        span.status = "ERROR"
+        span.set_attribute("error", f"{type(error).__name__}: {error}"[:200])
+        STAGE_ERRORS.inc(span.name)
+    STAGE_DURATION.observe(span.name, span.duration)
+    processor = _get_processor()
+    if processor is not None:
+        processor.on_end(span)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    用 with 包裹一个处理阶段
+
+    Args:
+        name: 阶段名，同时作为耗时指标的 stage 标签，如 "llm.classify_message"
+        attributes: 附加属性
+    """
+    current, token = start_span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, token, e)
+        raise
+    else:
+        end_span(current, token)
+
+
+def traced(name: str):
+    """
+    把整个函数调用记为一个 span 的装饰器
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """当前 span，不在任何 span 内时为 None"""
+    return _current_span.get()
+
+
+def set_attribute(key: str, value):
+    """给当前 span 添加属性，不在任何 span 内时忽略"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+def url_attribute(url: str) -> str:
+    """去掉查询参数（其中可能含有 ak 等密钥）后的URL，用作 span 属性"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def render_metrics() -> str:
+    """
+    Prometheus 文本格式的全部指标
+    """
+    lines = STAGE_DURATION.render() + STAGE_ERRORS.render() + DROPPED_SPANS.render()
+    lines += LLM_PROMPT_TOKENS.render() + LLM_RESPONSE_TOKENS.render()
+    lines += LLM_ROUTE_DURATION.render() + LLM_HEDGES.render()
+    return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _otlp_attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
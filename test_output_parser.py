@@ -0,0 +1,23 @@
+"""
+llm/output_parser.py 的截断修复测试：输出被截断时丢弃最后一个未输出完的元素，而不是把半个值当作结果
+
+用法:
+    python -m pytest -q test_output_parser.py
+"""
+from llm.output_parser import parse_literal, parse_pairs
+
+
+def test_truncated_pair_list_drops_partial_number():
+    # 13 是 136.79 被截断后剩下的部分，不能当作面积
+    text = "[['city','上海'],['house_area',13"
+    assert parse_literal(text) == [['city', '上海'], ['house_area']]
+    assert parse_pairs(text) == [['city', '上海']]
+
+
+def test_truncated_dict_drops_partial_string():
+    # "3室2 是被截断的户型，只保留已完整输出的字段
+    assert parse_literal('{"area": 136.7, "type": "3室2') == {'area': 136.7}
+
+
+def test_complete_literal_unchanged():
+    assert parse_literal('结果：[["city", "上海"], ["house_area", 136.79]]') == [['city', '上海'], ['house_area', 136.79]]
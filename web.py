@@ -1,30 +1,38 @@
-from flask import Flask, render_template, request, url_for, jsonify, send_file, session, redirect
+from flask import Flask, Response, g, render_template, request, url_for, jsonify, send_file, session, redirect
 
 from datetime import datetime
+import logging
 import os
 from pathlib import Path
-import pandas as pd
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment
-from report.ocr import OCR_Table
 from config.path_config import UPLOAD_FOLDER, OCR_PATH, REPORT_PATH
 from estimator import Estimator
 from record.record import Record
+from record.uploads import save_upload
 from llm.llm_manager import QianwenManager
-import time
+from telemetry.tracing import start_span, end_span, render_metrics
+from telemetry.logs import get_logger, bind_request, unbind_request, is_sampled, redact
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
+import uuid
+from werkzeug.utils import secure_filename
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 app = Flask(__name__, template_folder=TEMPLATE_DIR)
 app.secret_key = secrets.token_hex(16)
 
+logger = get_logger("web")
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OCR_PATH'] = OCR_PATH
 app.config['REPORT_PATH'] = REPORT_PATH
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("SNAPROP_UPLOAD_MAX_MB", 16)) * 1024 * 1024  # 上传大小上限，超出返回413
+app.config['OCR_EXPORT_ASYNC'] = False  # 保存OCR表格后是否立即在后台线程导出Excel，否则在下载时导出
 
 user_sessions = {}  # 全局用户会话存储
+_ocr_table = None  # OCR处理器（内部复用客户端池），首次识别时创建
+_ocr_cache = None  # OCR结果缓存，按图片内容哈希去重
+_ocr_writer = None  # OCR表格Excel后台写入线程
 
 # 模拟用户数据库（实际应使用真实数据库）
 mock_users_db = {
@@ -103,19 +111,20 @@ def register():
 
 def login_required(f):
     def wrapper(*args, **kwargs):
-        print(f"Checking session in login_required: {session}")
-        print(f"Request path: {request.path}")
-        print(f"Request method: {request.method}")
-        print(f"Request headers: {dict(request.headers)}")
+        # 请求明细只在 DEBUG 级别且本请求被采样时才构造；Cookie、Authorization 与会话中的令牌打码后再写入
+        if logger.isEnabledFor(logging.DEBUG) and is_sampled():
+            logger.debug("检查登录状态", extra={"sampled": True, "fields": {
+                "session": redact(session), "path": request.path, "method": request.method,
+                "headers": redact(request.headers)
+            }})
 
         if 'username' not in session:
-            print("No username in session, redirecting to login")
+            logger.info("未登录，跳转到登录页", extra={"fields": {"path": request.path}})
             # 检查是否是 AJAX 请求
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'success': False, 'message': '用户未登录'}), 401
             return redirect(url_for('login'))
 
-        print(f"User {session['username']} is authenticated")
         return f(*args, **kwargs)
 
     wrapper.__name__ = f.__name__
@@ -125,7 +134,7 @@ def login_required(f):
 def get_or_create_user_session():
     """获取或创建用户会话"""
     uid = session.get('uid')
-    print(f"Getting user session for uid: {uid}")
+    logger.debug("获取用户会话", extra={"fields": {"uid": uid}})
 
     if not uid:
         raise ValueError("UID not found in session")  # 防止意外情况
@@ -146,6 +155,33 @@ def get_or_create_user_session():
     return user_sessions[uid]
 
 
+def get_ocr_table():
+    """取全局OCR处理器"""
+    global _ocr_table
+    if _ocr_table is None:
+        from report.ocr import OCR_Table
+        _ocr_table = OCR_Table()
+    return _ocr_table
+
+
+def get_ocr_cache():
+    """取全局OCR结果缓存"""
+    global _ocr_cache
+    if _ocr_cache is None:
+        from report.ocr_cache import OcrResultCache
+        _ocr_cache = OcrResultCache()
+    return _ocr_cache
+
+
+def get_ocr_writer():
+    """取全局OCR表格Excel写入线程"""
+    global _ocr_writer
+    if _ocr_writer is None:
+        from report.ocr_export import OcrExcelWriter
+        _ocr_writer = OcrExcelWriter()
+    return _ocr_writer
+
+
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -163,19 +199,11 @@ def upload_file():
         return jsonify(success=False, error="No selected file")
 
     if file and allowed_file(file.filename):
-        filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}"
-        # 使用pathlib处理路径
-        save_path = Path(app.config['UPLOAD_FOLDER']) / filename
-        save_path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            # 保存文件
-            with open(save_path, 'wb') as f:
-                f.write(file.read())
-            # 验证
-            if not save_path.exists():
-                return jsonify(success=False, error="文件保存失败"), 500
+            # 分块写入磁盘，按内容哈希命名：并发上传不会重名，重复的照片只存一份
+            filename = save_upload(file.stream, app.config['UPLOAD_FOLDER'], Path(file.filename).suffix)
         except Exception as e:
-            print(f"保存异常: {str(e)}")
+            logger.exception("保存上传文件失败")
             return jsonify(success=False, error=str(e)), 500
         web_url = url_for('static', filename=f'uploads/{filename}')
 
@@ -189,6 +217,47 @@ def upload_file():
     return jsonify(success=False, error="Invalid file type")
 
 
+@app.errorhandler(413)
+def file_too_large(e):
+    limit = app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024
+    return jsonify(success=False, error=f"文件过大，上限为{limit:.0f}MB"), 413
+
+
+@app.before_request
+def start_request_context():
+    """
+    绑定请求ID（沿用上游的 X-Request-ID），并为每个请求开一个根 span，请求内的各处理阶段挂在其下
+    """
+    g.request_id, g.request_log = bind_request(request.headers.get('X-Request-ID'))
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_span = start_span(f"{request.method} {rule}", path=request.path, request_id=g.request_id)
+
+
+@app.after_request
+def record_response_status(response):
+    if 'request_span' in g:
+        g.request_span[0].set_attribute("status_code", response.status_code)
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+
+@app.teardown_request
+def end_request_context(error=None):
+    started = g.pop('request_span', None)
+    if started:
+        end_span(*started, error)
+    tokens = g.pop('request_log', None)
+    if tokens:
+        unbind_request(tokens)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标：各处理阶段的耗时直方图与异常次数"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/')
 @login_required
 def index():
@@ -209,7 +278,7 @@ def chat():
         user_sessions[session['uid']]['estimator'].interact_estimator()
         # 获取处理结果
         response = user_sessions[session['uid']]['estimator'].get_analyst_result()[0]
-        print(response)
+        logger.debug("回复", extra={"fields": {"response": response}})
         if user_sessions[session['uid']]['estimator'].is_report():
             return jsonify({
                 "response": response,
@@ -221,7 +290,7 @@ def chat():
                 "isReport": False
             })
     except Exception as e:
-        print(e)
+        logger.exception("对话处理失败")
         return jsonify({"error": str(e)}), 500
 
 
@@ -232,29 +301,33 @@ def get_ocr_result():
         data = request.get_json()
         if not data or 'filename' not in data:
             return jsonify({"error": "Invalid request format"}), 400
-        filename = data['filename']
-        filepath = Path(app.config['OCR_PATH']) / filename
-        print(filepath)
-        user_sessions[session['uid']]['estimator'].interact_table(filepath)
+        if not user_sessions[session['uid']]['record'].production_ocr_table:
+            return jsonify({"error": "尚未保存OCR表格"}), 400
+        user_sessions[session['uid']]['estimator'].interact_table()
         response = user_sessions[session['uid']]['estimator'].get_analyst_result()[0]
-        print(response)
+        logger.debug("回复", extra={"fields": {"filename": data['filename'], "response": response}})
         return jsonify({
             "response": response
         })
     except Exception as e:
-        print("error", e)
+        logger.exception("OCR表格分析失败")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
-        print(filename)
         ext = Path(filename).suffix.lower()
         if ext == ".pdf":
             file_path = Path(app.config['REPORT_PATH']) / filename
         elif ext == ".xlsx":
             file_path = Path(app.config['OCR_PATH']) / filename
+            record = user_sessions[session['uid']]['record'] if session.get('uid') in user_sessions else None
+            # OCR表格只在用户下载时才导出为Excel；后台导出未完成时等待同一任务
+            if (not get_ocr_writer().wait(file_path) and not file_path.exists() and record is not None
+                    and record.production_ocr_table and record.production_ocr == str(file_path.resolve())):
+                from report.ocr_export import write_table_xlsx
+                write_table_xlsx(record.production_ocr_table, file_path)
         else:
             return jsonify(success=False, error="错误的文件名"), 404
         if not file_path.exists():
@@ -269,109 +342,37 @@ def download_file(filename):
         return jsonify(success=False, error=str(e)), 500
 
 
-# 自动调整行高
-def auto_adjust_row_height(ws):
-    for row in ws.iter_rows():
-        max_lines = 1
-        for cell in row:
-            if cell.value:
-                # 计算换行数
-                lines = str(cell.value).count('\n') + 1
-                max_lines = max(max_lines, lines)
-        ws.row_dimensions[row[0].row].height = 15 * max_lines
-
-
 @app.route('/save_ocr_data', methods=['POST'])
 def save_ocr_data():
     try:
         data = request.json
         final_data = data.get('ocr_data', {})
-        print(final_data)
+        logger.debug("保存OCR表格", extra={"fields": {"sheets": len(final_data)}})
 
         if not final_data:
             return jsonify(success=False, error="空数据"), 400
 
-        # 创建唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"ocr_data_{timestamp}.xlsx"
+        # 创建唯一文件名，Excel在下载时才生成；同一秒内多个用户保存时靠用户ID与随机串区分
+        now = datetime.now()
+        filename = (f"ocr_data_{secure_filename(str(session['uid']))}_{now.strftime('%Y%m%d_%H%M%S')}_"
+                    f"{uuid.uuid4().hex[:12]}.xlsx")
         file_path = Path(app.config['OCR_PATH']) / filename
 
-        # 确保目录存在
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # 直接写入本地文件
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            for sheet_name, sheet_data in final_data.items():
-                # 保存数据
-                df = pd.DataFrame(
-                    sheet_data['data'],
-                    columns=sheet_data.get('columns', [])
-                )
-                df.to_excel(
-                    writer,
-                    sheet_name=sheet_name[:31],
-                    index=False,
-                    header=False
-                )
-
-                # 恢复合并单元格
-                worksheet = writer.sheets[sheet_name[:31]]
-                # 设置全局居中样式
-                alignment = Alignment(wrapText=True, horizontal='center', vertical='center')
-
-                # 遍历所有单元格（从第1行开始）
-                for row in worksheet.iter_rows(min_row=1):  # min_row=1跳过标题行
-                    for cell in row:
-                        cell.alignment = alignment
-                for merge in sheet_data.get('merges', []):
-                    worksheet.merge_cells(
-                        start_row=merge['start_row'] + 1,  # 转换回1-based索引
-                        end_row=merge['end_row'] + 1,
-                        start_column=merge['start_col'] + 1,
-                        end_column=merge['end_col'] + 1
-                    )
-                    cell = worksheet.cell(
-                        row=merge['start_row'] + 1,
-                        column=merge['start_col'] + 1
-                    )
-                    cell.alignment = alignment
-                auto_adjust_row_height(worksheet)  # 调用行高调整
-
-        file_stat = file_path.stat()
-        target_path = file_path.resolve()  # 转换为绝对路径
-        max_retries = 10  # 添加最大重试次数
-
-        # 调试输出实际检测路径
-        print(f"正在检测文件路径: {target_path}")
-
-        for _ in range(max_retries):
-            if target_path.exists():
-                print("文件验证成功")
-                break
-            print("文件尚未就绪，等待...")
-            time.sleep(1)
-        else:
-            return jsonify(success=False, error="文件生成超时"), 500
-
-        user_sessions[session['uid']]['record'].add_property_ocr(str(target_path))  # 统一使用绝对路径
+        user_sessions[session['uid']]['record'].add_property_ocr_table(final_data, str(file_path.resolve()))  # 统一使用绝对路径
+        if app.config['OCR_EXPORT_ASYNC']:
+            get_ocr_writer().submit(final_data, file_path)
         return jsonify(
             success=True,
             file_info={
                 "name": filename,
-                "size": f"{file_stat.st_size / 1024:.1f}KB",
-                "time": datetime.fromtimestamp(file_stat.st_mtime).strftime("%Y-%m-%d %H:%M"),
+                # 保存时工作簿尚未生成，没有文件大小，返回工作表数
+                "sheets": len(final_data),
+                "time": now.strftime("%Y-%m-%d %H:%M"),
                 "url": url_for('download_file', filename=filename)
             }
         )
-        # return send_file(
-        #     str(file_path),
-        #     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        #     as_attachment=True,
-        #     download_name=filename
-        # )
     except Exception as e:
-        # 打印异常信息，方便排查问题
-        print(f"保存Excel文件失败: {str(e)}")
+        logger.exception("保存OCR表格失败")
         return jsonify(success=False, error=str(e)), 500
 
 
@@ -401,19 +402,22 @@ def ocr():
     if not data or 'ocr_img' not in data:
         return jsonify({"error": "Invalid request format"}), 400
     img_name = data['ocr_img']
-    print(img_name)
+    logger.debug("OCR识别", extra={"fields": {"image": img_name}})
     try:
-        ocr_save_path = OCR_Table().trans_to_xlsx(img_name)
-        print(ocr_save_path)
-        # ocr_save_path = "static/ocr_tables/20250220123822_cropped_image_OCR.xlsx"#one sheet
-        # ocr_save_path = "static/ocr_tables/20250220113936_cropped_image_20250220113938.xlsx"  # two sheets
-        ocr_data = OCR_Table().trans_to_dict(ocr_save_path)
-        print(ocr_data)
+        img_path = f"{UPLOAD_FOLDER}/{img_name}"
+        ocr_cache = get_ocr_cache()
+        # 重复上传的图片直接返回缓存的表格结构，不再调用云端OCR
+        ocr_data = ocr_cache.get(img_path, scope=session.get('uid'))
+        if ocr_data is None:
+            # 直接从识别结果JSON解析表格，不再下载、落盘、重新读取Excel
+            ocr_data = get_ocr_table().trans_to_table(img_name)
+            ocr_cache.put(img_path, ocr_data, scope=session.get('uid'))
         return jsonify({
             "success": True,
             "data": ocr_data
         })
     except Exception as e:
+        logger.exception("OCR识别失败")
         return jsonify({
             "success": False,
             "error": str(e)
@@ -430,7 +434,7 @@ def clean_records():
         })
 
     except Exception as e:
-        print(f"清理失败: {str(e)}")
+        logger.exception("清理失败")
         return jsonify({
             "success": False,
             "error": f"清理失败: {str(e)}"